@@ -0,0 +1,161 @@
+#include "agregador_bins.h"
+
+#include <omp.h>
+#include <algorithm>
+#include <cmath>
+#include <limits>
+#include <stdexcept>
+#include <unordered_map>
+
+FormaCelda forma_celda_desde_texto(const std::string &texto) {
+    if (texto == "cuadrada") return FormaCelda::CUADRADA;
+    if (texto == "hexagonal") return FormaCelda::HEXAGONAL;
+    throw std::invalid_argument("forma debe ser 'cuadrada' o 'hexagonal', no '" + texto + "'");
+}
+
+namespace {
+
+const double RAIZ_3 = std::sqrt(3.0);
+
+// Acumuladores de una celda.
+struct Acumulado {
+    int64_t cantidad = 0;
+    double magnitud_maxima = -std::numeric_limits<double>::infinity();
+    double suma_profundidad = 0.0;
+    int64_t con_profundidad = 0;
+
+    void sumar(const Acumulado &otro) {
+        cantidad += otro.cantidad;
+        magnitud_maxima = std::max(magnitud_maxima, otro.magnitud_maxima);
+        suma_profundidad += otro.suma_profundidad;
+        con_profundidad += otro.con_profundidad;
+    }
+};
+
+// Las coordenadas enteras de la celda (columna, fila) se empaquetan en una clave de
+// 64 bits. Con el desplazamiento ambas son positivas y el orden de las claves es el
+// orden (fila, columna); 2^30 deja la fila desplazada por debajo de 2^31 y la clave
+// nunca desborda.
+constexpr int64_t DESPLAZAMIENTO = int64_t(1) << 30;
+
+inline int64_t empaquetar(int64_t columna, int64_t fila) {
+    return ((fila + DESPLAZAMIENTO) << 32) | static_cast<uint32_t>(columna + DESPLAZAMIENTO);
+}
+
+inline void desempaquetar(int64_t clave, int64_t &columna, int64_t &fila) {
+    fila = (clave >> 32) - DESPLAZAMIENTO;
+    columna = static_cast<int64_t>(clave & 0xFFFFFFFF) - DESPLAZAMIENTO;
+}
+
+// Celda hexagonal (coordenadas axiales q, r) que contiene el punto relativo (x, y).
+inline void celda_hexagonal(double x, double y, double tamano, int64_t &q, int64_t &r) {
+    const double qf = (RAIZ_3 / 3.0 * x - y / 3.0) / tamano;
+    const double rf = (2.0 / 3.0 * y) / tamano;
+    const double sf = -qf - rf;
+    double qr = std::round(qf), rr = std::round(rf);
+    const double sr = std::round(sf);
+    // Redondeo cúbico: se corrige la coordenada con mayor error para que q + r + s = 0.
+    const double dq = std::fabs(qr - qf), dr = std::fabs(rr - rf), ds = std::fabs(sr - sf);
+    if (dq > dr && dq > ds) {
+        qr = -rr - sr;
+    } else if (dr > ds) {
+        rr = -qr - sr;
+    }
+    q = static_cast<int64_t>(qr);
+    r = static_cast<int64_t>(rr);
+}
+
+}  // namespace
+
+CeldasAgregadas agregar_en_celdas(
+    const double *latitudes,
+    const double *longitudes,
+    const double *magnitudes,
+    const double *profundidades,
+    const uint8_t *mascara,
+    size_t num_eventos,
+    const Envolvente &caja,
+    double tamano,
+    FormaCelda forma,
+    const OpcionesParalelismo &opciones
+) {
+    if (!(tamano > 0.0)) throw std::invalid_argument("tamano debe ser mayor que cero");
+    if (!(caja.max_x >= caja.min_x && caja.max_y >= caja.min_y)) {
+        throw std::invalid_argument("La caja debe tener min <= max en ambos ejes");
+    }
+    // Las coordenadas de celda deben caber en la clave (ver DESPLAZAMIENTO).
+    const double celdas_eje = std::max(caja.max_x - caja.min_x, caja.max_y - caja.min_y) / tamano;
+    if (celdas_eje > static_cast<double>(DESPLAZAMIENTO) / 2) {
+        throw std::invalid_argument("tamano es demasiado pequeño para la caja pedida");
+    }
+
+    const int num_hilos = configurar_openmp(opciones);
+    std::vector<std::unordered_map<int64_t, Acumulado>> parciales(num_hilos);
+
+    #pragma omp parallel num_threads(num_hilos)
+    {
+        std::unordered_map<int64_t, Acumulado> &propio = parciales[omp_get_thread_num()];
+
+        #pragma omp for schedule(runtime)
+        for (long long i = 0; i < static_cast<long long>(num_eventos); ++i) {
+            if (mascara && !mascara[i]) continue;
+            const double x = longitudes[i], y = latitudes[i];
+            // contiene() es falso para NaN
+            if (!caja.contiene(x, y)) continue;
+
+            int64_t columna, fila;
+            if (forma == FormaCelda::CUADRADA) {
+                columna = static_cast<int64_t>(std::floor((x - caja.min_x) / tamano));
+                fila = static_cast<int64_t>(std::floor((y - caja.min_y) / tamano));
+            } else {
+                celda_hexagonal(x - caja.min_x, y - caja.min_y, tamano, columna, fila);
+            }
+
+            Acumulado &celda = propio[empaquetar(columna, fila)];
+            celda.cantidad += 1;
+            if (magnitudes && !std::isnan(magnitudes[i])) {
+                celda.magnitud_maxima = std::max(celda.magnitud_maxima, magnitudes[i]);
+            }
+            if (profundidades && !std::isnan(profundidades[i])) {
+                celda.suma_profundidad += profundidades[i];
+                celda.con_profundidad += 1;
+            }
+        }
+    }
+
+    // Fusión de los mapas de cada hilo (proporcional al número de celdas ocupadas).
+    std::unordered_map<int64_t, Acumulado> &total = parciales[0];
+    for (int h = 1; h < num_hilos; ++h) {
+        for (const auto &par : parciales[h]) total[par.first].sumar(par.second);
+        parciales[h].clear();
+    }
+    std::vector<int64_t> claves;
+    claves.reserve(total.size());
+    for (const auto &par : total) claves.push_back(par.first);
+    std::sort(claves.begin(), claves.end());
+
+    CeldasAgregadas salida;
+    const size_t num_celdas = claves.size();
+    salida.centro_x.resize(num_celdas);
+    salida.centro_y.resize(num_celdas);
+    salida.cantidad.resize(num_celdas);
+    salida.magnitud_maxima.resize(num_celdas);
+    salida.profundidad_media.resize(num_celdas);
+    const double nan = std::numeric_limits<double>::quiet_NaN();
+    for (size_t k = 0; k < num_celdas; ++k) {
+        const Acumulado &celda = total[claves[k]];
+        int64_t columna, fila;
+        desempaquetar(claves[k], columna, fila);
+        if (forma == FormaCelda::CUADRADA) {
+            salida.centro_x[k] = caja.min_x + (columna + 0.5) * tamano;
+            salida.centro_y[k] = caja.min_y + (fila + 0.5) * tamano;
+        } else {
+            salida.centro_x[k] = caja.min_x + tamano * RAIZ_3 * (columna + fila / 2.0);
+            salida.centro_y[k] = caja.min_y + tamano * 1.5 * fila;
+        }
+        salida.cantidad[k] = celda.cantidad;
+        salida.magnitud_maxima[k] = std::isinf(celda.magnitud_maxima) ? nan : celda.magnitud_maxima;
+        salida.profundidad_media[k] = celda.con_profundidad ? celda.suma_profundidad / celda.con_profundidad : nan;
+    }
+    return salida;
+}
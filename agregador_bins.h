@@ -0,0 +1,50 @@
+#ifndef AGREGADOR_BINS_H
+#define AGREGADOR_BINS_H
+
+#include <vector>
+#include <string>
+#include <cstddef>
+#include <cstdint>
+
+#include "indice_envolventes.h"
+#include "procesador_sjoin.h"
+
+// Forma de las celdas. Las hexagonales tienen el vértice hacia arriba.
+enum class FormaCelda { CUADRADA, HEXAGONAL };
+
+// Convierte "cuadrada" / "hexagonal" en FormaCelda (std::invalid_argument si no).
+FormaCelda forma_celda_desde_texto(const std::string &texto);
+
+// Una fila por celda con al menos un evento, ordenadas por (fila, columna) de la celda.
+struct CeldasAgregadas {
+    std::vector<double> centro_x;           // longitud del centro de la celda
+    std::vector<double> centro_y;           // latitud del centro de la celda
+    std::vector<int64_t> cantidad;
+    std::vector<double> magnitud_maxima;    // NaN si ningún evento tiene magnitud
+    std::vector<double> profundidad_media;  // NaN si ningún evento tiene profundidad
+};
+
+/**
+ * Agrupa en celdas de 'tamano' grados los eventos que caen dentro de 'caja'. En las
+ * celdas cuadradas 'tamano' es el lado; en las hexagonales, la distancia del centro a
+ * un vértice. Las celdas se definen en grados (longitud/latitud), igual que el mapa.
+ *
+ * Si 'mascara' no es nulo solo se cuentan los eventos con mascara[i] != 0, de modo que
+ * el llamador filtra sin copiar los arreglos. Cada hilo acumula en su propio mapa de
+ * celdas y al final se fusionan, así que el coste depende de los eventos y la memoria
+ * del número de celdas ocupadas.
+ */
+CeldasAgregadas agregar_en_celdas(
+    const double *latitudes,
+    const double *longitudes,
+    const double *magnitudes,
+    const double *profundidades,
+    const uint8_t *mascara,
+    size_t num_eventos,
+    const Envolvente &caja,
+    double tamano,
+    FormaCelda forma,
+    const OpcionesParalelismo &opciones = OpcionesParalelismo()
+);
+
+#endif
@@ -3,6 +3,7 @@
 # =============================================================================
 import streamlit as st
 import pandas as pd
+import numpy as np
 import geopandas as gpd
 from folium.plugins import MarkerCluster
 from streamlit_option_menu import option_menu
@@ -10,9 +11,13 @@ from PIL import Image
 import plotly.express as px
 import matplotlib.pyplot as plt
 import os
-import time
 import pydeck as pdk
 
+import cache_catalogo
+from cubo_agregacion import CuboAgregacion
+import bordes_simplificados
+from metricas_carga import MetricasCarga, fase
+
 # Importa el motor C++ compilado. Si no existe, la app se detendrá con un error claro.
 try:
     # 1. Este es el primer cambio: importar el módulo directamente.
@@ -32,47 +37,253 @@ st.set_page_config(page_title="Catálogo Sísmico del Perú", page_icon="🌍",
 # =============================================================================
 # 3. FUNCIÓN DE CARGA DE DATOS IMPULSADA POR C++ (CON CACHÉ)
 # =============================================================================
-@st.cache_data
-def cargar_datos_con_motor_cpp():
+RUTA_CSV = "Dataset_1960_2023_sismo.csv"
+RUTA_GEOJSON = "departamentos_perú.geojson"
+# Carpeta donde se guardan los artefactos derivados (geometrías del motor, catálogo, etc.)
+DIRECTORIO_CACHE = "cache_sjoin"
+# Lado de las celdas de la rejilla raster del motor, en grados (~2 km)
+RESOLUCION_REJILLA = 0.02
+# Sismos fuera de los polígonos (p. ej. en el mar, frente a la costa) que se asignan
+# al departamento más cercano si está a esta distancia o menos. 0 = desactivado: solo
+# se conservan los sismos dentro del Perú.
+DISTANCIA_MAXIMA_MAR_KM = 0
+# Columnas del CSV que pasan sin cambios al catálogo enriquecido
+COLUMNAS_CRUDAS = ['ID', 'FECHA_UTC', 'HORA_UTC', 'LATITUD', 'LONGITUD', 'PROFUNDIDAD', 'MAGNITUD']
+# Tipos compactos con los que se guardan las columnas numéricas del catálogo. float32
+# sobra para coordenadas (~0.1 m), magnitudes con un decimal y profundidades en km, y
+# reduce a la mitad la memoria de cada columna (y las páginas compartidas del mmap).
+TIPOS_COMPACTOS = {
+    'LATITUD': np.float32,
+    'LONGITUD': np.float32,
+    'PROFUNDIDAD': np.float32,
+    'MAGNITUD': np.float32,
+    'AÑO': np.int16,
+    'DISTANCIA_KM': np.float32,
+}
+# El panel de administración (tiempos de carga y estadísticas del motor) se muestra
+# abriendo la app con ?admin=1
+PARAMETRO_ADMIN = "admin"
+NOMBRES_MESES = ["Enero", "Febrero", "Marzo", "Abril", "Mayo", "Junio", "Julio", "Agosto", "Septiembre", "Octubre", "Noviembre", "Diciembre"]
+
+
+@st.cache_resource
+def obtener_departamentos(ruta_geojson=RUTA_GEOJSON):
+    """Polígonos de los departamentos, leídos una sola vez por proceso del servidor."""
+    return gpd.read_file(ruta_geojson)
+
+
+@st.cache_resource
+def obtener_motor_sjoin(ruta_geojson=RUTA_GEOJSON):
     """
-    Función de carga principal que delega el trabajo pesado (sjoin) al motor C++.
-    Se ejecuta una sola vez gracias a la caché.
+    Crea el motor C++ con los polígonos ya preparados e indexados.
+    Se comparte entre todas las sesiones del servidor: los joins posteriores
+    (eventos nuevos, subconjuntos filtrados, puntos de prueba) no vuelven a
+    preparar los polígonos.
     """
-    inicio_total = time.time()
-    
-    # 1. Cargar los datos crudos desde los archivos
-    sismos_df = pd.read_csv("Dataset_1960_2023_sismo.csv")
-    departamentos_gdf = gpd.read_file("departamentos_perú.geojson")
-    sismos_df.dropna(subset=['LATITUD', 'LONGITUD'], inplace=True)
-    
-    # 2. Preparar los datos en un formato simple para C++
-    coords_sismos = list(zip(sismos_df['LATITUD'], sismos_df['LONGITUD']))
-    wkts_departamentos = departamentos_gdf["geometry"].to_wkt().tolist()
-    nombres_departamentos = departamentos_gdf["NOMBDEP"].tolist()
+    # El conjunto de geometrías (WKB, nombres y rejilla raster) se guarda una vez por
+    # versión del geojson; en los siguientes arranques el motor se reconstruye desde
+    # ese archivo sin leer el geojson ni volver a rasterizar.
+    os.makedirs(DIRECTORIO_CACHE, exist_ok=True)
+    clave = cache_catalogo.clave_cache([ruta_geojson], motor_sjoin_cpp.__version__)
+    ruta_motor = os.path.join(DIRECTORIO_CACHE, f"motor_{clave}_{RESOLUCION_REJILLA}.bin")
+    motor = motor_sjoin_cpp.MotorSjoin.cargar(ruta_motor)
+    if motor is not None and motor.tiene_rejilla:
+        return motor
+
+    # Los polígonos pasan a C++ en WKB: ni se formatean ni se parsean como texto WKT.
+    departamentos_gdf = obtener_departamentos(ruta_geojson)
+    motor = motor_sjoin_cpp.MotorSjoin.desde_wkb(
+        departamentos_gdf["geometry"].to_wkb().tolist(),
+        departamentos_gdf["NOMBDEP"].tolist()
+    )
+    motor.construir_rejilla(RESOLUCION_REJILLA)
+    motor.guardar(ruta_motor)
+    return motor
+
+
+def construir_catalogo_enriquecido(sismos_df, motor, distancia_maxima_km=DISTANCIA_MAXIMA_MAR_KM, metricas=None):
+    """
+    Asigna un departamento a cada sismo con el motor C++ y calcula las columnas
+    derivadas. Devuelve un dict columna -> np.ndarray solo con los sismos que caen
+    dentro del Perú, listo para guardarse en la caché columnar. Con
+    'distancia_maxima_km' > 0 también se conservan los sismos a esa distancia o menos
+    de algún departamento, y se añade la columna DISTANCIA_KM (0 para los de dentro).
+    'metricas' (MetricasCarga) recibe los tiempos de cada paso y las estadísticas del join.
+    """
+    # 1. Descartar filas sin coordenadas
+    # 2. Preparar los datos para C++: arreglos float64 contiguos que el motor lee sin copiar
+    with fase(metricas, "conversion_coordenadas"):
+        sismos_df = sismos_df.dropna(subset=['LATITUD', 'LONGITUD'])
+        latitudes = np.ascontiguousarray(sismos_df['LATITUD'].to_numpy(dtype=np.float64))
+        longitudes = np.ascontiguousarray(sismos_df['LONGITUD'].to_numpy(dtype=np.float64))
 
     # 3. ¡Llamar al motor de C++ para hacer el trabajo pesado!
-    resultados_cpp = motor_sjoin_cpp.realizar_sjoin_paralelo_cpp(
-        coords_sismos, wkts_departamentos, nombres_departamentos
+    # Devuelve el índice del departamento de cada sismo (-1 = fuera de Perú).
+    with fase(metricas, "sjoin"):
+        if distancia_maxima_km > 0:
+            codigos_cpp, distancias_km, estadisticas = motor.unir_cercano(
+                latitudes, longitudes, distancia_maxima_km, estadisticas=True)
+        else:
+            codigos_cpp, estadisticas = motor.unir(latitudes, longitudes, estadisticas=True)
+            distancias_km = None
+    if metricas is not None:
+        metricas.registrar_union(estadisticas)
+        metricas.construccion_motor = motor.tiempos_construccion
+
+    # Los sismos sin fecha válida también se descartan: el año se guarda como entero
+    # y ningún filtro por año los incluiría.
+    with fase(metricas, "fechas"):
+        fechas = pd.to_datetime(sismos_df['FECHA_UTC'], format='%Y%m%d', errors='coerce')
+    dentro = (codigos_cpp != motor_sjoin_cpp.CODIGO_FUERA_DE_PERU) & fechas.notna().to_numpy()
+    sismos_df, fechas = sismos_df[dentro], fechas[dentro]
+
+    # 4. Columnas derivadas de la fecha (se guardan ya calculadas en la caché)
+    with fase(metricas, "columnas_derivadas"):
+        columnas = {nombre: sismos_df[nombre].to_numpy() for nombre in COLUMNAS_CRUDAS}
+        columnas['FECHA_UTC'] = fechas.to_numpy()
+        columnas['DEPARTAMENTO'] = codigos_cpp[dentro]
+        columnas['AÑO'] = fechas.dt.year.to_numpy()
+        columnas['MES'] = fechas.dt.month.to_numpy(dtype=np.int8)
+        if distancias_km is not None:
+            columnas['DISTANCIA_KM'] = distancias_km[dentro]
+        for nombre, tipo in TIPOS_COMPACTOS.items():
+            if nombre in columnas:
+                columnas[nombre] = columnas[nombre].astype(tipo)
+    return columnas
+
+
+def geometria_de_sismos(sismos_df, crs="EPSG:4326"):
+    """
+    Construye, solo cuando una operación espacial la necesita, la geometría de puntos
+    de los sismos (el catálogo cargado no guarda un punto de shapely por fila).
+    Devuelve un GeoDataFrame con las mismas filas e índice que 'sismos_df'.
+    """
+    puntos = gpd.points_from_xy(
+        sismos_df['LONGITUD'].to_numpy(dtype=np.float64),
+        sismos_df['LATITUD'].to_numpy(dtype=np.float64),
+        crs=crs,
     )
-    
-    # 4. Integrar los resultados y preparar el DataFrame final para la app
-    sismos_df['DEPARTAMENTO'] = resultados_cpp
-    sismos_df = sismos_df[sismos_df['DEPARTAMENTO'] != "Fuera de Perú"]
-    
-    sismos_df['FECHA_UTC'] = pd.to_datetime(sismos_df['FECHA_UTC'], format='%Y%m%d', errors='coerce')
-    sismos_df['AÑO'] = sismos_df['FECHA_UTC'].dt.year
-    month_names_map = {1:"Enero", 2:"Febrero", 3:"Marzo", 4:"Abril", 5:"Mayo", 6:"Junio", 7:"Julio", 8:"Agosto", 9:"Septiembre", 10:"Octubre", 11:"Noviembre", 12:"Diciembre"}
-    sismos_df['MES_NOMBRE'] = sismos_df['FECHA_UTC'].dt.month.map(month_names_map)
-
-    # Convertimos el resultado final a un GeoDataFrame para el mapa
-    gdf_final = gpd.GeoDataFrame(
-        sismos_df, geometry=gpd.points_from_xy(sismos_df['LONGITUD'], sismos_df['LATITUD'])
+    return gpd.GeoDataFrame(sismos_df, geometry=puntos, crs=crs)
+
+
+def tiempo_en_dias(fechas, horas_hhmmss):
+    """Días desde 1970 (con fracción) a partir de FECHA_UTC y de HORA_UTC en formato HHMMSS."""
+    dias = (fechas - np.datetime64("1970-01-01")) / np.timedelta64(1, "D")
+    horas = np.asarray(horas_hhmmss, dtype=np.int64)
+    segundos = (horas // 10000) * 3600 + (horas // 100 % 100) * 60 + horas % 100
+    return dias + segundos / 86400.0
+
+
+def etiquetar_replicas(sismos_df):
+    """
+    Declustering de Gardner y Knopoff con el índice espacio-temporal del motor C++.
+    Devuelve (principal, es_replica): el índice de fila del sismo principal de la
+    secuencia de cada evento y si el evento es una réplica.
+    """
+    indice = motor_sjoin_cpp.IndiceEspacioTemporal(
+        sismos_df['LATITUD'].to_numpy(),
+        sismos_df['LONGITUD'].to_numpy(),
+        tiempo_en_dias(sismos_df['FECHA_UTC'].to_numpy(), sismos_df['HORA_UTC'].to_numpy()),
     )
-    
-    fin_total = time.time()
-    tiempo_total = fin_total - inicio_total
-    
-    return gdf_final, departamentos_gdf, tiempo_total
+    principal = indice.decluster_gardner_knopoff(sismos_df['MAGNITUD'].to_numpy())
+    return principal, principal != np.arange(len(principal))
+
+
+def firma_archivo(ruta):
+    """Tamaño y fecha de modificación: cambia cada vez que el archivo se modifica."""
+    info = os.stat(ruta)
+    return info.st_size, info.st_mtime_ns
+
+
+@st.cache_resource(max_entries=2)
+def cargar_datos_con_motor_cpp(ruta_csv=RUTA_CSV, ruta_geojson=RUTA_GEOJSON, firma_csv=None):
+    """
+    Función de carga principal que delega el trabajo pesado (sjoin) al motor C++.
+    El catálogo enriquecido se guarda en disco como columnas .npy, en una carpeta cuya
+    clave depende del geojson y de la versión del motor. Cuando el CSV solo recibe
+    filas nuevas, únicamente esas pasan por el join y se añaden como un segmento más.
+    'firma_csv' solo sirve para que la caché de Streamlit se invalide al cambiar el CSV.
+
+    El resultado es un recurso compartido por todas las sesiones (no se copia por
+    sesión como haría st.cache_data): un DataFrame de solo lectura cuyas columnas
+    numéricas son los propios archivos .npy mapeados en memoria, así que varios
+    procesos del servidor comparten además las mismas páginas del sistema operativo.
+    Las páginas no deben modificarlo: filtran con máscaras y trabajan sobre el resultado.
+
+    Devuelve (sismos_df, departamentos_gdf, metricas): 'metricas' (MetricasCarga) tiene
+    el tiempo de cada fase de la carga y las estadísticas del motor C++.
+    """
+    metricas = MetricasCarga()
+
+    with metricas.fase("departamentos"):
+        departamentos_gdf = obtener_departamentos(ruta_geojson)
+
+    # El modo de cercanía cambia qué sismos hay en el catálogo: forma parte de la clave.
+    version = motor_sjoin_cpp.__version__
+    if DISTANCIA_MAXIMA_MAR_KM > 0:
+        version += f"+cercano{DISTANCIA_MAXIMA_MAR_KM}"
+    with metricas.fase("clave_cache"):
+        clave = cache_catalogo.clave_cache([ruta_geojson], version)
+    directorio = cache_catalogo.ruta_catalogo(DIRECTORIO_CACHE, clave)
+
+    # El motor solo se crea si hay filas nuevas que unir
+    def enriquecer(filas_nuevas):
+        with metricas.fase("motor"):
+            motor = obtener_motor_sjoin(ruta_geojson)
+        return construir_catalogo_enriquecido(filas_nuevas, motor, metricas=metricas)
+
+    columnas, estado, _ = cache_catalogo.actualizar_catalogo(
+        directorio,
+        ruta_csv,
+        enriquecer,
+        {"departamentos": departamentos_gdf["NOMBDEP"].tolist()},
+        metricas,
+    )
+    cache_catalogo.limpiar_catalogos_antiguos(DIRECTORIO_CACHE, clave)
+
+    # Las columnas numéricas se usan tal cual (mapeadas en memoria); departamento y
+    # mes se reconstruyen como categóricas a partir de sus códigos enteros.
+    # No se crea un punto de shapely por fila: los mapas solo usan LATITUD/LONGITUD.
+    with metricas.fase("dataframe"):
+        sismos_df = pd.DataFrame({nombre: columnas[nombre] for nombre in COLUMNAS_CRUDAS}, copy=False)
+        sismos_df['DEPARTAMENTO'] = pd.Categorical.from_codes(columnas['DEPARTAMENTO'], categories=estado["departamentos"])
+        sismos_df['AÑO'] = columnas['AÑO']
+        sismos_df['MES_NOMBRE'] = pd.Categorical.from_codes(columnas['MES'].astype(np.int8) - 1, categories=NOMBRES_MESES)
+        if 'DISTANCIA_KM' in columnas:
+            sismos_df['DISTANCIA_KM'] = columnas['DISTANCIA_KM']
+    # Réplicas: se recalculan sobre el catálogo completo en cada carga (un evento nuevo
+    # puede ser réplica de uno antiguo), lo que toma milisegundos con el índice nativo.
+    with metricas.fase("replicas"):
+        sismos_df['SECUENCIA'], sismos_df['ES_REPLICA'] = etiquetar_replicas(sismos_df)
+
+    metricas.contar("sismos_catalogo", len(sismos_df))
+    metricas.terminar()
+    # Para el monitoreo: metricas_carga.json y metricas_carga.prom (recolector de
+    # archivos de texto de node_exporter) en la carpeta de la caché.
+    try:
+        metricas.exportar(DIRECTORIO_CACHE)
+    except OSError:
+        pass
+
+    return sismos_df, departamentos_gdf, metricas
+
+@st.cache_resource(max_entries=2)
+def obtener_bordes_simplificados(ruta_geojson=RUTA_GEOJSON, firma_geojson=None):
+    """
+    GeoJSON de los bordes departamentales simplificado para cada zoom del mapa. Se
+    calcula una vez por versión del geojson ('firma_geojson' invalida la caché).
+    """
+    return bordes_simplificados.construir_niveles(obtener_departamentos(ruta_geojson))
+
+
+@st.cache_resource(max_entries=2)
+def obtener_cubo_agregacion(ruta_csv=RUTA_CSV, ruta_geojson=RUTA_GEOJSON, firma_csv=None):
+    """
+    Cubo de agregados del mapa (año × magnitud × profundidad × departamento), construido
+    una vez por versión del catálogo y compartido por todas las sesiones.
+    """
+    sismos_df, _, _ = cargar_datos_con_motor_cpp(ruta_csv, ruta_geojson, firma_csv)
+    return CuboAgregacion.desde_catalogo(sismos_df)
 
 # =============================================================================
 # 4. DEFINICIÓN DE LAS PÁGINAS DE LA APLICACIÓN
@@ -197,88 +408,171 @@ def pagina_inicio():
 
     st.info("🙌La naturaleza puede ser poderosa, pero la valentía y la solidaridad de las personas son indestructibles.🥰")
 
-def pagina_mapa(gdf, departamentos_gdf):
+# --- Degradado verde oscuro → amarillo fuerte → rojo oscuro
+def color_degradado(cantidad, min_sismos, max_sismos):
+    ratio = (cantidad - min_sismos) / (max_sismos - min_sismos + 1e-9)
+    if ratio <= 0.5:
+        # Verde oscuro (0,128,0) → Amarillo fuerte (255,215,0)
+        r = int(ratio * 2 * (255 - 0))
+        g = int(128 + ratio * 2 * (215 - 128))
+        b = 0
+    else:
+        # Amarillo fuerte (255,215,0) → Rojo oscuro (200,0,0)
+        r = int(255 - (ratio - 0.5) * 2 * (255 - 200))
+        g = int(215 - (ratio - 0.5) * 2 * 215)
+        b = 0
+    return [r, g, b, 220]
+
+
+# Lado aproximado de una celda del modo densidad, en píxeles de pantalla
+PIXELES_POR_CELDA = 24
+METROS_POR_GRADO = 111_320
+
+
+def celdas_de_densidad(sismos_df, r_anos, r_mag, r_prof, filtro_deptos, zoom, forma, solo_principales=False):
+    """
+    Agrupa en celdas (motor C++) los sismos que cumplen los filtros. El tamaño de la
+    celda depende del zoom, así que lo que se envía al navegador crece con el número
+    de celdas visibles y no con el de sismos.
+    """
+    mask = (sismos_df["AÑO"].between(*r_anos)) & \
+           (sismos_df["MAGNITUD"].between(*r_mag)) & \
+           (sismos_df["PROFUNDIDAD"].between(*r_prof))
+    if "Todos" not in filtro_deptos:
+        mask &= sismos_df["DEPARTAMENTO"].isin(filtro_deptos)
+    if solo_principales:
+        mask &= ~sismos_df["ES_REPLICA"]
+
+    tamano = bordes_simplificados.grados_por_pixel(zoom) * PIXELES_POR_CELDA
+    celdas = motor_sjoin_cpp.agregar_en_celdas_cpp(
+        sismos_df["LATITUD"].to_numpy(),
+        sismos_df["LONGITUD"].to_numpy(),
+        sismos_df["MAGNITUD"].to_numpy(),
+        sismos_df["PROFUNDIDAD"].to_numpy(),
+        tuple(obtener_departamentos(RUTA_GEOJSON).total_bounds),
+        tamano,
+        forma,
+        mask.to_numpy(),
+    )
+    return pd.DataFrame({
+        "LONGITUD": celdas["centro_longitud"],
+        "LATITUD": celdas["centro_latitud"],
+        "CANTIDAD_SISMOS": celdas["cantidad"],
+        # Las magnitudes son float32: se redondean para que 4.7 no aparezca como 4.6999998
+        "MAGNITUD_MAXIMA": np.round(celdas["magnitud_maxima"], 2),
+        "PROFUNDIDAD_MEDIA": celdas["profundidad_media"],
+    }), tamano
+
+
+def pagina_mapa(sismos_df, cubo, bordes_por_zoom):
     st.title("🗺️ Mapa Interactivo de Sismos - Degradado Oscuro y Círculos Grandes")
 
     # --- Filtros ---
+    # Los límites de los sliders salen del cubo: no hay que recorrer los eventos.
+    anio_min, anio_max = cubo.limites(0)
+    mag_min, mag_max = cubo.limites(1)
+    prof_min, prof_max = cubo.limites(2)
     with st.sidebar:
         st.header("Filtros del Mapa")
-        deptos = ["Todos"] + sorted(gdf["DEPARTAMENTO"].unique())
+        modo = st.radio("Modo del mapa", ["Por departamento", "Densidad de puntos"])
+        deptos = ["Todos"] + sorted(cubo.departamentos_presentes())
         filtro_deptos = st.multiselect("Departamento", deptos, default=["Todos"])
 
-        años = sorted(gdf["AÑO"].dropna().unique())
-        r_anos = st.slider("Rango de Años", int(min(años)), int(max(años)), (int(min(años)), int(max(años))))
+        r_anos = st.slider("Rango de Años", int(anio_min), int(anio_max), (int(anio_min), int(anio_max)))
 
-        r_mag = st.slider("Magnitud", float(gdf["MAGNITUD"].min()), float(gdf["MAGNITUD"].max()), 
-                          (float(gdf["MAGNITUD"].min()), float(gdf["MAGNITUD"].max())))
+        r_mag = st.slider("Magnitud", mag_min, mag_max, (mag_min, mag_max))
 
-        r_prof = st.slider("Profundidad (km)", float(gdf["PROFUNDIDAD"].min()), float(gdf["PROFUNDIDAD"].max()), 
-                          (float(gdf["PROFUNDIDAD"].min()), float(gdf["PROFUNDIDAD"].max())))
+        r_prof = st.slider("Profundidad (km)", prof_min, prof_max, (prof_min, prof_max))
 
-    # --- Filtros aplicados ---
-    mask = (gdf["AÑO"].between(*r_anos)) & \
-           (gdf["MAGNITUD"].between(*r_mag)) & \
-           (gdf["PROFUNDIDAD"].between(*r_prof))
-    if "Todos" not in filtro_deptos:
-        mask &= gdf["DEPARTAMENTO"].isin(filtro_deptos)
-    filtered_gdf = gdf[mask]
-    st.info(f"🔍 Mostrando {len(filtered_gdf)} de {len(gdf)} sismos")
-
-    # --- Agrupación por departamento ---
-    grouped = filtered_gdf.groupby("DEPARTAMENTO").agg({
-        "LATITUD": "mean",
-        "LONGITUD": "mean",
-        "MAGNITUD": "mean",
-        "FECHA_UTC": "count"
-    }).reset_index().rename(columns={"FECHA_UTC": "CANTIDAD_SISMOS"})
-
-    max_sismos = grouped["CANTIDAD_SISMOS"].max()
-    min_sismos = grouped["CANTIDAD_SISMOS"].min()
-
-    # --- Degradado verde oscuro → amarillo fuerte → rojo oscuro
-    def color_degradado(cantidad):
-        ratio = (cantidad - min_sismos) / (max_sismos - min_sismos + 1e-9)
-        if ratio <= 0.5:
-            # Verde oscuro (0,128,0) → Amarillo fuerte (255,215,0)
-            r = int(ratio * 2 * (255 - 0))
-            g = int(128 + ratio * 2 * (215 - 128))
-            b = 0
-        else:
-            # Amarillo fuerte (255,215,0) → Rojo oscuro (200,0,0)
-            r = int(255 - (ratio - 0.5) * 2 * (255 - 200))
-            g = int(215 - (ratio - 0.5) * 2 * 215)
-            b = 0
-        return [r, g, b, 220]
-
-    grouped["color"] = grouped["CANTIDAD_SISMOS"].apply(color_degradado)
-    grouped["radius"] = grouped["CANTIDAD_SISMOS"] / max_sismos * 100000  # aún más grandes
-
-    # --- Círculos (Scatterplot) ---
-    circle_layer = pdk.Layer(
-        "ScatterplotLayer",
-        data=grouped,
-        get_position='[LONGITUD, LATITUD]',
-        get_radius="radius",
-        get_fill_color="color",
-        pickable=True,
-        auto_highlight=True
-    )
+        # pydeck no informa a Python del zoom del usuario: este control fija el zoom
+        # inicial y, con él, el nivel de detalle de los bordes que se envían.
+        zoom = st.select_slider("Zoom del mapa", options=list(bordes_simplificados.NIVELES_ZOOM), value=5)
 
-    # --- Texto con número de sismos ---
-    text_layer = pdk.Layer(
-        "TextLayer",
-        data=grouped,
-        get_position='[LONGITUD, LATITUD]',
-        get_text="CANTIDAD_SISMOS",
-        get_size=18,
-        get_color=[255, 255, 255],
-        get_alignment_baseline="'center'",
-    )
+        if modo == "Densidad de puntos":
+            forma = st.radio("Forma de las celdas", ["hexagonal", "cuadrada"], horizontal=True)
+            # Etiquetas de Gardner-Knopoff calculadas al cargar el catálogo
+            solo_principales = st.checkbox("Solo sismos principales (sin réplicas)")
+
+    if modo == "Por departamento":
+        # --- Agrupación por departamento ---
+        # Sale de las sumas prefijas del cubo; solo los bordes que cortan un bin a la
+        # mitad recorren los eventos de ese bin.
+        grouped = cubo.agregar_por_departamento(
+            r_anos, r_mag, r_prof,
+            None if "Todos" in filtro_deptos else filtro_deptos
+        )
+        st.info(f"🔍 Mostrando {int(grouped['CANTIDAD_SISMOS'].sum())} de {len(cubo.codigos)} sismos")
+
+        max_sismos = grouped["CANTIDAD_SISMOS"].max()
+        min_sismos = grouped["CANTIDAD_SISMOS"].min()
+        grouped["color"] = grouped["CANTIDAD_SISMOS"].apply(color_degradado, args=(min_sismos, max_sismos))
+        grouped["radius"] = grouped["CANTIDAD_SISMOS"] / max_sismos * 100000  # aún más grandes
+
+        # --- Círculos (Scatterplot) ---
+        circle_layer = pdk.Layer(
+            "ScatterplotLayer",
+            data=grouped,
+            get_position='[LONGITUD, LATITUD]',
+            get_radius="radius",
+            get_fill_color="color",
+            pickable=True,
+            auto_highlight=True
+        )
+
+        # --- Texto con número de sismos ---
+        text_layer = pdk.Layer(
+            "TextLayer",
+            data=grouped,
+            get_position='[LONGITUD, LATITUD]',
+            get_text="CANTIDAD_SISMOS",
+            get_size=18,
+            get_color=[255, 255, 255],
+            get_alignment_baseline="'center'",
+        )
+        capas_datos = [circle_layer, text_layer]
+
+        # --- Tooltip al pasar el mouse ---
+        tooltip = {
+            "html": "<b>Departamento:</b> {DEPARTAMENTO} <br>"
+                    "<b>Sismos:</b> {CANTIDAD_SISMOS} <br>"
+                    "<b>Magnitud Promedio:</b> {MAGNITUD:.2f}",
+            "style": {"color": "white", "backgroundColor": "steelblue"}
+        }
+    else:
+        # --- Celdas de densidad (una columna plana por celda) ---
+        celdas, tamano = celdas_de_densidad(
+            sismos_df, r_anos, r_mag, r_prof, filtro_deptos, zoom, forma, solo_principales
+        )
+        st.info(f"🔍 Mostrando {int(celdas['CANTIDAD_SISMOS'].sum())} sismos en {len(celdas)} celdas")
+        if len(celdas):
+            celdas["color"] = celdas["CANTIDAD_SISMOS"].apply(
+                color_degradado, args=(celdas["CANTIDAD_SISMOS"].min(), celdas["CANTIDAD_SISMOS"].max())
+            )
+        hexagonal = forma == "hexagonal"
+        capas_datos = [pdk.Layer(
+            "ColumnLayer",
+            data=celdas,
+            get_position='[LONGITUD, LATITUD]',
+            get_fill_color="color",
+            # Hexágono con el vértice arriba o cuadrado girado 45° (radio = centro a vértice)
+            disk_resolution=6 if hexagonal else 4,
+            angle=0 if hexagonal else 45,
+            radius=tamano * METROS_POR_GRADO * (1.0 if hexagonal else np.sqrt(2) / 2),
+            extruded=False,
+            pickable=True,
+            auto_highlight=True
+        )]
+        tooltip = {
+            "html": "<b>Sismos:</b> {CANTIDAD_SISMOS} <br>"
+                    "<b>Magnitud Máxima:</b> {MAGNITUD_MAXIMA} <br>"
+                    "<b>Profundidad Media:</b> {PROFUNDIDAD_MEDIA} km",
+            "style": {"color": "white", "backgroundColor": "steelblue"}
+        }
 
     # --- Bordes departamentales ---
     deptos_layer = pdk.Layer(
         "GeoJsonLayer",
-        data=departamentos_gdf.__geo_interface__,
+        data=bordes_simplificados.nivel_para_zoom(bordes_por_zoom, zoom),
         stroked=True,
         filled=False,
         get_line_color=[0, 100, 255],
@@ -289,21 +583,13 @@ def pagina_mapa(gdf, departamentos_gdf):
     view_state = pdk.ViewState(
         latitude=-9.2,
         longitude=-75,
-        zoom=5,
+        zoom=zoom,
         pitch=0
     )
 
-    # --- Tooltip al pasar el mouse ---
-    tooltip = {
-        "html": "<b>Departamento:</b> {DEPARTAMENTO} <br>"
-                "<b>Sismos:</b> {CANTIDAD_SISMOS} <br>"
-                "<b>Magnitud Promedio:</b> {MAGNITUD:.2f}",
-        "style": {"color": "white", "backgroundColor": "steelblue"}
-    }
-
     # --- Renderizar mapa final ---
     st.pydeck_chart(pdk.Deck(
-        layers=[deptos_layer, circle_layer, text_layer],
+        layers=[deptos_layer] + capas_datos,
         initial_view_state=view_state,
         tooltip=tooltip,
         map_style="mapbox://styles/mapbox/light-v10"
@@ -317,21 +603,26 @@ def pagina_graficos(df):
         st.header("Opciones de Gráficos")
         selected_graph = st.radio(
             "Analizar por:",
-            ["Año", "Magnitud", "Profundidad"]
-        )
-        tipo_grafico = st.selectbox(
-            "Tipo de Gráfico:",
-            ["Barras", "Sector Circular", "Líneas"]
+            ["Año", "Magnitud", "Profundidad", "Gutenberg-Richter"]
         )
+        if selected_graph != "Gutenberg-Richter":
+            tipo_grafico = st.selectbox(
+                "Tipo de Gráfico:",
+                ["Barras", "Sector Circular", "Líneas"]
+            )
     
     st.markdown("---")
 
+    # Los conteos y figuras se guardan por versión del catálogo (firma del CSV)
+    firma_csv = firma_archivo(RUTA_CSV)
     if selected_graph == "Año":
-        visualizacion_anos(df, tipo_grafico)
+        visualizacion_anos(firma_csv, tipo_grafico)
     elif selected_graph == "Magnitud":
-        visualizacion_magnitud(df, tipo_grafico)
+        visualizacion_magnitud(firma_csv, tipo_grafico)
     elif selected_graph == "Profundidad":
-        visualizacion_profundidad(df, tipo_grafico)
+        visualizacion_profundidad(firma_csv, tipo_grafico)
+    elif selected_graph == "Gutenberg-Richter":
+        visualizacion_gutenberg_richter(df)
 
 
 def pagina_conclusion():
@@ -399,64 +690,202 @@ def pagina_sobre_nosotros():
                 except FileNotFoundError:
                     st.error(f"Error: No se encontró la imagen '{personas[i+1]['imagen']}'")
 
+def panel_administracion(metricas):
+    """Tiempos de cada fase de la carga y estadísticas del motor C++, con exportación."""
+    with st.sidebar.expander("⚙️ Métricas de carga", expanded=True):
+        st.caption(f"Carga total: {metricas.tiempo_total:.3f} s")
+        fases = pd.DataFrame({"Fase": list(metricas.fases), "Segundos": list(metricas.fases.values())})
+        fases["%"] = (100 * fases["Segundos"] / max(metricas.tiempo_total, 1e-9)).round(1)
+        st.dataframe(fases, hide_index=True, use_container_width=True)
+
+        if metricas.construccion_motor:
+            st.markdown("**Construcción del motor C++**")
+            st.dataframe(pd.DataFrame({"Fase": list(metricas.construccion_motor),
+                                       "Segundos": list(metricas.construccion_motor.values())}),
+                         hide_index=True, use_container_width=True)
+
+        if metricas.uniones:
+            # El catálogo puede venir completo de la caché en disco: entonces no hubo join
+            union = metricas.uniones[-1]
+            st.markdown("**Último spatial join**")
+            st.dataframe(pd.DataFrame({
+                "Contador": ["Puntos", "Resueltos por la rejilla", "Prueba exacta (GEOS)",
+                             "Llamadas a contains", "Asignados por cercanía", "Fuera de todos los polígonos"],
+                "Valor": [union["puntos"], union["resueltos_por_rejilla"], union["puntos_probados"],
+                          union["pruebas_contencion"], union["asignados_por_cercania"], union["fuera_de_peru"]],
+            }), hide_index=True, use_container_width=True)
+            st.caption(f"Join: {union['segundos'] * 1000:.1f} ms con {len(union['puntos_por_hilo'])} hilo(s)")
+            st.bar_chart(pd.DataFrame({"Puntos por hilo": union["puntos_por_hilo"]}), height=150)
+        else:
+            st.caption("El catálogo se abrió desde la caché en disco: no hubo spatial join.")
+
+        st.download_button("Descargar JSON", metricas.a_json(indent=2), "metricas_carga.json", "application/json")
+        st.download_button("Descargar Prometheus", metricas.a_prometheus(), "metricas_carga.prom", "text/plain")
+
 # --- Funciones de visualización para la página de gráficos ---
-def visualizacion_anos(df, tipo_grafico):
-    st.subheader(f"Análisis de Sismos por Año - Gráfico de {tipo_grafico}")
-    conteo = df['AÑO'].value_counts().sort_index()
-    if tipo_grafico == "Barras":
-        fig = px.bar(conteo, x=conteo.index, y=conteo.values, labels={"x": "Año", "y": "Cantidad de Sismos"}, title="Cantidad de Sismos por Año")
-    elif tipo_grafico == "Sector Circular":
-        fig = px.pie(values=conteo.values, names=conteo.index, title="Distribución Porcentual de Sismos por Año")
+
+# Categorías de profundidad (límite inferior inclusivo, como pd.cut(right=False))
+BORDES_PROFUNDIDAD = [0, 70, 300, 1000]
+ETIQUETAS_PROFUNDIDAD = ['Superficial (0-70 km)', 'Intermedia (70-300 km)', 'Profunda (>300 km)']
+
+# Textos de cada análisis: etiqueta del eje x y título por tipo de gráfico
+TEXTOS_GRAFICOS = {
+    "Año": ("Año", {
+        "Barras": "Cantidad de Sismos por Año",
+        "Sector Circular": "Distribución Porcentual de Sismos por Año",
+        "Líneas": "Tendencia de Sismos a lo Largo de los Años",
+    }),
+    "Magnitud": ("Magnitud (redondeada)", {
+        "Barras": "Distribución de Sismos por Magnitud",
+        "Sector Circular": "Distribución Porcentual de Sismos por Magnitud",
+        "Líneas": "Frecuencia de Sismos por Nivel de Magnitud",
+    }),
+    "Profundidad": ("Categoría de Profundidad", {
+        "Barras": "Distribución de Sismos por Categoría de Profundidad",
+        "Sector Circular": "Distribución Porcentual de Sismos por Profundidad",
+        "Líneas": "Frecuencia de Sismos por Profundidad",
+    }),
+}
+
+
+@st.cache_resource(max_entries=8)
+def conteo_por_bin(firma_csv, analisis):
+    """
+    Cantidad de sismos por año, por magnitud redondeada o por categoría de profundidad.
+    Se cuenta con np.bincount sobre un código entero de bin calculado directamente de
+    las columnas mapeadas: no se copia el DataFrame ni se le añaden columnas. Se guarda
+    por versión del catálogo ('firma_csv'); la caché es LRU y de tamaño acotado.
+    """
+    sismos_df, _, _ = cargar_datos_con_motor_cpp(RUTA_CSV, RUTA_GEOJSON, firma_csv)
+    if analisis == "Profundidad":
+        codigos = np.searchsorted(BORDES_PROFUNDIDAD, sismos_df['PROFUNDIDAD'].to_numpy(), side="right") - 1
+        validos = (codigos >= 0) & (codigos < len(ETIQUETAS_PROFUNDIDAD))
+        conteo = np.bincount(codigos[validos], minlength=len(ETIQUETAS_PROFUNDIDAD))
+        return pd.Series(conteo, index=ETIQUETAS_PROFUNDIDAD)
+
+    if analisis == "Año":
+        valores = sismos_df['AÑO'].to_numpy()
     else:
-        fig = px.line(conteo, x=conteo.index, y=conteo.values, markers=True, labels={"x": "Año", "y": "Cantidad de Sismos"}, title="Tendencia de Sismos a lo Largo de los Años")
-    st.plotly_chart(fig, use_container_width=True)
+        valores = np.round(sismos_df['MAGNITUD'].to_numpy())
+        valores = valores[np.isfinite(valores)]
+    if not len(valores):
+        return pd.Series(dtype=np.int64)
+    origen = valores.min()
+    conteo = np.bincount((valores - origen).astype(np.int64))
+    # Como value_counts(): solo los bins con algún sismo, ordenados
+    presentes = np.flatnonzero(conteo)
+    return pd.Series(conteo[presentes], index=(origen + presentes).astype(valores.dtype))
+
+
+@st.cache_resource(max_entries=24)
+def figura_por_bin(firma_csv, analisis, tipo_grafico):
+    """
+    Figura de plotly de un análisis y tipo de gráfico. Cambiar entre "Barras", "Sector
+    Circular" y "Líneas" reutiliza el conteo y, si ya se dibujó, la figura misma.
+    """
+    conteo = conteo_por_bin(firma_csv, analisis)
+    etiqueta_x, titulos = TEXTOS_GRAFICOS[analisis]
+    etiquetas = {"x": etiqueta_x, "y": "Cantidad de Sismos"}
+    if tipo_grafico == "Barras":
+        return px.bar(conteo, x=conteo.index, y=conteo.values, labels=etiquetas, title=titulos[tipo_grafico])
+    if tipo_grafico == "Sector Circular":
+        return px.pie(values=conteo.values, names=conteo.index, title=titulos[tipo_grafico])
+    return px.line(conteo, x=conteo.index, y=conteo.values, markers=True, labels=etiquetas, title=titulos["Líneas"])
+
 
-def visualizacion_magnitud(df, tipo_grafico):
+def visualizacion_anos(firma_csv, tipo_grafico):
+    st.subheader(f"Análisis de Sismos por Año - Gráfico de {tipo_grafico}")
+    st.plotly_chart(figura_por_bin(firma_csv, "Año", tipo_grafico), use_container_width=True)
+
+def visualizacion_magnitud(firma_csv, tipo_grafico):
     st.subheader(f"Análisis de Sismos por Magnitud - Gráfico de {tipo_grafico}")
-    df_temp = df.copy()
-    df_temp['MAGNITUD_ROUND'] = df_temp['MAGNITUD'].round(0)
-    conteo = df_temp['MAGNITUD_ROUND'].value_counts().sort_index()
-    if tipo_grafico == "Barras":
-        fig = px.bar(conteo, x=conteo.index, y=conteo.values, labels={"x": "Magnitud (redondeada)", "y": "Cantidad de Sismos"}, title="Distribución de Sismos por Magnitud")
-    elif tipo_grafico == "Sector Circular":
-        fig = px.pie(values=conteo.values, names=conteo.index, title="Distribución Porcentual de Sismos por Magnitud")
-    else:
-        fig = px.line(conteo, x=conteo.index, y=conteo.values, markers=True, labels={"x": "Magnitud (redondeada)", "y": "Cantidad de Sismos"}, title="Frecuencia de Sismos por Nivel de Magnitud")
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(figura_por_bin(firma_csv, "Magnitud", tipo_grafico), use_container_width=True)
 
-def visualizacion_profundidad(df, tipo_grafico):
+def visualizacion_profundidad(firma_csv, tipo_grafico):
     st.subheader(f"Análisis de Sismos por Profundidad - Gráfico de {tipo_grafico}")
-    bins = [0, 70, 300, 1000]
-    labels = ['Superficial (0-70 km)', 'Intermedia (70-300 km)', 'Profunda (>300 km)']
-    df_temp = df.copy()
-    df_temp['PROFUNDIDAD_CAT'] = pd.cut(df['PROFUNDIDAD'], bins=bins, labels=labels, right=False)
-    conteo = df_temp['PROFUNDIDAD_CAT'].value_counts().reindex(labels).fillna(0)
-    if tipo_grafico == "Barras":
-        fig = px.bar(conteo, x=conteo.index, y=conteo.values, labels={"x": "Categoría de Profundidad", "y": "Cantidad de Sismos"}, title="Distribución de Sismos por Categoría de Profundidad")
-    elif tipo_grafico == "Sector Circular":
-        fig = px.pie(values=conteo.values, names=conteo.index, title="Distribución Porcentual de Sismos por Profundidad")
+    st.plotly_chart(figura_por_bin(firma_csv, "Profundidad", tipo_grafico), use_container_width=True)
+
+TODO_EL_PERU = "Todo el Perú"
+
+
+@st.cache_data(max_entries=16)
+def calcular_gutenberg_richter(firma_csv, ancho_anios, paso_anios, solo_principales, num_bootstrap=200):
+    """
+    Gutenberg-Richter de todos los departamentos y ventanas en una sola llamada al motor
+    C++ (reutiliza los códigos de departamento del spatial join). Se guarda por versión
+    del catálogo ('firma_csv') y por parámetros.
+    """
+    sismos_df, _, _ = cargar_datos_con_motor_cpp(RUTA_CSV, RUTA_GEOJSON, firma_csv)
+    departamentos = list(sismos_df['DEPARTAMENTO'].cat.categories)
+    grupos = sismos_df['DEPARTAMENTO'].cat.codes.to_numpy().astype(np.int32)
+    if solo_principales:
+        grupos[sismos_df['ES_REPLICA'].to_numpy()] = -1
+    resultado = pd.DataFrame(motor_sjoin_cpp.gutenberg_richter_cpp(
+        sismos_df['MAGNITUD'].to_numpy(),
+        grupos,
+        sismos_df['AÑO'].to_numpy(),
+        len(departamentos),
+        ancho_anios=ancho_anios,
+        paso_anios=paso_anios,
+        num_bootstrap=num_bootstrap,
+    ))
+    resultado['DEPARTAMENTO'] = np.array(departamentos + [TODO_EL_PERU], dtype=object)[resultado['grupo']]
+    return resultado
+
+
+def visualizacion_gutenberg_richter(df):
+    st.subheader("Ley de Gutenberg-Richter: completitud y valor b")
+    with st.sidebar:
+        region = st.selectbox("Región", [TODO_EL_PERU] + sorted(df['DEPARTAMENTO'].cat.categories))
+        ancho = st.slider("Ventana (años, 0 = todo el período)", 0, 30, 0)
+        paso = st.slider("Paso entre ventanas (años)", 1, 10, 5) if ancho else 1
+        solo_principales = st.checkbox("Solo sismos principales (sin réplicas)", value=True)
+
+    resultado = calcular_gutenberg_richter(firma_archivo(RUTA_CSV), ancho, paso, solo_principales)
+    filas = resultado[resultado['DEPARTAMENTO'] == region]
+    if filas.empty:
+        # El motor no devuelve filas con un catálogo vacío o sin magnitudes válidas
+        st.warning("No hay sismos con magnitud válida para estimar la ley de Gutenberg-Richter.")
+        return
+    if filas['b'].isna().all():
+        st.warning("No hay suficientes sismos sobre la magnitud de completitud para estimar b.")
+
+    if ancho == 0:
+        fila = filas.iloc[0]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Mc", f"{fila['mc']:.1f}", help=f"± {fila['sigma_mc_bootstrap']:.2f} (bootstrap)")
+        col2.metric("Valor b", f"{fila['b']:.2f}", help=f"± {fila['sigma_b_bootstrap']:.2f} (bootstrap), ± {fila['sigma_b_shi_bolt']:.2f} (Shi-Bolt)")
+        col3.metric("Valor a", f"{fila['a']:.2f}")
+        col4.metric("Sismos ≥ Mc", int(fila['num_sobre_mc']))
     else:
-        fig = px.line(conteo, x=conteo.index, y=conteo.values, markers=True, labels={"x": "Categoría de Profundidad", "y": "Cantidad de Sismos"}, title="Frecuencia de Sismos por Profundidad")
-    st.plotly_chart(fig, use_container_width=True)
+        filas = filas.assign(CENTRO=(filas['anio_inicio'] + filas['anio_fin']) / 2)
+        fig = px.line(filas, x='CENTRO', y='b', error_y='sigma_b_bootstrap', markers=True,
+                      labels={"CENTRO": "Año (centro de la ventana)", "b": "Valor b"},
+                      title=f"Valor b en ventanas de {ancho} años - {region}")
+        st.plotly_chart(fig, use_container_width=True)
+
+    st.dataframe(filas[['anio_inicio', 'anio_fin', 'num_eventos', 'num_sobre_mc', 'mc', 'b',
+                        'sigma_b_shi_bolt', 'sigma_b_bootstrap', 'sigma_mc_bootstrap', 'a']],
+                 hide_index=True, use_container_width=True)
 
 # =============================================================================
 # 5. ESTRUCTURA PRINCIPAL DE LA APLICACIÓN
 # =============================================================================
 def main():
-    # Usamos el estado de sesión para evitar recargar los datos dos veces
-    if "gdf_analisis" not in st.session_state:
-        with st.spinner(f'Procesando datos con el motor C++... (solo la primera vez)'):
-            gdf_analisis, departamentos_gdf, tiempo_total = cargar_datos_con_motor_cpp()
-            st.session_state["gdf_analisis"] = gdf_analisis
-            st.session_state["departamentos_gdf"] = departamentos_gdf
-            st.session_state["tiempo_total"] = tiempo_total
-    else:
-        gdf_analisis = st.session_state["gdf_analisis"]
-        departamentos_gdf = st.session_state["departamentos_gdf"]
-        tiempo_total = st.session_state["tiempo_total"]
+    # El catálogo es un recurso único del proceso: cada sesión recibe el mismo objeto
+    # (sin copiarlo a st.session_state) y solo crea sus propias máscaras de filtro.
+    with st.spinner('Procesando datos con el motor C++... (solo la primera vez)'):
+        firma_csv = firma_archivo(RUTA_CSV)
+        gdf_analisis, departamentos_gdf, metricas = cargar_datos_con_motor_cpp(
+            RUTA_CSV, RUTA_GEOJSON, firma_csv
+        )
+        cubo = obtener_cubo_agregacion(RUTA_CSV, RUTA_GEOJSON, firma_csv)
+        bordes_por_zoom = obtener_bordes_simplificados(RUTA_GEOJSON, firma_archivo(RUTA_GEOJSON))
 
     # Mostrar tiempo de carga solo cuando ya está listo
-    st.sidebar.success(f"Carga completada en {tiempo_total:.2f} segundos.")
+    st.sidebar.success(f"Carga completada en {metricas.tiempo_total:.2f} segundos.")
+    if st.query_params.get(PARAMETRO_ADMIN) == "1":
+        panel_administracion(metricas)
 
     # Menú de navegación
     with st.sidebar:
@@ -472,7 +901,7 @@ def main():
     if selected == "Inicio":
         pagina_inicio()
     elif selected == "Mapa Interactivo":
-        pagina_mapa(gdf_analisis, departamentos_gdf)
+        pagina_mapa(gdf_analisis, cubo, bordes_por_zoom)
     elif selected == "Análisis Gráfico":
         pagina_graficos(gdf_analisis)
     elif selected == "Conclusión":
@@ -0,0 +1,403 @@
+"""
+Banco de pruebas de las distintas formas de ejecutar el spatial join.
+
+Genera conjuntos de puntos sintéticos (reproducibles por semilla) dentro y alrededor
+del Perú y los une con los polígonos reales de departamentos_perú.geojson por cada
+camino disponible:
+
+    pybind          motor_sjoin_cpp.MotorSjoin.unir (índice de envolventes + GEOS)
+    pybind_rejilla  lo mismo con la rejilla raster construida
+    multiproceso    sjoin_multiproceso.ProcesadorMultiproceso (un proceso por "hilo")
+    ctypes_wkb      motor_sjoin_ctypes.realizar_sjoin_wkb_cpp
+    ctypes_texto    motor_sjoin_ctypes.realizar_sjoin_paralelo_cpp (WKT y cadenas)
+    driver          el programa de main.cpp (sjoin_driver) en modo de medición
+    geopandas       geopandas.sjoin, como referencia
+
+Cada medición se ejecuta en un subproceso propio, así el pico de memoria (RSS) es
+el de ese camino y no el de los anteriores. Para cada combinación de camino, tamaño e
+hilos se informa el tiempo de preparación de los polígonos, el de conversión de datos
+(marshalling: arreglos, cadenas, GeoDataFrames...) y el de cómputo, el rendimiento en
+puntos por segundo, el pico de RSS y la eficiencia paralela respecto de un hilo.
+También se comprueba que todos los caminos asignan exactamente el mismo polígono a
+cada punto. El resultado completo se escribe en JSON.
+
+    python benchmark_sjoin.py --tamanos 10000 100000 1000000 10000000 --hilos 1 2 4 8
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+RUTA_GEOJSON = "departamentos_perú.geojson"
+CAMINOS = ["pybind", "pybind_rejilla", "multiproceso", "ctypes_wkb", "ctypes_texto", "driver", "geopandas"]
+# Caminos cuyo número de hilos no se puede fijar (se miden una sola vez, con 1)
+SIN_HILOS = {"geopandas"}
+# Caminos que se omiten por encima de --max-lentos puntos
+LENTOS = {"ctypes_texto", "geopandas"}
+# Camino cuyas etiquetas sirven de referencia para comparar los demás
+REFERENCIA = "pybind"
+RESOLUCION_REJILLA = 0.02
+# Margen alrededor de la envolvente del Perú (grados) y fracción de puntos en él
+MARGEN_GRADOS = 3.0
+FRACCION_ALREDEDOR = 0.3
+
+
+def generar_puntos(num_puntos, semilla, poligonos):
+    """
+    (latitudes, longitudes) float64: una parte uniforme dentro de la envolvente del
+    Perú y el resto en un margen alrededor (mar, países vecinos), para que haya
+    puntos dentro, fuera y cerca de las fronteras.
+    """
+    rng = np.random.default_rng(semilla)
+    min_x, min_y, max_x, max_y = poligonos.total_bounds
+    alrededor = rng.random(num_puntos) < FRACCION_ALREDEDOR
+    margen = np.where(alrededor, MARGEN_GRADOS, 0.0)
+    longitudes = rng.uniform(0.0, 1.0, num_puntos) * (max_x - min_x + 2 * margen) + min_x - margen
+    latitudes = rng.uniform(0.0, 1.0, num_puntos) * (max_y - min_y + 2 * margen) + min_y - margen
+    return latitudes, longitudes
+
+
+def rss_pico_mb(quien=resource.RUSAGE_SELF):
+    """Pico de memoria residente en MB (ru_maxrss está en KB en Linux y en bytes en macOS)."""
+    pico = resource.getrusage(quien).ru_maxrss
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+# ----------------------------------------------------------------------------
+# Cada camino: devuelve (codigos int32, tiempos {preparacion_s, conversion_s, computo_s})
+# ----------------------------------------------------------------------------
+
+def _codigos_desde_nombres(nombres_resultado, nombres):
+    posicion = {nombre: j for j, nombre in enumerate(nombres)}
+    return np.array([posicion.get(nombre, -1) for nombre in nombres_resultado], dtype=np.int32)
+
+
+def camino_pybind(latitudes, longitudes, poligonos, hilos, rejilla=False):
+    import motor_sjoin_cpp
+
+    inicio = time.perf_counter()
+    motor = motor_sjoin_cpp.MotorSjoin.desde_wkb(poligonos.geometry.to_wkb().tolist())
+    if rejilla:
+        motor.construir_rejilla(RESOLUCION_REJILLA, num_hilos=hilos)
+    preparacion = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    latitudes = np.ascontiguousarray(latitudes, dtype=np.float64)
+    longitudes = np.ascontiguousarray(longitudes, dtype=np.float64)
+    conversion = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    codigos = motor.unir(latitudes, longitudes, num_hilos=hilos)
+    computo = time.perf_counter() - inicio
+    motor.cerrar()
+    return codigos, {"preparacion_s": preparacion, "conversion_s": conversion, "computo_s": computo}
+
+
+def camino_multiproceso(latitudes, longitudes, poligonos, hilos):
+    import sjoin_multiproceso
+
+    inicio = time.perf_counter()
+    procesador = sjoin_multiproceso.ProcesadorMultiproceso(
+        poligonos.geometry.to_wkb().tolist(), num_procesos=hilos, resolucion_rejilla=RESOLUCION_REJILLA
+    )
+    # Los procesos se crean al encolar la primera tarea: se fuerzan aquí con un punto
+    procesador.unir(latitudes[:1], longitudes[:1])
+    preparacion = time.perf_counter() - inicio
+    with procesador:
+        inicio = time.perf_counter()
+        codigos = procesador.unir(latitudes, longitudes)
+        computo = time.perf_counter() - inicio
+    # El orden de Hilbert y la copia a memoria compartida forman parte del cómputo
+    return codigos, {"preparacion_s": preparacion, "conversion_s": 0.0, "computo_s": computo}
+
+
+def camino_ctypes_wkb(latitudes, longitudes, poligonos, hilos):
+    inicio = time.perf_counter()
+    import motor_sjoin_ctypes
+    wkbs = poligonos.geometry.to_wkb().tolist()
+    preparacion = time.perf_counter() - inicio
+
+    # El hilo de OpenMP se fija con OMP_NUM_THREADS en el entorno del subproceso.
+    # Este camino prepara los polígonos dentro de la llamada: va todo como cómputo.
+    inicio = time.perf_counter()
+    codigos = motor_sjoin_ctypes.realizar_sjoin_wkb_cpp(latitudes, longitudes, wkbs)
+    computo = time.perf_counter() - inicio
+    return codigos, {"preparacion_s": preparacion, "conversion_s": 0.0, "computo_s": computo}
+
+
+def camino_ctypes_texto(latitudes, longitudes, poligonos, hilos):
+    import ctypes
+    import motor_sjoin_ctypes
+
+    inicio = time.perf_counter()
+    wkts = poligonos.geometry.to_wkt().tolist()
+    nombres = [str(j) for j in range(len(wkts))]
+    preparacion = time.perf_counter() - inicio
+
+    # Misma secuencia que realizar_sjoin_paralelo_cpp, separando conversión y cómputo
+    lib = motor_sjoin_ctypes.sjoin_lib
+    inicio = time.perf_counter()
+    num_puntos = len(latitudes)
+    puntos = np.empty(num_puntos, dtype=[("lat", np.float64), ("lon", np.float64)])
+    puntos["lat"], puntos["lon"] = latitudes, longitudes
+    puntos_c = puntos.ctypes.data_as(ctypes.POINTER(motor_sjoin_ctypes.Point))
+    wkts_c = (ctypes.c_char_p * len(wkts))(*[w.encode("utf-8") for w in wkts])
+    nombres_c = (ctypes.c_char_p * len(nombres))(*[n.encode("utf-8") for n in nombres])
+    conversion = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    resultado = lib.procesar_sismos_c(puntos_c, num_puntos, wkts_c, nombres_c, len(wkts))
+    computo = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    texto = ctypes.string_at(resultado).decode("utf-8")
+    lib.liberar_memoria_c(resultado)
+    codigos = _codigos_desde_nombres(texto.split("|||") if num_puntos else [], nombres)
+    conversion += time.perf_counter() - inicio
+    return codigos, {"preparacion_s": preparacion, "conversion_s": conversion, "computo_s": computo}
+
+
+def camino_driver(latitudes, longitudes, poligonos, hilos, ruta_driver):
+    import motor_sjoin_cpp
+
+    with tempfile.TemporaryDirectory() as directorio:
+        inicio = time.perf_counter()
+        ruta_motor = os.path.join(directorio, "motor.bin")
+        with motor_sjoin_cpp.MotorSjoin.desde_wkb(poligonos.geometry.to_wkb().tolist()) as motor:
+            motor.guardar(ruta_motor)
+        preparacion = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        ruta_puntos = os.path.join(directorio, "puntos.bin")
+        ruta_codigos = os.path.join(directorio, "codigos.bin")
+        with open(ruta_puntos, "wb") as archivo:
+            archivo.write(np.ascontiguousarray(latitudes, dtype=np.float64).tobytes())
+            archivo.write(np.ascontiguousarray(longitudes, dtype=np.float64).tobytes())
+        conversion = time.perf_counter() - inicio
+
+        salida = subprocess.run(
+            [ruta_driver, ruta_motor, ruta_puntos, ruta_codigos, str(hilos)],
+            check=True, capture_output=True, text=True,
+        )
+        tiempos = json.loads(salida.stdout.strip().splitlines()[-1])
+        codigos = np.fromfile(ruta_codigos, dtype=np.int32)
+
+    # Escribir y leer los archivos de puntos y códigos es el marshalling de este camino
+    return codigos, {
+        "preparacion_s": preparacion + tiempos["preparacion_s"],
+        "conversion_s": conversion + tiempos["lectura_s"] + tiempos["escritura_s"],
+        "computo_s": tiempos["union_s"],
+    }
+
+
+def camino_geopandas(latitudes, longitudes, poligonos, hilos):
+    import geopandas as gpd
+
+    inicio = time.perf_counter()
+    puntos = gpd.GeoDataFrame(geometry=gpd.points_from_xy(longitudes, latitudes), crs=poligonos.crs)
+    poligonos = poligonos[["geometry"]].reset_index(drop=True)
+    conversion = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    unidos = gpd.sjoin(puntos, poligonos, how="left", predicate="within")
+    computo = time.perf_counter() - inicio
+
+    # Un punto que cae en dos polígonos solapados sale repetido: como el motor, se
+    # queda con el de menor índice.
+    inicio = time.perf_counter()
+    indice = unidos["index_right"].fillna(-1).to_numpy(dtype=np.int64)
+    codigos = np.full(len(latitudes), np.iinfo(np.int32).max, dtype=np.int64)
+    filas = unidos.index.to_numpy()
+    np.minimum.at(codigos, filas, np.where(indice < 0, np.iinfo(np.int32).max, indice))
+    codigos[codigos == np.iinfo(np.int32).max] = -1
+    conversion += time.perf_counter() - inicio
+    return codigos.astype(np.int32), {"preparacion_s": 0.0, "conversion_s": conversion, "computo_s": computo}
+
+
+def medir(camino, num_puntos, hilos, semilla, ruta_geojson, ruta_codigos, ruta_driver):
+    """Ejecuta un camino en este proceso y devuelve sus métricas (se llama en el subproceso)."""
+    import geopandas as gpd
+
+    poligonos = gpd.read_file(ruta_geojson)
+    latitudes, longitudes = generar_puntos(num_puntos, semilla, poligonos)
+    rss_inicial = rss_pico_mb()
+
+    if camino == "pybind":
+        codigos, tiempos = camino_pybind(latitudes, longitudes, poligonos, hilos)
+    elif camino == "pybind_rejilla":
+        codigos, tiempos = camino_pybind(latitudes, longitudes, poligonos, hilos, rejilla=True)
+    elif camino == "multiproceso":
+        codigos, tiempos = camino_multiproceso(latitudes, longitudes, poligonos, hilos)
+    elif camino == "ctypes_wkb":
+        codigos, tiempos = camino_ctypes_wkb(latitudes, longitudes, poligonos, hilos)
+    elif camino == "ctypes_texto":
+        codigos, tiempos = camino_ctypes_texto(latitudes, longitudes, poligonos, hilos)
+    elif camino == "driver":
+        codigos, tiempos = camino_driver(latitudes, longitudes, poligonos, hilos, ruta_driver)
+    elif camino == "geopandas":
+        codigos, tiempos = camino_geopandas(latitudes, longitudes, poligonos, hilos)
+    else:
+        raise ValueError(f"Camino desconocido: {camino}")
+
+    np.save(ruta_codigos, codigos)
+    total = tiempos["conversion_s"] + tiempos["computo_s"]
+    return dict(
+        tiempos,
+        camino=camino,
+        puntos=num_puntos,
+        hilos=hilos,
+        total_s=total,
+        puntos_por_s=num_puntos / total if total > 0 else None,
+        dentro=int((codigos >= 0).sum()),
+        rss_inicial_mb=rss_inicial,
+        rss_pico_mb=rss_pico_mb(),
+        # Procesos hijos (los del grupo multiproceso o el driver)
+        rss_pico_hijos_mb=rss_pico_mb(resource.RUSAGE_CHILDREN),
+    )
+
+
+def ejecutar_medicion(camino, num_puntos, hilos, args, ruta_codigos):
+    """Lanza un subproceso que mide un camino y devuelve su dict de métricas."""
+    entorno = dict(os.environ, OMP_NUM_THREADS=str(hilos))
+    # La biblioteca de ctypes se busca junto a motor_sjoin_ctypes.py; el módulo de
+    # pybind y sjoin_multiproceso, en sys.path (se añade el directorio de este archivo).
+    entorno["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [os.path.dirname(os.path.abspath(__file__)), entorno.get("PYTHONPATH")])
+    )
+    orden = [
+        sys.executable, os.path.abspath(__file__), "--medir", camino,
+        "--puntos", str(num_puntos), "--hilos-medicion", str(hilos), "--semilla", str(args.semilla),
+        "--geojson", args.geojson, "--codigos", ruta_codigos, "--driver", args.driver,
+    ]
+    salida = subprocess.run(orden, capture_output=True, text=True, env=entorno)
+    if salida.returncode != 0:
+        return {"camino": camino, "puntos": num_puntos, "hilos": hilos, "error": salida.stderr.strip()[-2000:]}
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def disponibles(args):
+    """Caminos que se pueden ejecutar en esta máquina (los demás se informan como omitidos)."""
+    motivos = {}
+    try:
+        import motor_sjoin_cpp  # noqa: F401
+    except ImportError:
+        for camino in ("pybind", "pybind_rejilla", "multiproceso", "driver"):
+            motivos[camino] = "motor_sjoin_cpp no está compilado"
+    try:
+        import motor_sjoin_ctypes  # noqa: F401
+    except ImportError:
+        motivos["ctypes_wkb"] = motivos["ctypes_texto"] = "procesador_sjoin.so no está compilado"
+    if not os.access(args.driver, os.X_OK):
+        motivos["driver"] = f"no se encontró el ejecutable {args.driver}"
+    return motivos
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--hilos", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--caminos", nargs="+", choices=CAMINOS, default=CAMINOS)
+    parser.add_argument("--repeticiones", type=int, default=3, help="se conserva la medición más rápida")
+    parser.add_argument("--max-lentos", type=int, default=1_000_000,
+                        help=f"tamaño máximo para {', '.join(sorted(LENTOS))}")
+    parser.add_argument("--semilla", type=int, default=2024)
+    parser.add_argument("--geojson", default=RUTA_GEOJSON)
+    parser.add_argument("--driver", default=os.path.join("build", "sjoin_driver"))
+    parser.add_argument("--salida", default="benchmark_sjoin.json")
+    # Uso interno: medir un solo camino en este proceso
+    parser.add_argument("--medir", choices=CAMINOS, help=argparse.SUPPRESS)
+    parser.add_argument("--puntos", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--hilos-medicion", type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument("--codigos", help=argparse.SUPPRESS)
+    args = parser.parse_args(argumentos)
+
+    if args.medir:
+        resultado = medir(args.medir, args.puntos, args.hilos_medicion, args.semilla,
+                          args.geojson, args.codigos, os.path.abspath(args.driver))
+        print(json.dumps(resultado))
+        return
+
+    omitidos = disponibles(args)
+    mediciones = []
+    verificacion = []
+    with tempfile.TemporaryDirectory() as directorio:
+        for num_puntos in args.tamanos:
+            ruta_referencia = None
+            for camino in args.caminos:
+                if camino in omitidos:
+                    continue
+                if camino in LENTOS and num_puntos > args.max_lentos:
+                    continue
+                for hilos in ([1] if camino in SIN_HILOS else args.hilos):
+                    ruta_codigos = os.path.join(directorio, f"{camino}_{num_puntos}_{hilos}.npy")
+                    intentos = [ejecutar_medicion(camino, num_puntos, hilos, args, ruta_codigos)
+                                for _ in range(args.repeticiones)]
+                    correctos = [m for m in intentos if "error" not in m]
+                    mejor = min(correctos, key=lambda m: m["total_s"]) if correctos else intentos[0]
+                    mejor["repeticiones"] = len(correctos)
+                    mediciones.append(mejor)
+                    print(_linea_resumen(mejor), file=sys.stderr)
+                    if "error" in mejor:
+                        continue
+
+                    # Etiquetas: todas deben coincidir con las del camino de referencia
+                    if camino == REFERENCIA and ruta_referencia is None:
+                        ruta_referencia = ruta_codigos
+                        continue
+                    if ruta_referencia is not None:
+                        diferencias = int((np.load(ruta_codigos) != np.load(ruta_referencia)).sum())
+                        verificacion.append({"camino": camino, "puntos": num_puntos, "hilos": hilos,
+                                             "diferencias": diferencias})
+                        os.remove(ruta_codigos)
+
+    _calcular_eficiencia(mediciones)
+    informe = {
+        "maquina": {
+            "plataforma": platform.platform(),
+            "procesador": platform.processor(),
+            "nucleos": os.cpu_count(),
+            "python": platform.python_version(),
+        },
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("medir", "puntos", "hilos_medicion", "codigos")},
+        "omitidos": omitidos,
+        "mediciones": mediciones,
+        "verificacion": verificacion,
+        "etiquetas_identicas": all(v["diferencias"] == 0 for v in verificacion),
+    }
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(informe, archivo, ensure_ascii=False, indent=2)
+    print(f"Resultados en {args.salida}; etiquetas idénticas: {informe['etiquetas_identicas']}", file=sys.stderr)
+    if not informe["etiquetas_identicas"]:
+        sys.exit(1)
+
+
+def _calcular_eficiencia(mediciones):
+    """Eficiencia paralela = T(1 hilo) / (hilos × T(hilos)) del cómputo, por camino y tamaño."""
+    base = {
+        (m["camino"], m["puntos"]): m["computo_s"]
+        for m in mediciones if "error" not in m and m["hilos"] == 1
+    }
+    for m in mediciones:
+        t1 = base.get((m["camino"], m["puntos"]))
+        if "error" not in m and t1 and m["computo_s"] > 0:
+            m["aceleracion"] = t1 / m["computo_s"]
+            m["eficiencia_paralela"] = t1 / (m["hilos"] * m["computo_s"])
+
+
+def _linea_resumen(m):
+    if "error" in m:
+        return f"{m['camino']:>15} {m['puntos']:>10} pts {m['hilos']:>3} hilos  ERROR"
+    return (f"{m['camino']:>15} {m['puntos']:>10} pts {m['hilos']:>3} hilos  "
+            f"conversión {m['conversion_s']:8.4f} s  cómputo {m['computo_s']:8.4f} s  "
+            f"{m['puntos_por_s'] / 1e6:8.2f} Mpts/s  RSS {m['rss_pico_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,341 @@
 // bindings.cpp
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/numpy.h>
+
+#include <stdexcept>
+#include <cstdio>
+#include <optional>
 
 // ¡ESTA LÍNEA ES LA SOLUCIÓN AL ERROR!
 // Le dice a este archivo que la función "realizar_sjoin_paralelo" existe
 // y le muestra su firma completa (argumentos y tipo de retorno).
 #include "procesador_sjoin.h"
+#include "agregador_bins.h"
+#include "indice_espacio_temporal.h"
+#include "gutenberg_richter.h"
 
 namespace py = pybind11;
 
+// Arreglo float64 contiguo. Junto con .noconvert() garantiza que pybind11 nunca
+// haga una copia implícita: si el arreglo no cumple, Python recibe un TypeError.
+using ArregloCoordenadas = py::array_t<double, py::array::c_style>;
+
+// Valida que las coordenadas sean dos arreglos 1D del mismo tamaño y devuelve ese tamaño.
+static size_t validar_coordenadas(const ArregloCoordenadas &latitudes, const ArregloCoordenadas &longitudes) {
+    if (latitudes.ndim() != 1 || longitudes.ndim() != 1) {
+        throw std::invalid_argument("latitudes y longitudes deben ser arreglos de una dimensión");
+    }
+    if (latitudes.shape(0) != longitudes.shape(0)) {
+        throw std::invalid_argument("latitudes y longitudes deben tener la misma longitud");
+    }
+    return static_cast<size_t>(latitudes.shape(0));
+}
+
+static OpcionesParalelismo crear_opciones(int num_hilos, const std::string &planificacion, int tamano_bloque) {
+    OpcionesParalelismo opciones;
+    opciones.num_hilos = num_hilos;
+    opciones.planificacion = planificacion_desde_texto(planificacion);
+    opciones.tamano_bloque = tamano_bloque;
+    return opciones;
+}
+
+/**
+ * Envoltura para NumPy: lee las coordenadas directamente del buffer de los
+ * arreglos (sin copiarlas) y devuelve un arreglo int32 con el índice del
+ * departamento de cada sismo, o -1 si cae fuera de todos los polígonos.
+ */
+static py::array_t<int32_t> realizar_sjoin_paralelo_indices_py(
+    const ArregloCoordenadas &latitudes,
+    const ArregloCoordenadas &longitudes,
+    const std::vector<std::string> &wkts_departamentos,
+    int num_hilos,
+    const std::string &planificacion,
+    int tamano_bloque
+) {
+    const size_t num_puntos = validar_coordenadas(latitudes, longitudes);
+    const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+    py::array_t<int32_t> codigos(static_cast<py::ssize_t>(num_puntos));
+    const double *lat = latitudes.data(), *lon = longitudes.data();
+    int32_t *salida = codigos.mutable_data();
+    {
+        // La parte nativa no toca objetos de Python: liberamos el GIL para que las
+        // demás sesiones de Streamlit sigan atendiéndose mientras dura el join.
+        py::gil_scoped_release sin_gil;
+        realizar_sjoin_paralelo_indices(lat, lon, num_puntos, wkts_departamentos, salida, opciones);
+    }
+    return codigos;
+}
+
+// Estadísticas de una llamada a unir() como dict de Python.
+static py::dict estadisticas_a_dict(const EstadisticasUnion &estadisticas) {
+    py::dict resultado;
+    resultado["puntos"] = estadisticas.puntos;
+    resultado["resueltos_por_rejilla"] = estadisticas.resueltos_por_rejilla;
+    resultado["puntos_probados"] = estadisticas.puntos_probados;
+    resultado["pruebas_contencion"] = estadisticas.pruebas_contencion;
+    resultado["pruebas_distancia"] = estadisticas.pruebas_distancia;
+    resultado["asignados_por_cercania"] = estadisticas.asignados_por_cercania;
+    resultado["fuera_de_peru"] = estadisticas.fuera_de_peru;
+    resultado["segundos"] = estadisticas.segundos;
+    resultado["puntos_por_hilo"] = estadisticas.puntos_por_hilo;
+    resultado["segundos_por_hilo"] = estadisticas.segundos_por_hilo;
+    return resultado;
+}
+
+// Igual que la anterior, pero reutilizando los polígonos ya preparados del motor.
+// Con estadisticas=True devuelve (codigos, dict de estadísticas).
+static py::object motor_unir_py(
+    const MotorSjoin &motor,
+    const ArregloCoordenadas &latitudes,
+    const ArregloCoordenadas &longitudes,
+    int num_hilos,
+    const std::string &planificacion,
+    int tamano_bloque,
+    bool con_estadisticas
+) {
+    const size_t num_puntos = validar_coordenadas(latitudes, longitudes);
+    const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+    py::array_t<int32_t> codigos(static_cast<py::ssize_t>(num_puntos));
+    const double *lat = latitudes.data(), *lon = longitudes.data();
+    int32_t *salida = codigos.mutable_data();
+    EstadisticasUnion estadisticas;
+    {
+        py::gil_scoped_release sin_gil;
+        motor.unir(lat, lon, num_puntos, salida, opciones, con_estadisticas ? &estadisticas : nullptr);
+    }
+    if (con_estadisticas) return py::make_tuple(codigos, estadisticas_a_dict(estadisticas));
+    return std::move(codigos);
+}
+
+// Vistas sin copia de una secuencia de bytes WKB (una lista o el arreglo de objetos
+// que devuelve shapely.to_wkb); None = geometría vacía. 'referencias' mantiene vivos
+// los bytes mientras se usan las vistas.
+static std::vector<VistaWkb> vistas_wkb(const py::sequence &wkbs, std::vector<py::object> &referencias) {
+    std::vector<VistaWkb> vistas;
+    referencias.reserve(referencias.size() + wkbs.size());
+    vistas.reserve(wkbs.size());
+    for (const auto &elemento : wkbs) {
+        py::object wkb = py::reinterpret_borrow<py::object>(elemento);
+        if (wkb.is_none()) {
+            vistas.push_back(VistaWkb{nullptr, 0});
+            continue;
+        }
+        if (!PyBytes_Check(wkb.ptr())) throw py::type_error("Cada geometría debe ser bytes WKB o None");
+        char *datos = nullptr;
+        Py_ssize_t tamano = 0;
+        PyBytes_AsStringAndSize(wkb.ptr(), &datos, &tamano);
+        vistas.push_back(VistaWkb{reinterpret_cast<const unsigned char *>(datos), static_cast<size_t>(tamano)});
+        referencias.push_back(std::move(wkb));
+    }
+    return vistas;
+}
+
+// Crea el motor a partir de una secuencia de bytes WKB sin copiar los bytes.
+static std::unique_ptr<MotorSjoin> motor_desde_wkb_py(
+    const py::sequence &wkbs,
+    const std::vector<std::string> &nombres
+) {
+    std::vector<py::object> referencias;
+    const std::vector<VistaWkb> vistas = vistas_wkb(wkbs, referencias);
+    py::gil_scoped_release sin_gil;
+    return std::make_unique<MotorSjoin>(vistas, nombres);
+}
+
+// Igual para el motor jerárquico: una secuencia de bytes WKB por capa.
+static std::unique_ptr<MotorSjoinJerarquico> motor_jerarquico_desde_wkb_py(
+    const py::sequence &wkbs_por_capa,
+    const std::vector<std::vector<std::string>> &nombres_por_capa
+) {
+    std::vector<py::object> referencias;
+    std::vector<std::vector<VistaWkb>> vistas_por_capa;
+    vistas_por_capa.reserve(wkbs_por_capa.size());
+    for (const auto &capa : wkbs_por_capa) {
+        if (!PySequence_Check(capa.ptr())) throw py::type_error("Cada capa debe ser una secuencia de bytes WKB");
+        vistas_por_capa.push_back(vistas_wkb(py::reinterpret_borrow<py::sequence>(capa), referencias));
+    }
+    py::gil_scoped_release sin_gil;
+    return std::make_unique<MotorSjoinJerarquico>(vistas_por_capa, nombres_por_capa);
+}
+
+// Join jerárquico: devuelve una lista con un arreglo int32 de códigos por capa.
+static py::list motor_jerarquico_unir_py(
+    const MotorSjoinJerarquico &motor,
+    const ArregloCoordenadas &latitudes,
+    const ArregloCoordenadas &longitudes,
+    int num_hilos,
+    const std::string &planificacion,
+    int tamano_bloque
+) {
+    const size_t num_puntos = validar_coordenadas(latitudes, longitudes);
+    const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+    std::vector<py::array_t<int32_t>> codigos;
+    std::vector<int32_t *> salidas;
+    for (size_t k = 0; k < motor.num_capas(); ++k) {
+        codigos.emplace_back(static_cast<py::ssize_t>(num_puntos));
+        salidas.push_back(codigos.back().mutable_data());
+    }
+    const double *lat = latitudes.data(), *lon = longitudes.data();
+    {
+        py::gil_scoped_release sin_gil;
+        motor.unir(lat, lon, num_puntos, salidas, opciones);
+    }
+    py::list resultado;
+    for (auto &arreglo : codigos) resultado.append(arreglo);
+    return resultado;
+}
+
+// Columna numérica de eventos: se acepta cualquier tipo numérico (si ya es float64
+// contiguo no se copia), porque magnitud y profundidad pueden venir como enteros.
+using ArregloValores = py::array_t<double, py::array::c_style | py::array::forcecast>;
+using ArregloMascara = py::array_t<bool, py::array::c_style | py::array::forcecast>;
+
+template <typename T>
+static py::array_t<T> a_numpy(const std::vector<T> &valores) {
+    return py::array_t<T>(static_cast<py::ssize_t>(valores.size()), valores.data());
+}
+
+// Envoltura de agregar_en_celdas: devuelve un dict de arreglos NumPy (una fila por celda).
+static py::dict agregar_en_celdas_py(
+    const ArregloValores &latitudes,
+    const ArregloValores &longitudes,
+    const ArregloValores &magnitudes,
+    const ArregloValores &profundidades,
+    const std::vector<double> &caja,
+    double tamano,
+    const std::string &forma,
+    const std::optional<ArregloMascara> &mascara,
+    int num_hilos,
+    const std::string &planificacion,
+    int tamano_bloque
+) {
+    const size_t num_eventos = static_cast<size_t>(latitudes.size());
+    if (longitudes.size() != latitudes.size() || magnitudes.size() != latitudes.size()
+        || profundidades.size() != latitudes.size() || (mascara && mascara->size() != latitudes.size())) {
+        throw std::invalid_argument("Todos los arreglos deben tener la misma longitud");
+    }
+    if (caja.size() != 4) {
+        throw std::invalid_argument("caja debe ser (lon_min, lat_min, lon_max, lat_max)");
+    }
+    const Envolvente envolvente{caja[0], caja[1], caja[2], caja[3]};
+    const FormaCelda forma_celda = forma_celda_desde_texto(forma);
+    const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+    const uint8_t *filtro = mascara ? reinterpret_cast<const uint8_t *>(mascara->data()) : nullptr;
+
+    CeldasAgregadas celdas;
+    {
+        py::gil_scoped_release sin_gil;
+        celdas = agregar_en_celdas(latitudes.data(), longitudes.data(), magnitudes.data(), profundidades.data(),
+                                   filtro, num_eventos, envolvente, tamano, forma_celda, opciones);
+    }
+    py::dict resultado;
+    resultado["centro_longitud"] = a_numpy(celdas.centro_x);
+    resultado["centro_latitud"] = a_numpy(celdas.centro_y);
+    resultado["cantidad"] = a_numpy(celdas.cantidad);
+    resultado["magnitud_maxima"] = a_numpy(celdas.magnitud_maxima);
+    resultado["profundidad_media"] = a_numpy(celdas.profundidad_media);
+    return resultado;
+}
+
+using ArregloCodigos = py::array_t<int32_t, py::array::c_style | py::array::forcecast>;
+
+// Envoltura de calcular_gutenberg_richter: un dict de arreglos con una fila por (grupo, ventana).
+static py::dict gutenberg_richter_py(
+    const ArregloValores &magnitudes,
+    const ArregloCodigos &grupos,
+    const ArregloCodigos &anios,
+    int num_grupos,
+    int ancho_anios,
+    int paso_anios,
+    double delta_m,
+    double correccion_mc,
+    int min_eventos,
+    int num_bootstrap,
+    uint64_t semilla,
+    int num_hilos,
+    const std::string &planificacion,
+    int tamano_bloque
+) {
+    if (grupos.size() != magnitudes.size() || anios.size() != magnitudes.size()) {
+        throw std::invalid_argument("magnitudes, grupos y anios deben tener la misma longitud");
+    }
+    ParametrosGutenbergRichter parametros;
+    parametros.ancho_anios = ancho_anios;
+    parametros.paso_anios = paso_anios;
+    parametros.delta_m = delta_m;
+    parametros.correccion_mc = correccion_mc;
+    parametros.min_eventos = min_eventos;
+    parametros.num_bootstrap = num_bootstrap;
+    parametros.semilla = semilla;
+    const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+
+    ResultadoGutenbergRichter r;
+    {
+        py::gil_scoped_release sin_gil;
+        r = calcular_gutenberg_richter(magnitudes.data(), grupos.data(), anios.data(),
+                                       static_cast<size_t>(magnitudes.size()), num_grupos, parametros, opciones);
+    }
+    py::dict resultado;
+    resultado["grupo"] = a_numpy(r.grupo);
+    resultado["anio_inicio"] = a_numpy(r.anio_inicio);
+    resultado["anio_fin"] = a_numpy(r.anio_fin);
+    resultado["num_eventos"] = a_numpy(r.num_eventos);
+    resultado["num_sobre_mc"] = a_numpy(r.num_sobre_mc);
+    resultado["mc"] = a_numpy(r.mc);
+    resultado["a"] = a_numpy(r.valor_a);
+    resultado["b"] = a_numpy(r.valor_b);
+    resultado["sigma_b_shi_bolt"] = a_numpy(r.sigma_b_shi_bolt);
+    resultado["sigma_b_bootstrap"] = a_numpy(r.sigma_b_bootstrap);
+    resultado["sigma_mc_bootstrap"] = a_numpy(r.sigma_mc_bootstrap);
+    return resultado;
+}
+
+// Un parámetro por consulta: se acepta un escalar (o un arreglo de un elemento) para
+// usar el mismo valor en todas.
+static std::vector<double> por_consulta(const ArregloValores &valores, size_t num_consultas, const char *nombre) {
+    const size_t n = static_cast<size_t>(valores.size());
+    if (n != 1 && n != num_consultas) {
+        throw std::invalid_argument(std::string(nombre) + " debe ser un escalar o tener un valor por consulta");
+    }
+    std::vector<double> resultado(num_consultas);
+    for (size_t q = 0; q < num_consultas; ++q) resultado[q] = valores.data()[n == 1 ? 0 : q];
+    return resultado;
+}
+
+// Igual que motor_unir_py, asignando además los puntos de fuera al polígono más cercano.
+static py::tuple motor_unir_cercano_py(
+    const MotorSjoin &motor,
+    const ArregloCoordenadas &latitudes,
+    const ArregloCoordenadas &longitudes,
+    double distancia_maxima_km,
+    int num_hilos,
+    const std::string &planificacion,
+    int tamano_bloque,
+    bool con_estadisticas
+) {
+    const size_t num_puntos = validar_coordenadas(latitudes, longitudes);
+    const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+    py::array_t<int32_t> codigos(static_cast<py::ssize_t>(num_puntos));
+    py::array_t<double> distancias(static_cast<py::ssize_t>(num_puntos));
+    const double *lat = latitudes.data(), *lon = longitudes.data();
+    int32_t *salida = codigos.mutable_data();
+    double *salida_distancias = distancias.mutable_data();
+    EstadisticasUnion estadisticas;
+    {
+        py::gil_scoped_release sin_gil;
+        motor.unir_cercano(lat, lon, num_puntos, salida, salida_distancias, distancia_maxima_km, opciones,
+                           con_estadisticas ? &estadisticas : nullptr);
+    }
+    if (con_estadisticas) return py::make_tuple(codigos, distancias, estadisticas_a_dict(estadisticas));
+    return py::make_tuple(codigos, distancias);
+}
+
 PYBIND11_MODULE(motor_sjoin_cpp, m) {
     m.doc() = "Módulo C++ para realizar spatial joins en paralelo";
 
+    m.attr("__version__") = VERSION_MOTOR_SJOIN;
+    m.attr("CODIGO_FUERA_DE_PERU") = CODIGO_FUERA_DE_PERU;
+
     // Ahora, cuando el compilador ve "&realizar_sjoin_paralelo",
     // ya sabe a qué te refieres gracias al .h que incluiste arriba.
     m.def(
@@ -20,6 +344,339 @@ PYBIND11_MODULE(motor_sjoin_cpp, m) {
         "Asigna un departamento a cada sismo usando C++ y OpenMP",
         py::arg("coords_sismos"),
         py::arg("wkts_departamentos"),
-        py::arg("nombres_departamentos")
+        py::arg("nombres_departamentos"),
+        py::call_guard<py::gil_scoped_release>()
     );
-}
\ No newline at end of file
+
+    m.def(
+        "realizar_sjoin_paralelo_indices_cpp",
+        &realizar_sjoin_paralelo_indices_py,
+        "Igual que realizar_sjoin_paralelo_cpp pero sin copias: recibe arreglos float64 "
+        "contiguos de latitudes y longitudes y devuelve un arreglo int32 con el índice "
+        "del departamento de cada sismo (-1 si está fuera de todos los polígonos).",
+        py::arg("latitudes").noconvert(),
+        py::arg("longitudes").noconvert(),
+        py::arg("wkts_departamentos"),
+        py::arg("num_hilos") = 0,
+        py::arg("planificacion") = "dynamic",
+        py::arg("tamano_bloque") = 0
+    );
+
+    m.def(
+        "agregar_en_celdas_cpp",
+        &agregar_en_celdas_py,
+        "Agrupa los eventos dentro de caja=(lon_min, lat_min, lon_max, lat_max) en celdas "
+        "'cuadrada' (tamano = lado en grados) o 'hexagonal' (tamano = centro a vértice). "
+        "Solo cuenta los eventos con mascara True si se pasa una. Devuelve un dict con "
+        "centro_longitud, centro_latitud, cantidad, magnitud_maxima y profundidad_media.",
+        py::arg("latitudes"),
+        py::arg("longitudes"),
+        py::arg("magnitudes"),
+        py::arg("profundidades"),
+        py::arg("caja"),
+        py::arg("tamano"),
+        py::arg("forma") = "hexagonal",
+        py::arg("mascara") = py::none(),
+        py::arg("num_hilos") = 0,
+        py::arg("planificacion") = "dynamic",
+        py::arg("tamano_bloque") = 0
+    );
+
+    m.def(
+        "gutenberg_richter_cpp",
+        &gutenberg_richter_py,
+        "Mc (máxima curvatura + correccion_mc), b de Aki-Utsu, a, error de Shi-Bolt e "
+        "incertidumbre bootstrap de b y Mc para cada grupo (0..num_grupos-1; los grupos "
+        "negativos se ignoran) y cada ventana de ancho_anios años (0 = todo el período) "
+        "desplazada paso_anios. Una fila extra por ventana con grupo == num_grupos reúne "
+        "todos los eventos. Devuelve un dict de arreglos, una posición por fila.",
+        py::arg("magnitudes"),
+        py::arg("grupos"),
+        py::arg("anios"),
+        py::arg("num_grupos"),
+        py::arg("ancho_anios") = 0,
+        py::arg("paso_anios") = 1,
+        py::arg("delta_m") = 0.1,
+        py::arg("correccion_mc") = 0.2,
+        py::arg("min_eventos") = 50,
+        py::arg("num_bootstrap") = 200,
+        py::arg("semilla") = 0,
+        py::arg("num_hilos") = 0,
+        py::arg("planificacion") = "dynamic",
+        py::arg("tamano_bloque") = 0
+    );
+
+    py::class_<IndiceEspacioTemporal>(m, "IndiceEspacioTemporal", R"doc(
+        Índice de eventos por posición y tiempo (rejilla de celdas con los eventos de
+        cada celda ordenados por tiempo). Responde en lote y en paralelo "eventos a
+        menos de R km y dentro de una ventana de días" y hace el declustering de
+        Gardner y Knopoff.
+    )doc")
+        .def(
+            py::init([](const ArregloValores &latitudes, const ArregloValores &longitudes,
+                        const ArregloValores &tiempos_dias, double celda_grados) {
+                if (longitudes.size() != latitudes.size() || tiempos_dias.size() != latitudes.size()) {
+                    throw std::invalid_argument("latitudes, longitudes y tiempos_dias deben tener la misma longitud");
+                }
+                return std::make_unique<IndiceEspacioTemporal>(
+                    latitudes.data(), longitudes.data(), tiempos_dias.data(),
+                    static_cast<size_t>(latitudes.size()), celda_grados);
+            }),
+            py::arg("latitudes"),
+            py::arg("longitudes"),
+            py::arg("tiempos_dias"),
+            py::arg("celda_grados") = 0.5
+        )
+        .def(
+            "vecinos",
+            [](const IndiceEspacioTemporal &indice, const py::array_t<int32_t, py::array::c_style | py::array::forcecast> &consultas,
+               const ArregloValores &radios_km, const ArregloValores &dias_antes, const ArregloValores &dias_despues,
+               int num_hilos, const std::string &planificacion, int tamano_bloque) {
+                const size_t num_consultas = static_cast<size_t>(consultas.size());
+                for (size_t q = 0; q < num_consultas; ++q) {
+                    if (consultas.data()[q] < 0 || static_cast<size_t>(consultas.data()[q]) >= indice.num_eventos()) {
+                        throw std::out_of_range("Índice de evento fuera de rango en consultas");
+                    }
+                }
+                const std::vector<double> radios = por_consulta(radios_km, num_consultas, "radios_km");
+                const std::vector<double> antes = por_consulta(dias_antes, num_consultas, "dias_antes");
+                const std::vector<double> despues = por_consulta(dias_despues, num_consultas, "dias_despues");
+                const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+                VecinosCsr csr;
+                {
+                    py::gil_scoped_release sin_gil;
+                    csr = indice.vecinos_en_lote(consultas.data(), num_consultas, radios.data(),
+                                                 antes.data(), despues.data(), opciones);
+                }
+                return py::make_tuple(a_numpy(csr.inicio), a_numpy(csr.vecinos));
+            },
+            "Para cada evento de 'consultas' busca los eventos a menos de radios_km y con tiempo "
+            "en [t - dias_antes, t + dias_despues]. Los parámetros pueden ser escalares o tener "
+            "uno por consulta. Devuelve (inicio, vecinos) en formato CSR: los vecinos de la "
+            "consulta q son vecinos[inicio[q]:inicio[q + 1]].",
+            py::arg("consultas"),
+            py::arg("radios_km"),
+            py::arg("dias_antes"),
+            py::arg("dias_despues"),
+            py::arg("num_hilos") = 0,
+            py::arg("planificacion") = "dynamic",
+            py::arg("tamano_bloque") = 0
+        )
+        .def(
+            "decluster_gardner_knopoff",
+            [](const IndiceEspacioTemporal &indice, const ArregloValores &magnitudes,
+               int num_hilos, const std::string &planificacion, int tamano_bloque) {
+                if (static_cast<size_t>(magnitudes.size()) != indice.num_eventos()) {
+                    throw std::invalid_argument("magnitudes debe tener un valor por evento del índice");
+                }
+                const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+                std::vector<int32_t> principal;
+                {
+                    py::gil_scoped_release sin_gil;
+                    principal = indice.decluster_gardner_knopoff(magnitudes.data(), opciones);
+                }
+                return a_numpy(principal);
+            },
+            "Declustering de Gardner y Knopoff (1974). Devuelve un arreglo int32 con el índice "
+            "del evento principal de la secuencia de cada evento (el propio índice si es principal).",
+            py::arg("magnitudes"),
+            py::arg("num_hilos") = 0,
+            py::arg("planificacion") = "dynamic",
+            py::arg("tamano_bloque") = 0
+        )
+        .def("__len__", &IndiceEspacioTemporal::num_eventos);
+
+    py::class_<MotorSjoin>(m, "MotorSjoin", R"doc(
+        Motor de spatial join persistente: parsea, prepara e indexa los polígonos una
+        sola vez y los reutiliza en cada llamada a unir(). Se libera con cerrar(), al
+        salir de un bloque 'with' o cuando Python destruye el objeto.
+    )doc")
+        .def(
+            py::init<const std::vector<std::string> &, const std::vector<std::string> &>(),
+            py::arg("wkts_departamentos"),
+            py::arg("nombres_departamentos")
+        )
+        .def_static(
+            "desde_wkb",
+            &motor_desde_wkb_py,
+            "Crea el motor a partir de geometrías WKB (p. ej. shapely.to_wkb(gdf.geometry.values)), "
+            "sin pasar por texto WKT.",
+            py::arg("wkbs_departamentos"),
+            py::arg("nombres_departamentos") = std::vector<std::string>()
+        )
+        .def_static(
+            "cargar",
+            [](const std::string &ruta) {
+                py::gil_scoped_release sin_gil;
+                return MotorSjoin::cargar(ruta);
+            },
+            "Crea el motor a partir de un archivo escrito con guardar(): geometrías en WKB, "
+            "nombres, huella y rejilla. Devuelve None si no existe o está dañado.",
+            py::arg("ruta")
+        )
+        .def("guardar", &MotorSjoin::guardar,
+             "Guarda en un archivo binario las geometrías (WKB), los nombres, la huella y la "
+             "rejilla, para que cargar() reconstruya el motor sin leer el geojson.",
+             py::arg("ruta"), py::call_guard<py::gil_scoped_release>())
+        .def(
+            "unir",
+            &motor_unir_py,
+            "Devuelve un arreglo int32 con el índice del polígono de cada punto (-1 si está fuera). "
+            "num_hilos=0 usa el valor de OpenMP; planificacion es 'static', 'dynamic' o 'guided'. "
+            "Con estadisticas=True devuelve (codigos, dict) con los contadores y tiempos de la llamada.",
+            py::arg("latitudes").noconvert(),
+            py::arg("longitudes").noconvert(),
+            py::arg("num_hilos") = 0,
+            py::arg("planificacion") = "dynamic",
+            py::arg("tamano_bloque") = 0,
+            py::arg("estadisticas") = false
+        )
+        .def(
+            "unir_cercano",
+            &motor_unir_cercano_py,
+            "Como unir(), pero asigna los puntos que quedan fuera al polígono más cercano si "
+            "está a distancia_maxima_km o menos. Devuelve (codigos int32, distancias_km float64): "
+            "0 para los puntos contenidos, la distancia para los asignados por cercanía y NaN "
+            "para los que siguen fuera (-1). Con estadisticas=True se añade un dict como tercer elemento.",
+            py::arg("latitudes").noconvert(),
+            py::arg("longitudes").noconvert(),
+            py::arg("distancia_maxima_km"),
+            py::arg("num_hilos") = 0,
+            py::arg("planificacion") = "dynamic",
+            py::arg("tamano_bloque") = 0,
+            py::arg("estadisticas") = false
+        )
+        .def(
+            "construir_rejilla",
+            [](MotorSjoin &motor, double resolucion, int num_hilos, const std::string &planificacion) {
+                const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, 0);
+                py::gil_scoped_release sin_gil;
+                motor.construir_rejilla(resolucion, opciones);
+            },
+            "Rasteriza los polígonos en una rejilla de 'resolucion' grados. Después unir() "
+            "resuelve con una consulta O(1) los puntos de celdas interiores o exteriores y "
+            "solo usa GEOS en las celdas de frontera (el resultado es el mismo).",
+            py::arg("resolucion"),
+            py::arg("num_hilos") = 0,
+            py::arg("planificacion") = "dynamic"
+        )
+        .def("guardar_rejilla", &MotorSjoin::guardar_rejilla,
+             "Guarda la rejilla raster en un archivo binario.",
+             py::arg("ruta"), py::call_guard<py::gil_scoped_release>())
+        .def("cargar_rejilla", &MotorSjoin::cargar_rejilla,
+             "Carga una rejilla guardada. Devuelve False si no existe, está dañada o "
+             "corresponde a otros polígonos.",
+             py::arg("ruta"), py::call_guard<py::gil_scoped_release>())
+        .def(
+            "procesar_csv",
+            [](const MotorSjoin &motor, const std::string &ruta_csv, const std::string &directorio_salida,
+               size_t filas_por_bloque, int num_hilos, const std::string &planificacion, int tamano_bloque) {
+                const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, tamano_bloque);
+                ResumenCsv resumen;
+                {
+                    py::gil_scoped_release sin_gil;
+                    resumen = motor.procesar_csv(ruta_csv, directorio_salida, filas_por_bloque, opciones);
+                }
+                py::dict resultado;
+                resultado["filas"] = resumen.filas;
+                resultado["bloques"] = resumen.bloques;
+                resultado["fuera_de_peru"] = resumen.fuera_de_peru;
+                resultado["columnas"] = resumen.columnas;
+                return resultado;
+            },
+            "Procesa un CSV por bloques con memoria acotada: escribe en directorio_salida un "
+            "<COLUMNA>.npy (float64) por columna del CSV y DEPARTAMENTO.npy (int32, -1 fuera "
+            "del Perú). Lectura, join y escritura se solapan. Devuelve un resumen en un dict.",
+            py::arg("ruta_csv"),
+            py::arg("directorio_salida"),
+            py::arg("filas_por_bloque") = 1000000,
+            py::arg("num_hilos") = 0,
+            py::arg("planificacion") = "dynamic",
+            py::arg("tamano_bloque") = 0
+        )
+        .def_property_readonly("tiene_rejilla", &MotorSjoin::tiene_rejilla)
+        .def_property_readonly("tiempos_construccion", [](const MotorSjoin &motor) {
+            // Segundos de cada fase de la construcción del motor
+            const TiemposConstruccion &tiempos = motor.tiempos_construccion();
+            py::dict resultado;
+            resultado["lectura"] = tiempos.lectura;
+            resultado["preparacion"] = tiempos.preparacion;
+            resultado["indice"] = tiempos.indice;
+            resultado["rejilla"] = tiempos.rejilla;
+            return resultado;
+        })
+        .def_property_readonly("huella", [](const MotorSjoin &motor) {
+            // En hexadecimal: es lo que se usa para nombrar los archivos de caché.
+            char texto[17];
+            std::snprintf(texto, sizeof(texto), "%016llx", static_cast<unsigned long long>(motor.huella()));
+            return std::string(texto);
+        })
+        .def("cerrar", &MotorSjoin::cerrar, "Libera las geometrías preparadas y el contexto GEOS.",
+             py::call_guard<py::gil_scoped_release>())
+        .def_property_readonly("cerrado", &MotorSjoin::cerrado)
+        .def_property_readonly("nombres", &MotorSjoin::nombres)
+        .def("__len__", &MotorSjoin::num_poligonos)
+        .def("__enter__", [](MotorSjoin &motor) -> MotorSjoin & { return motor; }, py::return_value_policy::reference)
+        .def("__exit__", [](MotorSjoin &motor, py::args) {
+            py::gil_scoped_release sin_gil;
+            motor.cerrar();
+        });
+
+    py::class_<MotorSjoinJerarquico>(m, "MotorSjoinJerarquico", R"doc(
+        Spatial join sobre capas administrativas anidadas (de la más general a la más
+        detallada). El polígono encontrado en una capa limita los candidatos de la
+        siguiente a sus hijos, y todas las capas se resuelven en una sola pasada.
+    )doc")
+        .def(
+            py::init<const std::vector<std::vector<std::string>> &, const std::vector<std::vector<std::string>> &>(),
+            py::arg("wkts_por_capa"),
+            py::arg("nombres_por_capa") = std::vector<std::vector<std::string>>()
+        )
+        .def_static(
+            "desde_wkb",
+            &motor_jerarquico_desde_wkb_py,
+            "Crea el motor a partir de una secuencia de geometrías WKB por capa (p. ej. "
+            "gdf.geometry.to_wkb() de cada capa), sin pasar por texto WKT.",
+            py::arg("wkbs_por_capa"),
+            py::arg("nombres_por_capa") = std::vector<std::vector<std::string>>()
+        )
+        .def(
+            "unir",
+            &motor_jerarquico_unir_py,
+            "Devuelve una lista con un arreglo int32 por capa: el índice del polígono de esa "
+            "capa que contiene cada punto (-1 si está fuera). El resultado es el mismo que "
+            "unir cada capa por separado.",
+            py::arg("latitudes").noconvert(),
+            py::arg("longitudes").noconvert(),
+            py::arg("num_hilos") = 0,
+            py::arg("planificacion") = "dynamic",
+            py::arg("tamano_bloque") = 0
+        )
+        .def(
+            "construir_rejilla",
+            [](MotorSjoinJerarquico &motor, double resolucion, int num_hilos, const std::string &planificacion) {
+                const OpcionesParalelismo opciones = crear_opciones(num_hilos, planificacion, 0);
+                py::gil_scoped_release sin_gil;
+                motor.construir_rejilla(resolucion, opciones);
+            },
+            "Construye la rejilla raster de cada capa (ver MotorSjoin.construir_rejilla).",
+            py::arg("resolucion"),
+            py::arg("num_hilos") = 0,
+            py::arg("planificacion") = "dynamic"
+        )
+        .def("padres", [](const MotorSjoinJerarquico &motor, size_t capa) { return a_numpy(motor.padres(capa)); },
+             "Índice del polígono padre (en la capa anterior) de cada polígono de la capa; -1 si no tiene.",
+             py::arg("capa"))
+        .def("nombres", [](const MotorSjoinJerarquico &motor, size_t capa) { return motor.capa(capa).nombres(); },
+             py::arg("capa"))
+        .def("cerrar", &MotorSjoinJerarquico::cerrar, "Libera las geometrías y contextos GEOS de todas las capas.",
+             py::call_guard<py::gil_scoped_release>())
+        .def_property_readonly("cerrado", &MotorSjoinJerarquico::cerrado)
+        .def("__len__", &MotorSjoinJerarquico::num_capas)
+        .def("__enter__", [](MotorSjoinJerarquico &motor) -> MotorSjoinJerarquico & { return motor; },
+             py::return_value_policy::reference)
+        .def("__exit__", [](MotorSjoinJerarquico &motor, py::args) {
+            py::gil_scoped_release sin_gil;
+            motor.cerrar();
+        });
+}
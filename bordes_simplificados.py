@@ -0,0 +1,59 @@
+"""
+Bordes departamentales simplificados por nivel de zoom.
+
+Para cada zoom del mapa se simplifican los polígonos con una tolerancia de un píxel
+(así el dibujo no cambia a ese zoom) y las coordenadas se redondean a los decimales
+que alcanzan para una décima de píxel. El resultado se guarda como el dict GeoJSON
+que recibe pydeck, de modo que en cada interacción no hay que volver a convertir los
+polígonos completos ni enviar vértices o cifras que no se verían.
+"""
+import geopandas as gpd
+import numpy as np
+import shapely
+
+# Zooms de pydeck para los que se precalculan bordes
+NIVELES_ZOOM = (4, 5, 6, 7, 8, 9, 10)
+# Propiedades que se conservan en el GeoJSON (el resto no se usa en el mapa)
+PROPIEDADES = ["NOMBDEP"]
+
+
+def grados_por_pixel(zoom):
+    """Tamaño aproximado de un píxel en grados (deck.gl usa teselas de 512 px)."""
+    return 360.0 / (512 * 2 ** zoom)
+
+
+def simplificar(geometrias, tolerancia):
+    """
+    Simplifica sin romper la topología. Con shapely >= 2.1 se usa coverage_simplify,
+    que simplifica cada borde compartido una sola vez y no deja huecos ni solapes
+    entre departamentos vecinos; si no, cada polígono por separado.
+    """
+    geometrias = np.asarray(geometrias)
+    if hasattr(shapely, "coverage_simplify"):
+        return shapely.coverage_simplify(geometrias, tolerancia)
+    return shapely.simplify(geometrias, tolerancia, preserve_topology=True)
+
+
+def construir_niveles(departamentos_gdf, niveles=NIVELES_ZOOM):
+    """Devuelve {zoom: GeoJSON (dict)} con los bordes simplificados para cada zoom."""
+    resultado = {}
+    for zoom in niveles:
+        pixel = grados_por_pixel(zoom)
+        # Redondear en decimal (y no a una rejilla de pixel/10) acorta de verdad el JSON.
+        decimales = int(np.ceil(-np.log10(pixel / 10)))
+        geometrias = shapely.transform(
+            simplificar(departamentos_gdf.geometry.values, pixel), lambda xy: np.round(xy, decimales)
+        )
+        simplificados = gpd.GeoDataFrame(departamentos_gdf[PROPIEDADES], geometry=geometrias, crs=departamentos_gdf.crs)
+        resultado[zoom] = simplificados.__geo_interface__
+    return resultado
+
+
+def nivel_para_zoom(niveles, zoom):
+    """
+    El nivel menos detallado cuya tolerancia no supera un píxel al zoom pedido (o el
+    más detallado si el zoom va más allá de los precalculados).
+    """
+    disponibles = sorted(niveles)
+    candidatos = [nivel for nivel in disponibles if nivel >= zoom]
+    return niveles[candidatos[0] if candidatos else disponibles[-1]]
@@ -0,0 +1,342 @@
+"""
+Caché en disco del catálogo sísmico ya enriquecido (departamento, fecha, año, mes...).
+
+Cada columna se guarda como un archivo .npy independiente. En los arranques siguientes
+las columnas se abren con np.load(mmap_mode='r'): el sistema operativo las mapea en
+memoria y no hay que volver a leer el CSV, ni a ejecutar el spatial join, ni a
+convertir fechas.
+
+El catálogo crece por segmentos: cuando el CSV recibe filas nuevas al final, solo esas
+filas (las de ID mayor que la marca de agua guardada) pasan por el join y se escriben
+como un segmento más. El coste de refrescar es proporcional a los eventos nuevos.
+"""
+import hashlib
+import io
+import json
+import os
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from metricas_carga import fase
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Se incrementa cuando cambia qué columnas se guardan o cómo se calculan.
+VERSION_FORMATO = 3
+
+ARCHIVO_METADATOS = "metadatos.json"
+ARCHIVO_ESTADO = "estado.json"
+ARCHIVO_BLOQUEO = ".bloqueo"
+PREFIJO_CATALOGO = "catalogo_"
+PREFIJO_SEGMENTO = "segmento_"
+
+# A partir de cuántos segmentos se fusionan todos en uno solo
+MAX_SEGMENTOS = 8
+
+
+def huella_archivo(ruta, tamano_bloque=1 << 20):
+    """Devuelve el SHA-256 (hexadecimal) del contenido de un archivo."""
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(tamano_bloque), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def clave_cache(rutas, version_motor):
+    """
+    Clave de la caché: hash del contenido de los archivos de entrada, de la versión
+    del motor C++ y de la versión de este formato. Si cualquiera cambia, la clave
+    también cambia y el catálogo se reconstruye.
+    """
+    sha = hashlib.sha256()
+    for ruta in rutas:
+        sha.update(huella_archivo(ruta).encode())
+    sha.update(str(version_motor).encode())
+    sha.update(str(VERSION_FORMATO).encode())
+    return sha.hexdigest()[:20]
+
+
+def ruta_catalogo(directorio_cache, clave):
+    return os.path.join(directorio_cache, f"{PREFIJO_CATALOGO}{clave}")
+
+
+def firma_prefijo(ruta, longitud, tamano_bloque=1 << 20):
+    """
+    SHA-256 de los primeros 'longitud' bytes de un archivo (la parte ya procesada del
+    CSV). Se lee el tramo completo: cualquier fila editada, también en el medio del
+    archivo, cambia la firma. Leerlo cuesta mucho menos que el join que evita repetir.
+    """
+    sha = hashlib.sha256(str(longitud).encode())
+    with open(ruta, "rb") as archivo:
+        restante = longitud
+        while restante > 0:
+            bloque = archivo.read(min(restante, tamano_bloque))
+            if not bloque:
+                break
+            sha.update(bloque)
+            restante -= len(bloque)
+    return sha.hexdigest()
+
+
+def guardar_columnas(directorio, columnas, metadatos=None):
+    """
+    Escribe cada columna (dict nombre -> np.ndarray) como <nombre>.npy junto con un
+    JSON de metadatos. Se escribe primero en una carpeta temporal y luego se renombra,
+    así otro proceso nunca ve un segmento a medio escribir.
+    """
+    temporal = f"{directorio}.tmp{os.getpid()}"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+
+    for nombre, valores in columnas.items():
+        np.save(os.path.join(temporal, f"{nombre}.npy"), np.ascontiguousarray(valores), allow_pickle=False)
+
+    metadatos = dict(metadatos or {}, columnas=list(columnas), num_filas=len(next(iter(columnas.values()), [])))
+    with open(os.path.join(temporal, ARCHIVO_METADATOS), "w", encoding="utf-8") as archivo:
+        json.dump(metadatos, archivo, ensure_ascii=False)
+
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.replace(temporal, directorio)
+
+
+def cargar_columnas(directorio):
+    """
+    Abre un segmento guardado. Devuelve un dict columna -> np.ndarray con cada columna
+    mapeada en memoria y de solo lectura, o None si no existe o está incompleto.
+    """
+    try:
+        with open(os.path.join(directorio, ARCHIVO_METADATOS), encoding="utf-8") as archivo:
+            metadatos = json.load(archivo)
+        return {
+            nombre: np.load(os.path.join(directorio, f"{nombre}.npy"), mmap_mode="r", allow_pickle=False)
+            for nombre in metadatos["columnas"]
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def leer_estado(directorio):
+    try:
+        with open(os.path.join(directorio, ARCHIVO_ESTADO), encoding="utf-8") as archivo:
+            estado = json.load(archivo)
+    except (OSError, ValueError):
+        return None
+    return estado if estado.get("version_formato") == VERSION_FORMATO else None
+
+
+def guardar_estado(directorio, estado):
+    temporal = os.path.join(directorio, f"{ARCHIVO_ESTADO}.tmp{os.getpid()}")
+    with open(temporal, "w", encoding="utf-8") as archivo:
+        json.dump(dict(estado, version_formato=VERSION_FORMATO), archivo, ensure_ascii=False)
+    os.replace(temporal, os.path.join(directorio, ARCHIVO_ESTADO))
+
+
+@contextmanager
+def bloqueo_catalogo(directorio):
+    """Evita que dos procesos del servidor actualicen el mismo catálogo a la vez."""
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, ARCHIVO_BLOQUEO), "w") as archivo:
+        if fcntl is not None:
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(archivo, fcntl.LOCK_UN)
+
+
+def _unir_segmentos(directorio, nombres):
+    """
+    Columnas de los segmentos indicados; None si alguno falta. Siempre son de solo
+    lectura, igual que los arreglos mapeados, porque se comparten entre sesiones.
+    """
+    segmentos = [cargar_columnas(os.path.join(directorio, nombre)) for nombre in nombres]
+    if not segmentos or any(segmento is None for segmento in segmentos):
+        return None
+    if len(segmentos) == 1:
+        return segmentos[0]
+    columnas = {nombre: np.concatenate([segmento[nombre] for segmento in segmentos]) for nombre in segmentos[0]}
+    for valores in columnas.values():
+        valores.flags.writeable = False
+    return columnas
+
+
+def cargar_catalogo(directorio):
+    """
+    Devuelve (columnas, estado) del catálogo: con un solo segmento las columnas son
+    los propios arreglos mapeados en memoria; con varios se concatenan. Devuelve
+    None si el catálogo no existe o alguno de sus segmentos falta.
+    """
+    estado = leer_estado(directorio)
+    if estado is None:
+        return None
+    columnas = _unir_segmentos(directorio, estado["segmentos"])
+    if columnas is None:
+        return None
+    return columnas, estado
+
+
+def _leer_filas_nuevas(ruta_csv, desde_byte):
+    """
+    Lee las filas del CSV a partir de 'desde_byte' (0 o un inicio de línea). Devuelve
+    (DataFrame, byte hasta el que se leyó); sin filas nuevas, el DataFrame está vacío
+    pero tiene las columnas de la cabecera. Una última línea sin salto de línea solo se
+    acepta si ya tiene todos los campos de la cabecera: si no, el archivo puede estar
+    escribiéndose y se deja para la siguiente actualización.
+    """
+    with open(ruta_csv, "rb") as archivo:
+        cabecera = archivo.readline()
+        if not cabecera.strip():
+            raise ValueError(f"El CSV {ruta_csv} está vacío: no tiene cabecera")
+        inicio = max(desde_byte, len(cabecera))
+        archivo.seek(inicio)
+        cola = archivo.read()
+    ultimo_salto = cola.rfind(b"\n") + 1
+    if cola[ultimo_salto:].count(b",") != cabecera.count(b","):
+        cola = cola[:ultimo_salto]
+    fin = inicio + len(cola)
+    if not cola.strip():
+        # Sin filas no hay tipos que inferir: float64 evita columnas de objetos, que
+        # no se pueden guardar como .npy sin pickle
+        return pd.read_csv(io.BytesIO(cabecera)).astype(np.float64), fin
+    return pd.read_csv(io.BytesIO(cabecera + cola)), fin
+
+
+def _nombre_segmento(numero):
+    return f"{PREFIJO_SEGMENTO}{numero:05d}"
+
+
+def actualizar_catalogo(directorio, ruta_csv, enriquecer, metadatos, metricas=None):
+    """
+    Sincroniza el catálogo en disco con el CSV y lo devuelve como (columnas, estado,
+    num_filas_nuevas).
+
+    - Sin catálogo previo, o si el CSV fue reescrito: se procesa el archivo completo.
+    - Si el CSV solo creció: se leen los bytes nuevos, se quedan las filas cuyo ID supera
+      la marca de agua guardada y solo esas pasan por 'enriquecer'.
+    - Si el catálogo guardado no se puede abrir (falta algún segmento), se reconstruye.
+
+    'enriquecer' recibe un DataFrame crudo y devuelve un dict columna -> np.ndarray con
+    las filas ya enriquecidas (puede descartar filas, p. ej. las de fuera del Perú).
+    Si se pasa 'metricas' (MetricasCarga), se miden la lectura del CSV, la escritura
+    de la caché y la apertura del catálogo; las fases de 'enriquecer' las mide él.
+    Lanza RuntimeError si ni siquiera reconstruido se puede abrir el catálogo.
+    (Streamlit no guarda en caché las excepciones: la siguiente ejecución reintenta.)
+    """
+    with bloqueo_catalogo(directorio):
+        catalogo = _sincronizar(directorio, ruta_csv, enriquecer, metadatos, metricas, forzar=False)
+        if catalogo is None:
+            catalogo = _sincronizar(directorio, ruta_csv, enriquecer, metadatos, metricas, forzar=True)
+    if catalogo is None:
+        raise RuntimeError(f"No se pudo abrir el catálogo en {directorio} después de reconstruirlo")
+    return catalogo
+
+
+def _sincronizar(directorio, ruta_csv, enriquecer, metadatos, metricas, forzar):
+    """Cuerpo de actualizar_catalogo(), con el bloqueo ya tomado. Devuelve None si el catálogo no abre."""
+    estado = leer_estado(directorio)
+    tamano_csv = os.path.getsize(ruta_csv)
+
+    reconstruir = (
+        forzar
+        or estado is None
+        or tamano_csv < estado["bytes_procesados"]
+        or firma_prefijo(ruta_csv, estado["bytes_procesados"]) != estado["firma_prefijo"]
+    )
+    if reconstruir:
+        for nombre in os.listdir(directorio):
+            if nombre.startswith(PREFIJO_SEGMENTO):
+                shutil.rmtree(os.path.join(directorio, nombre), ignore_errors=True)
+        estado = dict(metadatos, segmentos=[], id_maximo=None, bytes_procesados=0, siguiente_segmento=0)
+
+    with fase(metricas, "lectura_csv"):
+        filas_nuevas, fin = _leer_filas_nuevas(ruta_csv, estado["bytes_procesados"])
+    if estado["id_maximo"] is not None:
+        filas_nuevas = filas_nuevas[filas_nuevas["ID"] > estado["id_maximo"]]
+
+    num_nuevas = 0
+    segmento_nuevo = False
+    # Un catálogo recién creado siempre tiene al menos un segmento (aunque esté vacío,
+    # p. ej. con un CSV que solo tiene la cabecera)
+    if len(filas_nuevas) or not estado["segmentos"]:
+        if len(filas_nuevas) and estado["id_maximo"] is None:
+            # Los segmentos que haya salen de un CSV sin filas: están vacíos y sus tipos
+            # (float64) no son los del catálogo real, así que se descartan
+            for anterior in estado["segmentos"]:
+                shutil.rmtree(os.path.join(directorio, anterior), ignore_errors=True)
+            estado["segmentos"] = []
+        if len(filas_nuevas):
+            estado["id_maximo"] = int(max(filas_nuevas["ID"].max(), estado["id_maximo"] or 0))
+        columnas = enriquecer(filas_nuevas)
+        num_nuevas = len(next(iter(columnas.values())))
+        if num_nuevas or not estado["segmentos"]:
+            with fase(metricas, "escritura_cache"):
+                columnas = _con_tipos_del_catalogo(directorio, estado, columnas)
+                nombre = _nombre_segmento(estado["siguiente_segmento"])
+                guardar_columnas(os.path.join(directorio, nombre), columnas)
+            estado["segmentos"].append(nombre)
+            estado["siguiente_segmento"] += 1
+            segmento_nuevo = True
+
+    if fin != estado["bytes_procesados"] or reconstruir or segmento_nuevo:
+        with fase(metricas, "escritura_cache"):
+            estado["bytes_procesados"] = fin
+            estado["firma_prefijo"] = firma_prefijo(ruta_csv, fin)
+            if len(estado["segmentos"]) > MAX_SEGMENTOS:
+                _compactar(directorio, estado)
+            guardar_estado(directorio, estado)
+
+    # Se abre todavía con el bloqueo tomado: otro proceso no puede compactar (y borrar)
+    # los segmentos entre la lectura del estado y la apertura.
+    with fase(metricas, "apertura_catalogo"):
+        catalogo = cargar_catalogo(directorio)
+    if metricas is not None:
+        metricas.contar("filas_nuevas", num_nuevas)
+        metricas.contar("catalogo_reconstruido", int(reconstruir))
+    if catalogo is None:
+        return None
+    columnas, estado = catalogo
+    return columnas, estado, num_nuevas
+
+
+def _con_tipos_del_catalogo(directorio, estado, columnas):
+    """Convierte las columnas nuevas a los tipos del primer segmento, para que todos coincidan."""
+    if not estado["segmentos"]:
+        return columnas
+    base = cargar_columnas(os.path.join(directorio, estado["segmentos"][0]))
+    if base is None:
+        return columnas
+    return {nombre: np.asarray(valores).astype(base[nombre].dtype, copy=False) if nombre in base else valores
+            for nombre, valores in columnas.items()}
+
+
+def _compactar(directorio, estado):
+    """Fusiona todos los segmentos en uno para que la carga vuelva a ser un simple mmap."""
+    columnas = _unir_segmentos(directorio, estado["segmentos"])
+    if columnas is None:
+        return
+    nombre = _nombre_segmento(estado["siguiente_segmento"])
+    guardar_columnas(os.path.join(directorio, nombre), columnas)
+    for anterior in estado["segmentos"]:
+        shutil.rmtree(os.path.join(directorio, anterior), ignore_errors=True)
+    estado["segmentos"] = [nombre]
+    estado["siguiente_segmento"] += 1
+
+
+def limpiar_catalogos_antiguos(directorio_cache, clave_vigente):
+    """Borra los catálogos de versiones anteriores para que la caché no crezca sin límite."""
+    if not os.path.isdir(directorio_cache):
+        return
+    for nombre in os.listdir(directorio_cache):
+        # Las carpetas ".tmp" pueden pertenecer a otro proceso que está escribiendo.
+        if not nombre.startswith(PREFIJO_CATALOGO) or ".tmp" in nombre:
+            continue
+        if nombre != f"{PREFIJO_CATALOGO}{clave_vigente}":
+            shutil.rmtree(os.path.join(directorio_cache, nombre), ignore_errors=True)
@@ -0,0 +1,218 @@
+"""
+Cubo de agregación para el mapa por departamentos.
+
+Al cargar el catálogo se acumulan, por departamento × año × bin de magnitud × bin de
+profundidad, la cantidad de sismos y las sumas de latitud, longitud y magnitud. Sobre
+los tres ejes ordenados se guardan sumas prefijas, así que el total de cualquier caja
+de bins completos sale de 8 esquinas (inclusión-exclusión) para todos los
+departamentos a la vez, sin recorrer los eventos.
+
+Los bins que el rango de un filtro corta solo en parte (como mucho dos por eje) se
+resuelven con el camino exacto: se recorren únicamente los eventos de esos bins y se
+les aplica el filtro original. El resultado es el mismo que filtrar el DataFrame con
+between() y agrupar con groupby().
+"""
+import numpy as np
+import pandas as pd
+
+# Estadísticas acumuladas en la última dimensión del cubo
+CANTIDAD, SUMA_LATITUD, SUMA_LONGITUD, SUMA_MAGNITUD = range(4)
+NUM_ESTADISTICAS = 4
+
+# Ancho de los bins de cada eje (el año va de uno en uno: sus filtros siempre son exactos)
+ANCHO_ANIO = 1.0
+ANCHO_MAGNITUD = 0.5
+ANCHO_PROFUNDIDAD = 50.0
+
+
+class EjeBins:
+    """
+    Un eje ordenado del cubo: bordes de los bins, bin de cada evento y los eventos
+    agrupados por bin (en formato CSR) para el camino exacto.
+    """
+
+    def __init__(self, valores, ancho):
+        # Los filtros se comparan en el tipo original de la columna (p. ej. float32),
+        # como hace pandas; internamente el eje trabaja en float64.
+        self.tipo = np.asarray(valores).dtype
+        valores = np.asarray(valores, dtype=np.float64)
+        self.valores = valores
+        origen = np.floor(valores.min() / ancho) * ancho if len(valores) else 0.0
+        maximo = valores.max() if len(valores) else origen
+        num_bins = int((maximo - origen) // ancho) + 1
+        self.bordes = origen + ancho * np.arange(num_bins + 1)
+        # El bin de cada valor se decide comparando con los mismos bordes que usa
+        # rango(), así un redondeo nunca deja un evento fuera de su bin "completo".
+        self.bins = np.clip(np.searchsorted(self.bordes, valores, side="right") - 1, 0, num_bins - 1).astype(np.int32)
+        orden = np.argsort(self.bins, kind="stable")
+        self.orden = orden.astype(np.int32 if len(valores) < 2**31 else np.int64)
+        self.inicio = np.searchsorted(self.bins[orden], np.arange(num_bins + 1))
+
+    @property
+    def num_bins(self):
+        return len(self.bordes) - 1
+
+    def redondear(self, valor):
+        """
+        Lleva un límite de filtro al tipo de la columna. Con float32, between(4.3, ...)
+        compara contra float32(4.3) = 4.3000002; el cubo tiene que hacer lo mismo para
+        dar el mismo resultado que pandas.
+        """
+        if np.issubdtype(self.tipo, np.floating):
+            return float(self.tipo.type(valor))
+        return valor
+
+    def rango(self, minimo, maximo):
+        """
+        Para el filtro minimo <= valor <= maximo devuelve (i0, i1, parciales): los bins
+        [i0, i1) están completamente dentro del rango y 'parciales' son los bins que
+        el rango corta solo en parte.
+        """
+        minimo, maximo = self.redondear(minimo), self.redondear(maximo)
+        if minimo > maximo:
+            return 0, 0, []
+        i0 = int(np.searchsorted(self.bordes, minimo, side="left"))
+        i1 = max(i0, int(np.searchsorted(self.bordes, maximo, side="right")) - 1)
+        i1 = min(i1, self.num_bins)
+        i0 = min(i0, i1)
+        primero = int(np.clip(np.searchsorted(self.bordes, minimo, side="right") - 1, 0, self.num_bins - 1))
+        ultimo = int(np.clip(np.searchsorted(self.bordes, maximo, side="right") - 1, 0, self.num_bins - 1))
+        parciales = [b for b in range(primero, ultimo + 1) if not i0 <= b < i1]
+        return i0, i1, parciales
+
+    def eventos(self, bins):
+        """Índices de los eventos que caen en los bins dados."""
+        if not bins:
+            return np.empty(0, dtype=self.orden.dtype)
+        return np.concatenate([self.orden[self.inicio[b]:self.inicio[b + 1]] for b in bins])
+
+
+class CuboAgregacion:
+    """Agregados por departamento para cualquier rango de año, magnitud y profundidad."""
+
+    def __init__(self, codigos, departamentos, anios, magnitudes, profundidades, latitudes, longitudes):
+        """
+        'codigos' es el índice del departamento de cada evento en 'departamentos'. Los
+        eventos con año, magnitud o profundidad NaN se descartan: ningún filtro
+        between() los incluiría.
+        """
+        anios, magnitudes, profundidades = np.asarray(anios), np.asarray(magnitudes), np.asarray(profundidades)
+        validos = np.isfinite(anios) & np.isfinite(magnitudes) & np.isfinite(profundidades)
+        validos &= np.asarray(codigos) >= 0
+
+        self.departamentos = list(departamentos)
+        self.codigos = np.asarray(codigos)[validos].astype(np.int32)
+        self.estadisticas = np.column_stack([
+            np.ones(int(validos.sum())),
+            np.asarray(latitudes, dtype=np.float64)[validos],
+            np.asarray(longitudes, dtype=np.float64)[validos],
+            np.asarray(magnitudes, dtype=np.float64)[validos],
+        ])
+        self.ejes = [
+            EjeBins(anios[validos], ANCHO_ANIO),
+            EjeBins(magnitudes[validos], ANCHO_MAGNITUD),
+            EjeBins(profundidades[validos], ANCHO_PROFUNDIDAD),
+        ]
+
+        # Cubo denso departamento × año × magnitud × profundidad × estadística,
+        # con un cero delante en cada eje ordenado para las sumas prefijas.
+        forma = (len(self.departamentos),) + tuple(eje.num_bins for eje in self.ejes)
+        celda = np.ravel_multi_index((self.codigos,) + tuple(eje.bins for eje in self.ejes), forma)
+        num_celdas = int(np.prod(forma))
+        cubo = np.stack([
+            np.bincount(celda, weights=self.estadisticas[:, k], minlength=num_celdas)
+            for k in range(NUM_ESTADISTICAS)
+        ], axis=-1).reshape(forma + (NUM_ESTADISTICAS,))
+        for eje in (1, 2, 3):
+            cubo = np.cumsum(cubo, axis=eje)
+        self.acumulado = np.pad(cubo, [(0, 0), (1, 0), (1, 0), (1, 0), (0, 0)])
+
+    @classmethod
+    def desde_catalogo(cls, sismos_df):
+        """Construye el cubo a partir del DataFrame enriquecido que devuelve la carga."""
+        departamento = sismos_df["DEPARTAMENTO"]
+        return cls(
+            departamento.cat.codes.to_numpy(),
+            departamento.cat.categories,
+            sismos_df["AÑO"].to_numpy(),
+            sismos_df["MAGNITUD"].to_numpy(),
+            sismos_df["PROFUNDIDAD"].to_numpy(),
+            sismos_df["LATITUD"].to_numpy(),
+            sismos_df["LONGITUD"].to_numpy(),
+        )
+
+    def limites(self, eje):
+        """(mínimo, máximo) de los valores del eje 0=año, 1=magnitud, 2=profundidad."""
+        valores = self.ejes[eje].valores
+        if not len(valores):
+            return 0.0, 0.0
+        # A través del texto del tipo original: el máximo de float32(8.4) se muestra como
+        # 8.4 y no como 8.3999996, y sigue incluyendo ese evento al filtrar.
+        tipo = self.ejes[eje].tipo.type
+        return float(str(tipo(valores.min()))), float(str(tipo(valores.max())))
+
+    def departamentos_presentes(self):
+        """Nombres de los departamentos que tienen al menos un evento."""
+        return [self.departamentos[j] for j in np.unique(self.codigos)]
+
+    def _suma_caja(self, rangos):
+        """Sumas (departamento × estadística) de la caja de bins completos, con 8 esquinas."""
+        (a0, a1), (m0, m1), (p0, p1) = rangos
+        A = self.acumulado
+        return (
+            A[:, a1, m1, p1] - A[:, a0, m1, p1] - A[:, a1, m0, p1] - A[:, a1, m1, p0]
+            + A[:, a0, m0, p1] + A[:, a0, m1, p0] + A[:, a1, m0, p0] - A[:, a0, m0, p0]
+        )
+
+    def totales(self, rango_anios, rango_magnitud, rango_profundidad):
+        """
+        Devuelve un arreglo (departamento × estadística) con las sumas de los eventos
+        que cumplen los tres filtros (límites inclusivos, como between()).
+        """
+        filtros = [
+            (eje.redondear(minimo), eje.redondear(maximo))
+            for eje, (minimo, maximo) in zip(self.ejes, (rango_anios, rango_magnitud, rango_profundidad))
+        ]
+        rangos = [eje.rango(*filtro) for eje, filtro in zip(self.ejes, filtros)]
+        totales = self._suma_caja([(i0, i1) for i0, i1, _ in rangos])
+
+        # Camino exacto para los bins cortados. Un evento se cuenta en el primer eje
+        # en el que su bin es parcial, para no sumarlo dos veces.
+        for k, (eje, (_, _, parciales)) in enumerate(zip(self.ejes, rangos)):
+            candidatos = eje.eventos(parciales)
+            if not len(candidatos):
+                continue
+            aceptar = np.ones(len(candidatos), dtype=bool)
+            for j, (otro, (minimo, maximo), (i0, i1, _)) in enumerate(zip(self.ejes, filtros, rangos)):
+                valores = otro.valores[candidatos]
+                aceptar &= (valores >= minimo) & (valores <= maximo)
+                if j < k:
+                    bins = otro.bins[candidatos]
+                    aceptar &= (bins >= i0) & (bins < i1)
+            candidatos = candidatos[aceptar]
+            for s in range(NUM_ESTADISTICAS):
+                totales[:, s] += np.bincount(
+                    self.codigos[candidatos], weights=self.estadisticas[candidatos, s],
+                    minlength=len(self.departamentos)
+                )
+        return totales
+
+    def agregar_por_departamento(self, rango_anios, rango_magnitud, rango_profundidad, departamentos=None):
+        """
+        Equivalente a filtrar con between()/isin() y hacer groupby("DEPARTAMENTO") con la
+        media de LATITUD, LONGITUD y MAGNITUD y la cantidad de sismos. 'departamentos'
+        None significa todos. Solo aparecen los departamentos con algún sismo.
+        """
+        totales = self.totales(rango_anios, rango_magnitud, rango_profundidad)
+        seleccion = totales[:, CANTIDAD] > 0
+        if departamentos is not None:
+            seleccion &= np.isin(np.array(self.departamentos, dtype=object), list(departamentos))
+        totales = totales[seleccion]
+        cantidad = totales[:, CANTIDAD]
+        return pd.DataFrame({
+            "DEPARTAMENTO": np.array(self.departamentos, dtype=object)[seleccion],
+            "LATITUD": totales[:, SUMA_LATITUD] / cantidad,
+            "LONGITUD": totales[:, SUMA_LONGITUD] / cantidad,
+            "MAGNITUD": totales[:, SUMA_MAGNITUD] / cantidad,
+            "CANTIDAD_SISMOS": cantidad.astype(np.int64),
+        })
@@ -0,0 +1,218 @@
+#include "gutenberg_richter.h"
+
+#include <omp.h>
+#include <algorithm>
+#include <cmath>
+#include <limits>
+#include <random>
+#include <stdexcept>
+
+namespace {
+
+const double NAN_D = std::numeric_limits<double>::quiet_NaN();
+const double LOG10_E = std::log10(std::exp(1.0));
+
+struct Estimacion {
+    double mc = NAN_D, a = NAN_D, b = NAN_D, sigma_shi_bolt = NAN_D;
+    int64_t sobre_mc = 0;
+};
+
+// Estima Mc, a, b y el error de Shi-Bolt a partir de un histograma de magnitudes
+// (bin k = magnitud m_min + k * delta_m).
+Estimacion estimar(const int64_t *histograma, int num_bins, double m_min, const ParametrosGutenbergRichter &p) {
+    Estimacion e;
+    int k_max = -1;
+    for (int k = 0; k < num_bins; ++k) {
+        if (histograma[k] > 0 && (k_max < 0 || histograma[k] > histograma[k_max])) k_max = k;
+    }
+    if (k_max < 0) return e;
+
+    e.mc = m_min + k_max * p.delta_m + p.correccion_mc;
+    const int k_mc = static_cast<int>(std::llround((e.mc - m_min) / p.delta_m));
+    double suma = 0.0, suma_cuadrados = 0.0;
+    for (int k = std::max(k_mc, 0); k < num_bins; ++k) {
+        const double m = m_min + k * p.delta_m;
+        e.sobre_mc += histograma[k];
+        suma += histograma[k] * m;
+        suma_cuadrados += histograma[k] * m * m;
+    }
+    if (e.sobre_mc < std::max(p.min_eventos, 2)) return e;
+
+    const double n = static_cast<double>(e.sobre_mc);
+    const double media = suma / n;
+    const double denominador = media - (e.mc - p.delta_m / 2.0);
+    if (!(denominador > 0.0)) return e;
+    e.b = LOG10_E / denominador;
+    e.a = std::log10(n) + e.b * e.mc;
+    const double varianza = std::max(0.0, suma_cuadrados - n * media * media) / (n * (n - 1.0));
+    e.sigma_shi_bolt = 2.3 * e.b * e.b * std::sqrt(varianza);
+    return e;
+}
+
+// Desviación estándar de los valores finitos (NaN si hay menos de dos).
+double desviacion(const std::vector<double> &valores) {
+    double suma = 0.0, suma_cuadrados = 0.0;
+    size_t n = 0;
+    for (double v : valores) {
+        if (std::isnan(v)) continue;
+        suma += v;
+        suma_cuadrados += v * v;
+        ++n;
+    }
+    if (n < 2) return NAN_D;
+    const double media = suma / n;
+    return std::sqrt(std::max(0.0, (suma_cuadrados - n * media * media) / (n - 1)));
+}
+
+// splitmix64: deriva semillas independientes para cada (fila, réplica).
+uint64_t mezclar(uint64_t x) {
+    x += 0x9E3779B97F4A7C15ULL;
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EBULL;
+    return x ^ (x >> 31);
+}
+
+}  // namespace
+
+ResultadoGutenbergRichter calcular_gutenberg_richter(
+    const double *magnitudes,
+    const int32_t *grupos,
+    const int32_t *anios,
+    size_t num_eventos,
+    int num_grupos,
+    const ParametrosGutenbergRichter &p,
+    const OpcionesParalelismo &opciones
+) {
+    if (num_grupos < 0) throw std::invalid_argument("num_grupos no puede ser negativo");
+    if (!(p.delta_m > 0.0)) throw std::invalid_argument("delta_m debe ser mayor que cero");
+    if (p.ancho_anios < 0 || p.paso_anios < 1) {
+        throw std::invalid_argument("ancho_anios debe ser >= 0 y paso_anios >= 1");
+    }
+
+    ResultadoGutenbergRichter resultado;
+
+    // Rango de magnitudes y de años de los eventos utilizables
+    double m_min = std::numeric_limits<double>::infinity(), m_max = -m_min;
+    int32_t anio_min = std::numeric_limits<int32_t>::max(), anio_max = std::numeric_limits<int32_t>::min();
+    for (size_t i = 0; i < num_eventos; ++i) {
+        if (std::isnan(magnitudes[i]) || grupos[i] < 0 || grupos[i] >= num_grupos) continue;
+        m_min = std::min(m_min, magnitudes[i]);
+        m_max = std::max(m_max, magnitudes[i]);
+        anio_min = std::min(anio_min, anios[i]);
+        anio_max = std::max(anio_max, anios[i]);
+    }
+    if (m_min > m_max) return resultado;
+
+    // Se redondea el mínimo al bin para que las magnitudes caigan en el centro del bin
+    m_min = std::round(m_min / p.delta_m) * p.delta_m;
+    const int num_bins = static_cast<int>(std::llround((m_max - m_min) / p.delta_m)) + 1;
+    const int num_anios = anio_max - anio_min + 1;
+    const int total_grupos = num_grupos + 1;  // el último reúne todos los eventos
+
+    // Una pasada: histograma por (grupo, año, bin), con un año "cero" delante para
+    // las sumas prefijas a lo largo de los años.
+    const size_t por_anio = static_cast<size_t>(num_bins);
+    const size_t por_grupo = static_cast<size_t>(num_anios + 1) * por_anio;
+    std::vector<int64_t> acumulado(static_cast<size_t>(total_grupos) * por_grupo, 0);
+    for (size_t i = 0; i < num_eventos; ++i) {
+        if (std::isnan(magnitudes[i]) || grupos[i] < 0 || grupos[i] >= num_grupos) continue;
+        const int k = static_cast<int>(std::llround((magnitudes[i] - m_min) / p.delta_m));
+        const size_t desplazamiento = static_cast<size_t>(anios[i] - anio_min + 1) * por_anio + k;
+        acumulado[static_cast<size_t>(grupos[i]) * por_grupo + desplazamiento] += 1;
+        acumulado[static_cast<size_t>(num_grupos) * por_grupo + desplazamiento] += 1;
+    }
+    for (int g = 0; g < total_grupos; ++g) {
+        int64_t *base = acumulado.data() + static_cast<size_t>(g) * por_grupo;
+        for (int t = 1; t <= num_anios; ++t) {
+            for (int k = 0; k < num_bins; ++k) base[t * por_anio + k] += base[(t - 1) * por_anio + k];
+        }
+    }
+
+    // Ventanas [inicio, inicio + ancho - 1]
+    std::vector<int32_t> inicios;
+    const int ancho = p.ancho_anios > 0 ? std::min(p.ancho_anios, num_anios) : num_anios;
+    for (int inicio = anio_min; inicio + ancho - 1 <= anio_max; inicio += p.paso_anios) inicios.push_back(inicio);
+    const size_t num_ventanas = inicios.size();
+    const size_t num_filas = static_cast<size_t>(total_grupos) * num_ventanas;
+
+    resultado.grupo.resize(num_filas);
+    resultado.anio_inicio.resize(num_filas);
+    resultado.anio_fin.resize(num_filas);
+    resultado.num_eventos.resize(num_filas);
+    resultado.num_sobre_mc.resize(num_filas);
+    resultado.mc.resize(num_filas);
+    resultado.valor_a.resize(num_filas);
+    resultado.valor_b.resize(num_filas);
+    resultado.sigma_b_shi_bolt.resize(num_filas);
+    resultado.sigma_b_bootstrap.assign(num_filas, NAN_D);
+    resultado.sigma_mc_bootstrap.assign(num_filas, NAN_D);
+
+    // Histograma de cada fila (grupo, ventana) = diferencia de dos sumas prefijas.
+    std::vector<int64_t> histogramas(num_filas * por_anio);
+    for (size_t fila = 0; fila < num_filas; ++fila) {
+        const int g = static_cast<int>(fila / num_ventanas);
+        const int inicio = inicios[fila % num_ventanas];
+        const int64_t *base = acumulado.data() + static_cast<size_t>(g) * por_grupo;
+        const int64_t *hasta = base + static_cast<size_t>(inicio - anio_min + ancho) * por_anio;
+        const int64_t *desde = base + static_cast<size_t>(inicio - anio_min) * por_anio;
+        int64_t *histograma = histogramas.data() + fila * por_anio;
+        int64_t total = 0;
+        for (int k = 0; k < num_bins; ++k) {
+            histograma[k] = hasta[k] - desde[k];
+            total += histograma[k];
+        }
+        const Estimacion e = estimar(histograma, num_bins, m_min, p);
+        resultado.grupo[fila] = g;
+        resultado.anio_inicio[fila] = inicio;
+        resultado.anio_fin[fila] = inicio + ancho - 1;
+        resultado.num_eventos[fila] = total;
+        resultado.num_sobre_mc[fila] = e.sobre_mc;
+        resultado.mc[fila] = e.mc;
+        resultado.valor_a[fila] = e.a;
+        resultado.valor_b[fila] = e.b;
+        resultado.sigma_b_shi_bolt[fila] = e.sigma_shi_bolt;
+    }
+
+    // Bootstrap: remuestreo multinomial del histograma (binomiales condicionadas bin a
+    // bin), con el mismo número de eventos. Solo en las filas con b estimado.
+    if (p.num_bootstrap > 1) {
+        const int num_hilos = configurar_openmp(opciones);
+        #pragma omp parallel num_threads(num_hilos)
+        {
+            std::vector<int64_t> remuestreo(num_bins);
+            std::vector<double> valores_b(p.num_bootstrap), valores_mc(p.num_bootstrap);
+
+            #pragma omp for schedule(runtime)
+            for (long long fila = 0; fila < static_cast<long long>(num_filas); ++fila) {
+                if (std::isnan(resultado.valor_b[fila])) continue;
+                const int64_t *histograma = histogramas.data() + fila * por_anio;
+                const int64_t total = resultado.num_eventos[fila];
+                for (int r = 0; r < p.num_bootstrap; ++r) {
+                    std::mt19937_64 generador(mezclar(p.semilla ^ mezclar(static_cast<uint64_t>(fila) * 1000003ULL + r)));
+                    int64_t restantes = total, masa_restante = total;
+                    for (int k = 0; k < num_bins; ++k) {
+                        if (restantes == 0 || histograma[k] == 0) {
+                            remuestreo[k] = 0;
+                            continue;
+                        }
+                        const double prob = static_cast<double>(histograma[k]) / masa_restante;
+                        int64_t extraidos = restantes;
+                        if (prob < 1.0) {
+                            std::binomial_distribution<int64_t> binomial(restantes, prob);
+                            extraidos = binomial(generador);
+                        }
+                        remuestreo[k] = extraidos;
+                        restantes -= extraidos;
+                        masa_restante -= histograma[k];
+                    }
+                    const Estimacion e = estimar(remuestreo.data(), num_bins, m_min, p);
+                    valores_b[r] = e.b;
+                    valores_mc[r] = e.mc;
+                }
+                resultado.sigma_b_bootstrap[fila] = desviacion(valores_b);
+                resultado.sigma_mc_bootstrap[fila] = desviacion(valores_mc);
+            }
+        }
+    }
+    return resultado;
+}
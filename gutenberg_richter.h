@@ -0,0 +1,54 @@
+#ifndef GUTENBERG_RICHTER_H
+#define GUTENBERG_RICHTER_H
+
+#include <vector>
+#include <cstddef>
+#include <cstdint>
+
+#include "procesador_sjoin.h"
+
+struct ParametrosGutenbergRichter {
+    int ancho_anios = 0;          // 0 = una sola ventana con todo el período
+    int paso_anios = 1;           // desplazamiento entre ventanas consecutivas
+    double delta_m = 0.1;         // ancho de los bins de magnitud
+    double correccion_mc = 0.2;   // se suma al Mc de máxima curvatura
+    int min_eventos = 50;         // por debajo (sobre Mc) no se estima b
+    int num_bootstrap = 200;
+    uint64_t semilla = 0;
+};
+
+// Una fila por (grupo, ventana). El grupo num_grupos reúne todos los eventos.
+struct ResultadoGutenbergRichter {
+    std::vector<int32_t> grupo;
+    std::vector<int32_t> anio_inicio, anio_fin;  // ventana [inicio, fin] inclusiva
+    std::vector<int64_t> num_eventos;            // todos los de la ventana
+    std::vector<int64_t> num_sobre_mc;
+    std::vector<double> mc, valor_a, valor_b;
+    std::vector<double> sigma_b_shi_bolt;
+    std::vector<double> sigma_b_bootstrap, sigma_mc_bootstrap;
+};
+
+/**
+ * Estadística de Gutenberg-Richter por grupo (p. ej. el código de departamento del
+ * spatial join) y por ventanas deslizantes de años.
+ *
+ * Una sola pasada sobre los eventos llena el histograma de magnitudes de cada
+ * (grupo, año); con sumas prefijas sobre los años se obtiene el de cualquier ventana
+ * sin volver a mirar los eventos. En cada ventana: Mc por máxima curvatura (+ la
+ * corrección), b por máxima verosimilitud (Aki-Utsu, con la corrección de Utsu por el
+ * ancho de bin), su error de Shi y Bolt y la incertidumbre bootstrap de b y Mc
+ * remuestreando el histograma de forma multinomial. Los remuestreos se reparten
+ * entre los hilos de OpenMP y cada uno usa una semilla derivada de (semilla,
+ * fila, réplica), así que el resultado no depende del número de hilos.
+ */
+ResultadoGutenbergRichter calcular_gutenberg_richter(
+    const double *magnitudes,
+    const int32_t *grupos,
+    const int32_t *anios,
+    size_t num_eventos,
+    int num_grupos,
+    const ParametrosGutenbergRichter &parametros,
+    const OpcionesParalelismo &opciones = OpcionesParalelismo()
+);
+
+#endif
@@ -0,0 +1,165 @@
+#ifndef INDICE_ENVOLVENTES_H
+#define INDICE_ENVOLVENTES_H
+
+#include <vector>
+#include <cstdint>
+#include <cstddef>
+#include <cmath>
+#include <algorithm>
+
+// Rectángulo alineado a los ejes (x = longitud, y = latitud).
+struct Envolvente {
+    double min_x, min_y, max_x, max_y;
+
+    bool contiene(double x, double y) const {
+        return x >= min_x && x <= max_x && y >= min_y && y <= max_y;
+    }
+
+    bool intersecta(const Envolvente &otra) const {
+        return otra.min_x <= max_x && otra.max_x >= min_x && otra.min_y <= max_y && otra.max_y >= min_y;
+    }
+};
+
+/**
+ * Rejilla uniforme de envolventes de polígonos.
+ *
+ * Se construye una sola vez sobre la envolvente de la unión de todos los polígonos.
+ * Cada celda guarda (en formato CSR) los índices de los polígonos cuya envolvente la
+ * toca, en orden ascendente, así que recorrer los candidatos conserva el criterio
+ * "el primer polígono que contiene al punto" del recorrido lineal original.
+ */
+class IndiceEnvolventes {
+public:
+    // 'celdas_por_poligono' controla la densidad de la rejilla: con ~4 celdas por
+    // polígono cada celda tiene pocos candidatos sin que la rejilla crezca demasiado.
+    void construir(const std::vector<Envolvente> &envolventes,
+                   const std::vector<bool> &validos,
+                   size_t celdas_por_poligono = 4) {
+        envolventes_ = envolventes;
+        celdas_x_ = celdas_y_ = 0;
+        inicio_celda_.clear();
+        candidatos_.clear();
+
+        bool hay_alguno = false;
+        for (size_t j = 0; j < envolventes.size(); ++j) {
+            if (!validos[j]) continue;
+            const Envolvente &e = envolventes[j];
+            if (!hay_alguno) {
+                union_ = e;
+                hay_alguno = true;
+            } else {
+                union_.min_x = std::min(union_.min_x, e.min_x);
+                union_.min_y = std::min(union_.min_y, e.min_y);
+                union_.max_x = std::max(union_.max_x, e.max_x);
+                union_.max_y = std::max(union_.max_y, e.max_y);
+            }
+        }
+        if (!hay_alguno) return;
+
+        // Rejilla con celdas aproximadamente cuadradas.
+        const double ancho = std::max(union_.max_x - union_.min_x, 1e-9);
+        const double alto = std::max(union_.max_y - union_.min_y, 1e-9);
+        const double total_celdas = static_cast<double>(
+            std::min<size_t>(std::max<size_t>(envolventes.size() * celdas_por_poligono, 1), size_t(1) << 20));
+        const double lado = std::sqrt(ancho * alto / total_celdas);
+        celdas_x_ = std::max(1, static_cast<int>(std::ceil(ancho / lado)));
+        celdas_y_ = std::max(1, static_cast<int>(std::ceil(alto / lado)));
+        ancho_celda_ = ancho / celdas_x_;
+        alto_celda_ = alto / celdas_y_;
+
+        // Primera pasada: contar candidatos por celda; segunda: rellenarlos.
+        const size_t num_celdas = static_cast<size_t>(celdas_x_) * celdas_y_;
+        inicio_celda_.assign(num_celdas + 1, 0);
+        for (int pasada = 0; pasada < 2; ++pasada) {
+            std::vector<uint32_t> posicion;
+            if (pasada == 1) {
+                for (size_t c = 0; c < num_celdas; ++c) inicio_celda_[c + 1] += inicio_celda_[c];
+                candidatos_.resize(inicio_celda_[num_celdas]);
+                posicion.assign(inicio_celda_.begin(), inicio_celda_.end() - 1);
+            }
+            for (size_t j = 0; j < envolventes.size(); ++j) {
+                if (!validos[j]) continue;
+                const Envolvente &e = envolventes[j];
+                const int cx0 = columna(e.min_x), cx1 = columna(e.max_x);
+                const int cy0 = fila(e.min_y), cy1 = fila(e.max_y);
+                for (int cy = cy0; cy <= cy1; ++cy) {
+                    for (int cx = cx0; cx <= cx1; ++cx) {
+                        const size_t c = static_cast<size_t>(cy) * celdas_x_ + cx;
+                        if (pasada == 0) {
+                            ++inicio_celda_[c + 1];
+                        } else {
+                            candidatos_[posicion[c]++] = static_cast<int32_t>(j);
+                        }
+                    }
+                }
+            }
+        }
+    }
+
+    bool vacio() const { return inicio_celda_.empty(); }
+
+    const Envolvente &envolvente_union() const { return union_; }
+
+    const Envolvente &envolvente(int32_t j) const { return envolventes_[j]; }
+
+    /**
+     * Recorre los polígonos cuya envolvente contiene al punto, en orden ascendente,
+     * hasta que 'prueba(j)' devuelva true. Devuelve el índice aceptado o -1.
+     * Los puntos fuera de la envolvente de la unión (o con NaN) se rechazan sin
+     * consultar ningún polígono.
+     */
+    template <typename Prueba>
+    int32_t buscar(double x, double y, Prueba &&prueba) const {
+        if (vacio() || !union_.contiene(x, y)) return -1;
+        const size_t c = static_cast<size_t>(fila(y)) * celdas_x_ + columna(x);
+        for (uint32_t k = inicio_celda_[c]; k < inicio_celda_[c + 1]; ++k) {
+            const int32_t j = candidatos_[k];
+            if (envolventes_[j].contiene(x, y) && prueba(j)) return j;
+        }
+        return -1;
+    }
+
+    /**
+     * Escribe en 'salida' (ordenados y sin repetir) los polígonos cuya envolvente
+     * intersecta el rectángulo dado.
+     */
+    void buscar_en_rectangulo(const Envolvente &rectangulo, std::vector<int32_t> &salida) const {
+        salida.clear();
+        if (vacio() || !union_.intersecta(rectangulo)) return;
+        const int cx0 = columna(rectangulo.min_x), cx1 = columna(rectangulo.max_x);
+        const int cy0 = fila(rectangulo.min_y), cy1 = fila(rectangulo.max_y);
+        for (int cy = cy0; cy <= cy1; ++cy) {
+            for (int cx = cx0; cx <= cx1; ++cx) {
+                const size_t c = static_cast<size_t>(cy) * celdas_x_ + cx;
+                for (uint32_t k = inicio_celda_[c]; k < inicio_celda_[c + 1]; ++k) {
+                    const int32_t j = candidatos_[k];
+                    if (envolventes_[j].intersecta(rectangulo)) salida.push_back(j);
+                }
+            }
+        }
+        std::sort(salida.begin(), salida.end());
+        salida.erase(std::unique(salida.begin(), salida.end()), salida.end());
+    }
+
+private:
+    // Se acota en double antes de convertir a int para que coordenadas muy alejadas
+    // (por ejemplo, rectángulos de búsqueda enormes) no desborden el entero.
+    int columna(double x) const {
+        const double c = std::floor((x - union_.min_x) / ancho_celda_);
+        return static_cast<int>(std::clamp(c, 0.0, static_cast<double>(celdas_x_ - 1)));
+    }
+
+    int fila(double y) const {
+        const double f = std::floor((y - union_.min_y) / alto_celda_);
+        return static_cast<int>(std::clamp(f, 0.0, static_cast<double>(celdas_y_ - 1)));
+    }
+
+    std::vector<Envolvente> envolventes_;
+    Envolvente union_{0.0, 0.0, 0.0, 0.0};
+    int celdas_x_ = 0, celdas_y_ = 0;
+    double ancho_celda_ = 1.0, alto_celda_ = 1.0;
+    std::vector<uint32_t> inicio_celda_;
+    std::vector<int32_t> candidatos_;
+};
+
+#endif
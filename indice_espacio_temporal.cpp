@@ -0,0 +1,215 @@
+#include "indice_espacio_temporal.h"
+
+#include <omp.h>
+#include <algorithm>
+#include <cmath>
+#include <numeric>
+#include <stdexcept>
+
+namespace {
+
+constexpr double RADIO_TIERRA_KM = 6371.0;
+constexpr double KM_POR_GRADO = 111.195;
+constexpr double RADIANES = 3.14159265358979323846 / 180.0;
+// Eventos de cada lote del declustering (acota la memoria de los resultados intermedios)
+constexpr size_t EVENTOS_POR_LOTE = 4096;
+
+double haversine_km(double lat1, double lon1, double lat2, double lon2) {
+    const double dlat = (lat2 - lat1) * RADIANES;
+    const double dlon = (lon2 - lon1) * RADIANES;
+    const double a = std::sin(dlat / 2) * std::sin(dlat / 2)
+        + std::cos(lat1 * RADIANES) * std::cos(lat2 * RADIANES) * std::sin(dlon / 2) * std::sin(dlon / 2);
+    return 2.0 * RADIO_TIERRA_KM * std::asin(std::min(1.0, std::sqrt(a)));
+}
+
+}  // namespace
+
+double distancia_gardner_knopoff_km(double magnitud) {
+    return std::pow(10.0, 0.1238 * magnitud + 0.983);
+}
+
+double dias_gardner_knopoff(double magnitud) {
+    if (magnitud >= 6.5) return std::pow(10.0, 0.032 * magnitud + 2.7389);
+    return std::pow(10.0, 0.5409 * magnitud - 0.547);
+}
+
+IndiceEspacioTemporal::IndiceEspacioTemporal(
+    const double *latitudes,
+    const double *longitudes,
+    const double *tiempos_dias,
+    size_t num_eventos,
+    double celda_grados
+) : latitudes_(latitudes, latitudes + num_eventos),
+    longitudes_(longitudes, longitudes + num_eventos),
+    tiempos_(tiempos_dias, tiempos_dias + num_eventos),
+    celda_(celda_grados) {
+    if (!(celda_grados > 0.0)) throw std::invalid_argument("celda_grados debe ser mayor que cero");
+    if (num_eventos > static_cast<size_t>(INT32_MAX)) throw std::invalid_argument("Demasiados eventos para el índice");
+
+    std::vector<int32_t> validos;
+    double max_lon = 0.0, max_lat = 0.0;
+    for (size_t i = 0; i < num_eventos; ++i) {
+        if (std::isnan(latitudes_[i]) || std::isnan(longitudes_[i]) || std::isnan(tiempos_[i])) continue;
+        if (validos.empty()) {
+            min_lon_ = max_lon = longitudes_[i];
+            min_lat_ = max_lat = latitudes_[i];
+        }
+        min_lon_ = std::min(min_lon_, longitudes_[i]);
+        max_lon = std::max(max_lon, longitudes_[i]);
+        min_lat_ = std::min(min_lat_, latitudes_[i]);
+        max_lat = std::max(max_lat, latitudes_[i]);
+        validos.push_back(static_cast<int32_t>(i));
+    }
+    if (validos.empty()) return;
+
+    celdas_x_ = static_cast<int>((max_lon - min_lon_) / celda_) + 1;
+    celdas_y_ = static_cast<int>((max_lat - min_lat_) / celda_) + 1;
+    const size_t num_celdas = static_cast<size_t>(celdas_x_) * celdas_y_;
+
+    // Orden por (celda, tiempo): así cada celda queda con sus eventos ya ordenados.
+    std::vector<int64_t> celda_de(num_eventos, 0);
+    for (int32_t i : validos) {
+        celda_de[i] = static_cast<int64_t>(fila(latitudes_[i])) * celdas_x_ + columna(longitudes_[i]);
+    }
+    std::sort(validos.begin(), validos.end(), [&](int32_t a, int32_t b) {
+        if (celda_de[a] != celda_de[b]) return celda_de[a] < celda_de[b];
+        if (tiempos_[a] != tiempos_[b]) return tiempos_[a] < tiempos_[b];
+        return a < b;
+    });
+    inicio_celda_.assign(num_celdas + 1, 0);
+    for (int32_t i : validos) ++inicio_celda_[celda_de[i] + 1];
+    std::partial_sum(inicio_celda_.begin(), inicio_celda_.end(), inicio_celda_.begin());
+    eventos_ = std::move(validos);
+    tiempos_ordenados_.resize(eventos_.size());
+    for (size_t k = 0; k < eventos_.size(); ++k) tiempos_ordenados_[k] = tiempos_[eventos_[k]];
+}
+
+int IndiceEspacioTemporal::columna(double lon) const {
+    const double c = std::floor((lon - min_lon_) / celda_);
+    return static_cast<int>(std::clamp(c, 0.0, static_cast<double>(celdas_x_ - 1)));
+}
+
+int IndiceEspacioTemporal::fila(double lat) const {
+    const double f = std::floor((lat - min_lat_) / celda_);
+    return static_cast<int>(std::clamp(f, 0.0, static_cast<double>(celdas_y_ - 1)));
+}
+
+void IndiceEspacioTemporal::vecinos(size_t i, double radio_km, double dias_antes, double dias_despues,
+                                    std::vector<int32_t> &salida) const {
+    if (i >= num_eventos() || inicio_celda_.empty()) return;
+    const double lat = latitudes_[i], lon = longitudes_[i], t = tiempos_[i];
+    if (std::isnan(lat) || std::isnan(lon) || std::isnan(t) || !(radio_km >= 0.0)) return;
+
+    // Caja en grados que contiene el círculo: en longitud se usa el coseno de la
+    // latitud más alejada del ecuador dentro del círculo.
+    const double dlat = radio_km / KM_POR_GRADO;
+    const double lat_extrema = std::min(90.0, std::max(std::fabs(lat - dlat), std::fabs(lat + dlat)));
+    const double coseno = std::cos(lat_extrema * RADIANES);
+    const double dlon = coseno > 1e-6 ? radio_km / (KM_POR_GRADO * coseno) : 360.0;
+    const int cx0 = columna(lon - dlon), cx1 = columna(lon + dlon);
+    const int cy0 = fila(lat - dlat), cy1 = fila(lat + dlat);
+    const double t0 = t - dias_antes, t1 = t + dias_despues;
+
+    const size_t inicio_salida = salida.size();
+    for (int cy = cy0; cy <= cy1; ++cy) {
+        for (int cx = cx0; cx <= cx1; ++cx) {
+            const size_t c = static_cast<size_t>(cy) * celdas_x_ + cx;
+            const auto primero = tiempos_ordenados_.begin() + inicio_celda_[c];
+            const auto ultimo = tiempos_ordenados_.begin() + inicio_celda_[c + 1];
+            for (auto it = std::lower_bound(primero, ultimo, t0); it != ultimo && *it <= t1; ++it) {
+                const int32_t j = eventos_[it - tiempos_ordenados_.begin()];
+                if (static_cast<size_t>(j) == i) continue;
+                if (haversine_km(lat, lon, latitudes_[j], longitudes_[j]) <= radio_km) salida.push_back(j);
+            }
+        }
+    }
+    std::sort(salida.begin() + inicio_salida, salida.end());
+}
+
+VecinosCsr IndiceEspacioTemporal::vecinos_en_lote(
+    const int32_t *consultas,
+    size_t num_consultas,
+    const double *radios_km,
+    const double *dias_antes,
+    const double *dias_despues,
+    const OpcionesParalelismo &opciones
+) const {
+    std::vector<std::vector<int32_t>> resultados(num_consultas);
+    const int num_hilos = configurar_openmp(opciones);
+
+    // El coste de cada consulta depende de la densidad de la zona y del tamaño de la
+    // ventana, por eso conviene la planificación dinámica (la predeterminada).
+    #pragma omp parallel for num_threads(num_hilos) schedule(runtime)
+    for (long long q = 0; q < static_cast<long long>(num_consultas); ++q) {
+        const int32_t i = consultas[q];
+        if (i < 0) continue;
+        vecinos(static_cast<size_t>(i), radios_km[q], dias_antes[q], dias_despues[q], resultados[q]);
+    }
+
+    VecinosCsr csr;
+    csr.inicio.assign(num_consultas + 1, 0);
+    for (size_t q = 0; q < num_consultas; ++q) csr.inicio[q + 1] = csr.inicio[q] + resultados[q].size();
+    csr.vecinos.resize(static_cast<size_t>(csr.inicio[num_consultas]));
+    for (size_t q = 0; q < num_consultas; ++q) {
+        std::copy(resultados[q].begin(), resultados[q].end(), csr.vecinos.begin() + csr.inicio[q]);
+        std::vector<int32_t>().swap(resultados[q]);
+    }
+    return csr;
+}
+
+std::vector<int32_t> IndiceEspacioTemporal::decluster_gardner_knopoff(
+    const double *magnitudes,
+    const OpcionesParalelismo &opciones
+) const {
+    const size_t n = num_eventos();
+    std::vector<int32_t> principal(n, -1);
+
+    // Eventos con magnitud, de mayor a menor (a igual magnitud, el más antiguo primero)
+    std::vector<int32_t> orden;
+    orden.reserve(n);
+    for (size_t i = 0; i < n; ++i) {
+        if (std::isnan(magnitudes[i])) {
+            principal[i] = static_cast<int32_t>(i);
+        } else {
+            orden.push_back(static_cast<int32_t>(i));
+        }
+    }
+    std::sort(orden.begin(), orden.end(), [&](int32_t a, int32_t b) {
+        if (magnitudes[a] != magnitudes[b]) return magnitudes[a] > magnitudes[b];
+        if (tiempos_[a] != tiempos_[b]) return tiempos_[a] < tiempos_[b];
+        return a < b;
+    });
+
+    // Por lotes: las ventanas del lote se consultan en paralelo y después se asignan en
+    // orden de magnitud. Un evento del lote que ya fue absorbido por otro mayor no se
+    // consulta (su resultado no se usaría).
+    std::vector<int32_t> consultas;
+    std::vector<double> radios, antes, despues;
+    for (size_t inicio = 0; inicio < orden.size(); inicio += EVENTOS_POR_LOTE) {
+        const size_t fin = std::min(orden.size(), inicio + EVENTOS_POR_LOTE);
+        consultas.clear();
+        radios.clear();
+        antes.clear();
+        despues.clear();
+        for (size_t k = inicio; k < fin; ++k) {
+            const int32_t i = orden[k];
+            consultas.push_back(principal[i] == -1 ? i : -1);
+            radios.push_back(distancia_gardner_knopoff_km(magnitudes[i]));
+            antes.push_back(0.0);
+            despues.push_back(dias_gardner_knopoff(magnitudes[i]));
+        }
+        const VecinosCsr lote = vecinos_en_lote(
+            consultas.data(), consultas.size(), radios.data(), antes.data(), despues.data(), opciones);
+
+        for (size_t q = 0; q < consultas.size(); ++q) {
+            const int32_t i = orden[inicio + q];
+            if (principal[i] != -1) continue;
+            principal[i] = i;
+            for (int64_t k = lote.inicio[q]; k < lote.inicio[q + 1]; ++k) {
+                const int32_t j = lote.vecinos[k];
+                if (principal[j] == -1 && magnitudes[j] <= magnitudes[i]) principal[j] = i;
+            }
+        }
+    }
+    return principal;
+}
@@ -0,0 +1,90 @@
+#ifndef INDICE_ESPACIO_TEMPORAL_H
+#define INDICE_ESPACIO_TEMPORAL_H
+
+#include <vector>
+#include <cstddef>
+#include <cstdint>
+
+#include "procesador_sjoin.h"
+
+// Resultado de una consulta en lote, en formato CSR: los vecinos de la consulta q son
+// vecinos[inicio[q] .. inicio[q + 1]).
+struct VecinosCsr {
+    std::vector<int64_t> inicio;
+    std::vector<int32_t> vecinos;
+};
+
+/**
+ * Índice espacio-temporal de eventos sísmicos.
+ *
+ * Una rejilla uniforme en longitud/latitud donde cada celda guarda sus eventos
+ * ordenados por tiempo. Una consulta "eventos a menos de R km y dentro de una ventana
+ * de días alrededor del evento i" visita solo las celdas que cubren el círculo y, en
+ * cada una, el tramo de la ventana de tiempo (búsqueda binaria); la distancia exacta
+ * se comprueba con haversine. Los eventos con coordenadas o tiempo NaN no se indexan.
+ * No se contempla el cruce del antimeridiano (no hace falta para el Perú).
+ */
+class IndiceEspacioTemporal {
+public:
+    // 'tiempos_dias' es cualquier escala en días (p. ej. días desde 1970). Los arreglos
+    // se copian: el índice no depende de la memoria del llamador.
+    IndiceEspacioTemporal(
+        const double *latitudes,
+        const double *longitudes,
+        const double *tiempos_dias,
+        size_t num_eventos,
+        double celda_grados = 0.5
+    );
+
+    size_t num_eventos() const { return latitudes_.size(); }
+
+    // Añade a 'salida' los eventos j != i con distancia <= radio_km y
+    // tiempo_i - dias_antes <= tiempo_j <= tiempo_i + dias_despues, en orden ascendente.
+    void vecinos(size_t i, double radio_km, double dias_antes, double dias_despues,
+                 std::vector<int32_t> &salida) const;
+
+    // La misma consulta para muchos eventos a la vez, en paralelo. Cada consulta tiene
+    // sus propios radio y ventana.
+    VecinosCsr vecinos_en_lote(
+        const int32_t *consultas,
+        size_t num_consultas,
+        const double *radios_km,
+        const double *dias_antes,
+        const double *dias_despues,
+        const OpcionesParalelismo &opciones = OpcionesParalelismo()
+    ) const;
+
+    /**
+     * Declustering por ventanas de Gardner y Knopoff (1974). Se recorren los eventos de
+     * mayor a menor magnitud; cada evento aún sin asignar abre una secuencia y se queda
+     * con los eventos de magnitud menor o igual que caen dentro de L(M) km y de los
+     * T(M) días siguientes:
+     *   L = 10^(0.1238 M + 0.983) km
+     *   T = 10^(0.032 M + 2.7389) días si M >= 6.5, si no 10^(0.5409 M - 0.547)
+     * Devuelve, para cada evento, el índice del evento principal de su secuencia (el
+     * propio índice si es un evento principal). Las consultas se hacen en paralelo por
+     * lotes de eventos ordenados por magnitud.
+     */
+    std::vector<int32_t> decluster_gardner_knopoff(
+        const double *magnitudes,
+        const OpcionesParalelismo &opciones = OpcionesParalelismo()
+    ) const;
+
+private:
+    int columna(double lon) const;
+    int fila(double lat) const;
+
+    std::vector<double> latitudes_, longitudes_, tiempos_;
+    double min_lon_ = 0.0, min_lat_ = 0.0, celda_ = 1.0;
+    int celdas_x_ = 0, celdas_y_ = 0;
+    // CSR celda -> eventos ordenados por tiempo (con sus tiempos al lado para la búsqueda)
+    std::vector<int64_t> inicio_celda_;
+    std::vector<int32_t> eventos_;
+    std::vector<double> tiempos_ordenados_;
+};
+
+// Ventanas de Gardner y Knopoff para una magnitud.
+double distancia_gardner_knopoff_km(double magnitud);
+double dias_gardner_knopoff(double magnitud);
+
+#endif
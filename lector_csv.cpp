@@ -0,0 +1,143 @@
+#include "lector_csv.h"
+
+#include <cmath>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <limits>
+#include <stdexcept>
+
+// Separa una línea del CSV en campos, quitando las comillas que los rodean.
+// Las comillas dobles ("") dentro de un campo entrecomillado se leen como una sola.
+static void separar_campos(const std::string &linea, std::vector<std::string> &campos) {
+    campos.clear();
+    std::string campo;
+    bool entre_comillas = false;
+    for (size_t i = 0; i < linea.size(); ++i) {
+        const char c = linea[i];
+        if (entre_comillas) {
+            if (c == '"' && i + 1 < linea.size() && linea[i + 1] == '"') {
+                campo.push_back('"');
+                ++i;
+            } else if (c == '"') {
+                entre_comillas = false;
+            } else {
+                campo.push_back(c);
+            }
+        } else if (c == '"') {
+            entre_comillas = true;
+        } else if (c == ',') {
+            campos.push_back(campo);
+            campo.clear();
+        } else if (c != '\r') {
+            campo.push_back(c);
+        }
+    }
+    campos.push_back(campo);
+}
+
+// Convierte un campo a double; vacío o no numérico -> NaN.
+static double a_numero(const char *inicio, const char *fin) {
+    while (inicio < fin && (*inicio == ' ' || *inicio == '"')) ++inicio;
+    if (inicio == fin) return std::numeric_limits<double>::quiet_NaN();
+    char *final_numero = nullptr;
+    const double valor = std::strtod(inicio, &final_numero);
+    return final_numero == inicio ? std::numeric_limits<double>::quiet_NaN() : valor;
+}
+
+LectorCsvBloques::LectorCsvBloques(const std::string &ruta) : buffer_(1 << 20) {
+    archivo_.rdbuf()->pubsetbuf(buffer_.data(), static_cast<std::streamsize>(buffer_.size()));
+    archivo_.open(ruta, std::ios::binary);
+    if (!archivo_) throw std::runtime_error("No se pudo abrir el CSV " + ruta);
+    if (!std::getline(archivo_, linea_)) throw std::runtime_error("El CSV " + ruta + " está vacío");
+    separar_campos(linea_, columnas_);
+}
+
+int LectorCsvBloques::indice_columna(const std::string &nombre) const {
+    for (size_t k = 0; k < columnas_.size(); ++k) {
+        if (columnas_[k] == nombre) return static_cast<int>(k);
+    }
+    return -1;
+}
+
+bool LectorCsvBloques::leer_bloque(size_t max_filas, BloqueCsv &bloque) {
+    const size_t num_columnas = columnas_.size();
+    bloque.columnas.resize(num_columnas);
+    for (auto &columna : bloque.columnas) {
+        columna.clear();
+        columna.reserve(max_filas);
+    }
+    bloque.filas = 0;
+
+    while (bloque.filas < max_filas && std::getline(archivo_, linea_)) {
+        if (linea_.empty() || linea_ == "\r") continue;
+
+        // Recorrido rápido: los campos numéricos no contienen comas, así que basta con
+        // cortar en cada coma que no esté entre comillas.
+        const char *p = linea_.data();
+        const char *fin_linea = p + linea_.size();
+        if (fin_linea > p && fin_linea[-1] == '\r') --fin_linea;
+        size_t k = 0;
+        const char *inicio_campo = p;
+        bool entre_comillas = false;
+        for (; p <= fin_linea; ++p) {
+            if (p < fin_linea && *p == '"') {
+                entre_comillas = !entre_comillas;
+            } else if (p == fin_linea || (*p == ',' && !entre_comillas)) {
+                if (k < num_columnas) bloque.columnas[k].push_back(a_numero(inicio_campo, p));
+                ++k;
+                inicio_campo = p + 1;
+            }
+        }
+        // Filas con menos campos que la cabecera: lo que falta es NaN.
+        for (; k < num_columnas; ++k) bloque.columnas[k].push_back(std::numeric_limits<double>::quiet_NaN());
+        ++bloque.filas;
+    }
+    return bloque.filas > 0;
+}
+
+// Espacio fijo para la cabecera .npy (múltiplo de 64, como hace NumPy).
+static constexpr size_t TAMANO_CABECERA_NPY = 128;
+
+EscritorNpy::EscritorNpy(const std::string &ruta, const std::string &descr, size_t tamano_elemento)
+    : archivo_(ruta, std::ios::binary | std::ios::trunc), ruta_(ruta), descr_(descr), tamano_elemento_(tamano_elemento) {
+    if (!archivo_) throw std::runtime_error("No se pudo crear " + ruta);
+    escribir_cabecera();
+}
+
+EscritorNpy::~EscritorNpy() {
+    try {
+        cerrar();
+    } catch (...) {
+        // Un destructor no debe lanzar; el error ya se habrá visto en cerrar() explícito.
+    }
+}
+
+void EscritorNpy::escribir_cabecera() {
+    std::string diccionario = "{'descr': '" + descr_ + "', 'fortran_order': False, 'shape': ("
+        + std::to_string(num_elementos_) + ",), }";
+    const size_t relleno = TAMANO_CABECERA_NPY - 10 - diccionario.size() - 1;
+    diccionario.append(relleno, ' ');
+    diccionario.push_back('\n');
+
+    const uint16_t longitud = static_cast<uint16_t>(diccionario.size());
+    archivo_.seekp(0);
+    archivo_.write("\x93NUMPY\x01\x00", 8);
+    archivo_.put(static_cast<char>(longitud & 0xFF));
+    archivo_.put(static_cast<char>(longitud >> 8));
+    archivo_.write(diccionario.data(), static_cast<std::streamsize>(diccionario.size()));
+}
+
+void EscritorNpy::escribir(const void *datos, size_t num_elementos) {
+    archivo_.write(static_cast<const char *>(datos), static_cast<std::streamsize>(num_elementos * tamano_elemento_));
+    if (!archivo_) throw std::runtime_error("Error al escribir " + ruta_);
+    num_elementos_ += num_elementos;
+}
+
+void EscritorNpy::cerrar() {
+    if (cerrado_) return;
+    cerrado_ = true;
+    escribir_cabecera();
+    archivo_.close();
+    if (!archivo_) throw std::runtime_error("Error al cerrar " + ruta_);
+}
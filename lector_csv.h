@@ -0,0 +1,68 @@
+#ifndef LECTOR_CSV_H
+#define LECTOR_CSV_H
+
+#include <cstddef>
+#include <fstream>
+#include <string>
+#include <vector>
+
+// Un bloque de filas del CSV, guardado por columnas (todas como double).
+struct BloqueCsv {
+    std::vector<std::vector<double>> columnas;
+    size_t filas = 0;
+};
+
+/**
+ * Lee un CSV numérico por bloques de filas, sin cargarlo entero en memoria.
+ *
+ * La primera línea es la cabecera. Los campos pueden ir entre comillas (como en
+ * Dataset_1960_2023_sismo.csv); los valores vacíos o no numéricos se leen como NaN.
+ */
+class LectorCsvBloques {
+public:
+    explicit LectorCsvBloques(const std::string &ruta);
+
+    const std::vector<std::string> &nombres_columnas() const { return columnas_; }
+
+    // Posición de la columna en la cabecera, o -1 si no existe.
+    int indice_columna(const std::string &nombre) const;
+
+    // Llena 'bloque' con hasta 'max_filas' filas. Devuelve false si ya no quedaban.
+    bool leer_bloque(size_t max_filas, BloqueCsv &bloque);
+
+private:
+    std::ifstream archivo_;
+    std::vector<char> buffer_;
+    std::vector<std::string> columnas_;
+    std::string linea_;
+};
+
+/**
+ * Escribe un arreglo 1D en formato .npy de forma incremental. La cabecera se
+ * reserva con espacio fijo y se reescribe al cerrar con el número final de
+ * elementos, así que el archivo resultante se puede abrir con np.load(mmap_mode='r').
+ */
+class EscritorNpy {
+public:
+    // 'descr' es el tipo de NumPy en orden little-endian, p. ej. "<f8" o "<i4".
+    EscritorNpy(const std::string &ruta, const std::string &descr, size_t tamano_elemento);
+    ~EscritorNpy();
+
+    EscritorNpy(const EscritorNpy &) = delete;
+    EscritorNpy &operator=(const EscritorNpy &) = delete;
+
+    void escribir(const void *datos, size_t num_elementos);
+    void cerrar();
+
+private:
+    void escribir_cabecera();
+
+    std::ofstream archivo_;
+    std::string ruta_;
+    std::string descr_;
+    size_t tamano_elemento_;
+    size_t num_elementos_ = 0;
+    bool cerrado_ = false;
+};
+
+#endif
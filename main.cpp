@@ -1,8 +1,11 @@
 // main.cpp
 #include <iostream>
+#include <fstream>
 #include <vector>
 #include <string>
 #include <utility>
+#include <chrono>
+#include <cstdlib>
 #include "procesador_sjoin.h" // Incluimos la declaración de nuestra función
 
 // Declaramos la función que está definida en procesador_sjoin.cpp
@@ -13,7 +16,72 @@ std::vector<std::string> realizar_sjoin_paralelo(
     const std::vector<std::string> &nombres_departamentos
 );
 
-int main() {
+// Segundos transcurridos desde 'inicio'.
+static double segundos_desde(std::chrono::steady_clock::time_point inicio) {
+    return std::chrono::duration<double>(std::chrono::steady_clock::now() - inicio).count();
+}
+
+/**
+ * Modo de medición (lo usa benchmark_sjoin.py):
+ *   main <motor.bin> <puntos.bin> <codigos.bin> [num_hilos]
+ * <motor.bin> es un archivo de MotorSjoin::guardar(); <puntos.bin> tiene N latitudes
+ * seguidas de N longitudes en float64 y en <codigos.bin> se escriben N códigos int32.
+ * Imprime una línea JSON con los tiempos de cada fase.
+ */
+static int medir(int argc, char *argv[]) {
+    OpcionesParalelismo opciones;
+    if (argc > 4) opciones.num_hilos = std::atoi(argv[4]);
+
+    auto inicio = std::chrono::steady_clock::now();
+    std::unique_ptr<MotorSjoin> motor = MotorSjoin::cargar(argv[1]);
+    if (!motor) {
+        std::cerr << "No se pudo cargar el motor desde " << argv[1] << std::endl;
+        return 1;
+    }
+    const double tiempo_preparacion = segundos_desde(inicio);
+
+    inicio = std::chrono::steady_clock::now();
+    std::ifstream entrada(argv[2], std::ios::binary | std::ios::ate);
+    if (!entrada) {
+        std::cerr << "No se pudo abrir " << argv[2] << std::endl;
+        return 1;
+    }
+    const size_t num_puntos = static_cast<size_t>(entrada.tellg()) / (2 * sizeof(double));
+    entrada.seekg(0);
+    std::vector<double> latitudes(num_puntos), longitudes(num_puntos);
+    entrada.read(reinterpret_cast<char *>(latitudes.data()), static_cast<std::streamsize>(num_puntos * sizeof(double)));
+    entrada.read(reinterpret_cast<char *>(longitudes.data()), static_cast<std::streamsize>(num_puntos * sizeof(double)));
+    const double tiempo_lectura = segundos_desde(inicio);
+
+    inicio = std::chrono::steady_clock::now();
+    std::vector<int32_t> codigos(num_puntos);
+    motor->unir(latitudes.data(), longitudes.data(), num_puntos, codigos.data(), opciones);
+    const double tiempo_union = segundos_desde(inicio);
+
+    inicio = std::chrono::steady_clock::now();
+    std::ofstream salida(argv[3], std::ios::binary | std::ios::trunc);
+    salida.write(reinterpret_cast<const char *>(codigos.data()), static_cast<std::streamsize>(num_puntos * sizeof(int32_t)));
+    if (!entrada || !salida) {
+        std::cerr << "Error de lectura o escritura" << std::endl;
+        return 1;
+    }
+    const double tiempo_escritura = segundos_desde(inicio);
+
+    std::cout << "{\"puntos\": " << num_puntos
+              << ", \"preparacion_s\": " << tiempo_preparacion
+              << ", \"lectura_s\": " << tiempo_lectura
+              << ", \"union_s\": " << tiempo_union
+              << ", \"escritura_s\": " << tiempo_escritura << "}" << std::endl;
+    return 0;
+}
+
+int main(int argc, char *argv[]) {
+    if (argc >= 4) return medir(argc, argv);
+    if (argc > 1) {
+        std::cerr << "Uso: " << argv[0] << " [<motor.bin> <puntos.bin> <codigos.bin> [num_hilos]]" << std::endl;
+        return 1;
+    }
+
     // --- 1. Preparamos datos de prueba ---
     // Sismos de prueba (latitud, longitud)
     std::vector<std::pair<double, double>> coords_sismos = {
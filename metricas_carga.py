@@ -0,0 +1,129 @@
+"""
+Tiempos por fase y contadores de la carga del catálogo.
+
+La carga pasa por varias etapas (lectura del CSV, motor C++, spatial join, fechas,
+escritura de la caché, construcción del DataFrame...). MetricasCarga mide cada una
+para poder ver cuál se llevó el tiempo cuando el arranque se vuelve lento, guarda las
+estadísticas del motor C++ y se exporta en JSON o en el formato de texto de Prometheus
+(apto para el recolector de archivos de texto de node_exporter).
+
+    metricas = MetricasCarga()
+    with metricas.fase("lectura_csv"):
+        ...
+    metricas.a_prometheus()
+"""
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+
+# Prefijo de las métricas exportadas a Prometheus
+PREFIJO_PROMETHEUS = "catalogo_sismico"
+
+
+class MetricasCarga:
+    """Acumula segundos por fase (en el orden en que se ejecutan) y contadores."""
+
+    def __init__(self):
+        self.fases = {}
+        self.contadores = {}
+        # Estadísticas de cada llamada al motor C++ y tiempos de construcción del motor
+        self.uniones = []
+        self.construccion_motor = {}
+        self._inicio = time.perf_counter()
+        self._fin = None
+
+    @contextmanager
+    def fase(self, nombre):
+        """Mide el bloque 'with'. Si una fase se repite, sus tiempos se suman."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.fases[nombre] = self.fases.get(nombre, 0.0) + time.perf_counter() - inicio
+
+    def contar(self, nombre, valor=1):
+        self.contadores[nombre] = self.contadores.get(nombre, 0) + valor
+
+    def registrar_union(self, estadisticas):
+        """Guarda el dict que devuelve MotorSjoin.unir(..., estadisticas=True)."""
+        self.uniones.append(dict(estadisticas))
+
+    def terminar(self):
+        """Fija el tiempo total (desde la creación del objeto)."""
+        self._fin = time.perf_counter()
+
+    @property
+    def tiempo_total(self):
+        return (self._fin or time.perf_counter()) - self._inicio
+
+    def a_dict(self):
+        return {
+            "tiempo_total_s": self.tiempo_total,
+            "fases_s": dict(self.fases),
+            "contadores": dict(self.contadores),
+            "construccion_motor_s": dict(self.construccion_motor),
+            "uniones": list(self.uniones),
+        }
+
+    def a_json(self, **opciones):
+        return json.dumps(self.a_dict(), ensure_ascii=False, **opciones)
+
+    def a_prometheus(self, prefijo=PREFIJO_PROMETHEUS):
+        """Texto en el formato de exposición de Prometheus (todas las métricas son gauges)."""
+        lineas = []
+
+        def metrica(nombre, ayuda, muestras):
+            lineas.append(f"# HELP {prefijo}_{nombre} {ayuda}")
+            lineas.append(f"# TYPE {prefijo}_{nombre} gauge")
+            for etiquetas, valor in muestras:
+                texto = ",".join(f'{clave}="{_escapar(valor_etiqueta)}"' for clave, valor_etiqueta in etiquetas.items())
+                lineas.append(f"{prefijo}_{nombre}{{{texto}}} {float(valor):.9g}" if texto
+                              else f"{prefijo}_{nombre} {float(valor):.9g}")
+
+        metrica("carga_segundos", "Duración total de la última carga del catálogo.", [({}, self.tiempo_total)])
+        metrica("carga_fase_segundos", "Duración de cada fase de la carga del catálogo.",
+                [({"fase": fase}, segundos) for fase, segundos in self.fases.items()])
+        if self.contadores:
+            metrica("carga_contador", "Contadores de la última carga del catálogo.",
+                    [({"nombre": nombre}, valor) for nombre, valor in self.contadores.items()])
+        if self.construccion_motor:
+            metrica("motor_construccion_segundos", "Duración de cada fase de la construcción del motor C++.",
+                    [({"fase": fase}, segundos) for fase, segundos in self.construccion_motor.items()])
+        if self.uniones:
+            totales = {}
+            for estadisticas in self.uniones:
+                for clave, valor in estadisticas.items():
+                    if not isinstance(valor, list):
+                        totales[clave] = totales.get(clave, 0) + valor
+            segundos = totales.pop("segundos", 0.0)
+            metrica("motor_union_segundos", "Tiempo de pared de los spatial joins de la carga.", [({}, segundos)])
+            metrica("motor_union", "Contadores de los spatial joins de la carga.",
+                    [({"contador": clave}, valor) for clave, valor in totales.items()])
+            metrica("motor_union_puntos_por_hilo", "Puntos procesados por cada hilo de OpenMP (último join).",
+                    [({"hilo": str(hilo)}, puntos) for hilo, puntos in enumerate(self.uniones[-1]["puntos_por_hilo"])])
+            metrica("motor_union_segundos_por_hilo", "Segundos de trabajo de cada hilo de OpenMP (último join).",
+                    [({"hilo": str(hilo)}, s) for hilo, s in enumerate(self.uniones[-1]["segundos_por_hilo"])])
+        return "\n".join(lineas) + "\n"
+
+    def exportar(self, directorio, nombre="metricas_carga"):
+        """
+        Escribe <nombre>.json y <nombre>.prom en 'directorio'. Se escriben en un temporal
+        y se renombran, para que el recolector de Prometheus nunca lea un archivo a medias.
+        """
+        os.makedirs(directorio, exist_ok=True)
+        for extension, contenido in (("json", self.a_json(indent=2)), ("prom", self.a_prometheus())):
+            ruta = os.path.join(directorio, f"{nombre}.{extension}")
+            temporal = f"{ruta}.tmp{os.getpid()}"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                archivo.write(contenido)
+            os.replace(temporal, ruta)
+
+
+def fase(metricas, nombre):
+    """metricas.fase(nombre), o un contexto vacío si no se están midiendo métricas."""
+    return metricas.fase(nombre) if metricas is not None else nullcontext()
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
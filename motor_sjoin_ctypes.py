@@ -1,6 +1,8 @@
 import ctypes
 import os
 
+import numpy as np
+
 # --- 1. Cargar la biblioteca C++ compilada (.so) ---
 try:
     # Construir la ruta absoluta a la biblioteca
@@ -25,10 +27,25 @@ sjoin_lib.procesar_sismos_c.argtypes = [
     ctypes.POINTER(ctypes.c_char_p),
     ctypes.c_int
 ]
-sjoin_lib.procesar_sismos_c.restype = ctypes.c_char_p
+# c_void_p (y no c_char_p): con c_char_p ctypes devuelve una copia en bytes y se
+# pierde el puntero original que hay que liberar
+sjoin_lib.procesar_sismos_c.restype = ctypes.c_void_p
+
+# Variante WKB: coordenadas float64, polígonos WKB y códigos int32 escritos en un
+# arreglo del llamador (sin cadenas intermedias)
+sjoin_lib.procesar_sismos_wkb_c.argtypes = [
+    ctypes.POINTER(ctypes.c_double),
+    ctypes.POINTER(ctypes.c_double),
+    ctypes.c_int,
+    ctypes.POINTER(ctypes.c_char_p),
+    ctypes.POINTER(ctypes.c_size_t),
+    ctypes.c_int,
+    ctypes.POINTER(ctypes.c_int32)
+]
+sjoin_lib.procesar_sismos_wkb_c.restype = ctypes.c_int
 
 # Firma de la función que libera la memoria en C++
-sjoin_lib.liberar_memoria_c.argtypes = [ctypes.c_char_p]
+sjoin_lib.liberar_memoria_c.argtypes = [ctypes.c_void_p]
 sjoin_lib.liberar_memoria_c.restype = None
 
 # --- 3. Función principal de Python que envuelve la lógica de ctypes ---
@@ -58,7 +75,7 @@ def realizar_sjoin_paralelo_cpp(coords_sismos, wkts_departamentos, nombres_depar
 
     # --- c. Procesar el resultado y liberar la memoria ---
     # Decodificar el puntero a char de C a un string de Python
-    resultado_string = resultado_c_ptr.decode('utf-8')
+    resultado_string = ctypes.string_at(resultado_c_ptr).decode('utf-8')
 
     # ¡MUY IMPORTANTE! Liberar la memoria que C++ asignó
     sjoin_lib.liberar_memoria_c(resultado_c_ptr)
@@ -66,4 +83,37 @@ def realizar_sjoin_paralelo_cpp(coords_sismos, wkts_departamentos, nombres_depar
     # Dividir el string para obtener la lista final de resultados
     resultados_finales = resultado_string.split('|||')
 
-    return resultados_finales
\ No newline at end of file
+    return resultados_finales
+
+
+def realizar_sjoin_wkb_cpp(latitudes, longitudes, wkbs_departamentos):
+    """
+    Como realizar_sjoin_paralelo_cpp, pero sin texto: recibe las coordenadas como
+    arreglos, los polígonos en WKB (p. ej. shapely.to_wkb(gdf.geometry.values)) y
+    devuelve un arreglo int32 con el índice del departamento de cada sismo (-1 fuera).
+    Las coordenadas y los bytes WKB se pasan a C++ sin copiarlos.
+    """
+    latitudes = np.ascontiguousarray(latitudes, dtype=np.float64)
+    longitudes = np.ascontiguousarray(longitudes, dtype=np.float64)
+    if latitudes.shape != longitudes.shape or latitudes.ndim != 1:
+        raise ValueError("latitudes y longitudes deben ser arreglos 1D del mismo tamaño")
+    codigos = np.empty(len(latitudes), dtype=np.int32)
+
+    # c_char_p apunta directamente al buffer de cada objeto bytes (que la lista mantiene vivo)
+    wkbs = list(wkbs_departamentos)
+    num_departamentos = len(wkbs)
+    wkbs_array = (ctypes.c_char_p * num_departamentos)(*wkbs)
+    tamanos_array = (ctypes.c_size_t * num_departamentos)(*[len(w) for w in wkbs])
+
+    estado = sjoin_lib.procesar_sismos_wkb_c(
+        latitudes.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        longitudes.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),
+        len(latitudes),
+        wkbs_array,
+        tamanos_array,
+        num_departamentos,
+        codigos.ctypes.data_as(ctypes.POINTER(ctypes.c_int32))
+    )
+    if estado != 0:
+        raise RuntimeError("El motor C++ no pudo realizar el spatial join")
+    return codigos
@@ -1,63 +1,954 @@
 // Usa la API de C de GEOS para máxima estabilidad y seguridad
 #include "procesador_sjoin.h"
+#include "lector_csv.h"
 #include <geos_c.h>
 #include <vector>
 #include <string>
 #include <utility>
 #include <omp.h>
+#include <stdexcept>
+#include <algorithm>
+#include <mutex>
+#include <cmath>
+#include <fstream>
+#include <cstdio>
+#include <filesystem>
+#include <future>
+#include <memory>
+#include <limits>
 #include <sstream> // Necesario para unir los resultados en un solo string
 #include <cstring> // Necesario para strcpy
+#include <cctype>
 
 // Declaración de los manejadores de errores para GEOS.
 // Usamos lambdas vacías más adelante, pero esto es por si se necesita una depuración más avanzada.
 void geos_notice_handler(const char* message, void* userdata) { }
 void geos_error_handler(const char* message, void* userdata) { }
 
+// Crea un contexto GEOS con los manejadores de mensajes de este módulo.
+static GEOSContextHandle_t crear_contexto_geos() {
+    GEOSContextHandle_t contexto = GEOS_init_r();
+    GEOSContext_setNoticeMessageHandler_r(contexto, geos_notice_handler, nullptr);
+    GEOSContext_setErrorMessageHandler_r(contexto, geos_error_handler, nullptr);
+    return contexto;
+}
+
+Planificacion planificacion_desde_texto(const std::string &texto) {
+    if (texto == "static") return Planificacion::ESTATICA;
+    if (texto == "dynamic") return Planificacion::DINAMICA;
+    if (texto == "guided") return Planificacion::GUIADA;
+    throw std::invalid_argument("planificacion debe ser 'static', 'dynamic' o 'guided', no '" + texto + "'");
+}
+
+// Hash FNV-1a de 64 bits, acumulable sobre varios bloques de bytes.
+static constexpr uint64_t FNV1A_BASE = 1469598103934665603ULL;
+
+static uint64_t fnv1a(const void *datos, size_t longitud, uint64_t hash = FNV1A_BASE) {
+    const unsigned char *bytes = static_cast<const unsigned char *>(datos);
+    for (size_t i = 0; i < longitud; ++i) {
+        hash ^= bytes[i];
+        hash *= 1099511628211ULL;
+    }
+    return hash;
+}
+
+int configurar_openmp(const OpcionesParalelismo &opciones) {
+    omp_sched_t tipo = omp_sched_dynamic;
+    if (opciones.planificacion == Planificacion::ESTATICA) tipo = omp_sched_static;
+    if (opciones.planificacion == Planificacion::GUIADA) tipo = omp_sched_guided;
+    omp_set_schedule(tipo, std::max(opciones.tamano_bloque, 0));
+    return opciones.num_hilos > 0 ? opciones.num_hilos : omp_get_max_threads();
+}
+
+template <typename Lector>
+void MotorSjoin::inicializar(size_t num_poligonos, Lector &&leer) {
+    geometrias_.assign(num_poligonos, nullptr);
+    preparados_.assign(num_poligonos, nullptr);
+    std::vector<Envolvente> envolventes(num_poligonos, Envolvente{0.0, 0.0, 0.0, 0.0});
+    std::vector<bool> validos(num_poligonos, false);
+    tiempos_ = TiemposConstruccion();
+
+    for (size_t j = 0; j < num_poligonos; ++j) {
+        const double inicio_lectura = omp_get_wtime();
+        GEOSGeometry* geom = leer(j);
+        const double inicio_preparacion = omp_get_wtime();
+        tiempos_.lectura += inicio_preparacion - inicio_lectura;
+        if (!geom) continue;
+        geometrias_[j] = geom;
+        preparados_[j] = GEOSPrepare_r(contexto_, geom);
+        Envolvente &e = envolventes[j];
+        validos[j] = preparados_[j] != nullptr
+            && GEOSGeom_getXMin_r(contexto_, geom, &e.min_x)
+            && GEOSGeom_getYMin_r(contexto_, geom, &e.min_y)
+            && GEOSGeom_getXMax_r(contexto_, geom, &e.max_x)
+            && GEOSGeom_getYMax_r(contexto_, geom, &e.max_y);
+
+        // GEOS construye el localizador de puntos de una geometría preparada de forma
+        // perezosa en la primera consulta. Lo forzamos aquí, en un solo hilo, para
+        // que después los hilos de OpenMP solo lean estructuras ya construidas.
+        if (validos[j]) {
+            GEOSGeometry* centro = GEOSGeom_createPointFromXY_r(
+                contexto_, (e.min_x + e.max_x) / 2.0, (e.min_y + e.max_y) / 2.0);
+            if (centro) {
+                GEOSPreparedContains_r(contexto_, preparados_[j], centro);
+                GEOSGeom_destroy_r(contexto_, centro);
+            }
+        }
+        tiempos_.preparacion += omp_get_wtime() - inicio_preparacion;
+    }
+
+    // Índice de envolventes: cada punto solo se prueba contra los departamentos cuya
+    // envolvente lo contiene, y los puntos fuera de la envolvente de Perú se
+    // descartan sin llamar a GEOS (la mayoría de los sismos en el mar).
+    const double inicio_indice = omp_get_wtime();
+    indice_.construir(envolventes, validos);
+    tiempos_.indice = omp_get_wtime() - inicio_indice;
+}
+
+MotorSjoin::MotorSjoin(
+    const std::vector<std::string> &wkts_departamentos,
+    const std::vector<std::string> &nombres_departamentos
+) : nombres_(nombres_departamentos) {
+    if (!nombres_.empty() && nombres_.size() != wkts_departamentos.size()) {
+        throw std::invalid_argument("wkts_departamentos y nombres_departamentos deben tener la misma longitud");
+    }
+
+    contexto_ = crear_contexto_geos();
+    GEOSWKTReader* reader = GEOSWKTReader_create_r(contexto_);
+    huella_ = FNV1A_BASE;
+    inicializar(wkts_departamentos.size(), [&](size_t j) {
+        // El separador evita que ["ab", "c"] y ["a", "bc"] den la misma huella.
+        const char separador = '\0';
+        huella_ = fnv1a(wkts_departamentos[j].data(), wkts_departamentos[j].size(), huella_);
+        huella_ = fnv1a(&separador, 1, huella_);
+        return GEOSWKTReader_read_r(contexto_, reader, wkts_departamentos[j].c_str());
+    });
+    GEOSWKTReader_destroy_r(contexto_, reader);
+}
+
+MotorSjoin::MotorSjoin(
+    const std::vector<VistaWkb> &wkbs_departamentos,
+    const std::vector<std::string> &nombres_departamentos
+) : nombres_(nombres_departamentos) {
+    if (!nombres_.empty() && nombres_.size() != wkbs_departamentos.size()) {
+        throw std::invalid_argument("wkbs_departamentos y nombres_departamentos deben tener la misma longitud");
+    }
+
+    contexto_ = crear_contexto_geos();
+    GEOSWKBReader* reader = GEOSWKBReader_create_r(contexto_);
+    huella_ = FNV1A_BASE;
+    inicializar(wkbs_departamentos.size(), [&](size_t j) {
+        const VistaWkb &wkb = wkbs_departamentos[j];
+        // Con la longitud delante, dos listas distintas nunca dan la misma secuencia.
+        const uint64_t tamano = wkb.tamano;
+        huella_ = fnv1a(&tamano, sizeof(tamano), huella_);
+        huella_ = fnv1a(wkb.datos, wkb.tamano, huella_);
+        return wkb.datos ? GEOSWKBReader_read_r(contexto_, reader, wkb.datos, wkb.tamano) : nullptr;
+    });
+    GEOSWKBReader_destroy_r(contexto_, reader);
+}
+
+MotorSjoin::~MotorSjoin() {
+    cerrar();
+}
+
+void MotorSjoin::cerrar() {
+    std::unique_lock<std::shared_mutex> exclusivo(candado_);
+    if (!contexto_) return;
+    for (auto prep : preparados_) {
+        if (prep) GEOSPreparedGeom_destroy_r(contexto_, prep);
+    }
+    for (auto geom : geometrias_) {
+        if (geom) GEOSGeom_destroy_r(contexto_, geom);
+    }
+    preparados_.clear();
+    geometrias_.clear();
+    indice_ = IndiceEnvolventes();
+    rejilla_ = RejillaRaster();
+    GEOS_finish_r(contexto_);
+    contexto_ = nullptr;
+}
+
 /**
- * Esta es la función principal que hace el trabajo pesado. La marcamos como 'static'
- * para que solo sea visible dentro de este archivo. No será exportada directamente.
- * La función que exportaremos será la envoltura (wrapper) 'extern "C"'.
+ * Esta es la función que hace el trabajo pesado. Trabaja directamente sobre los
+ * buffers del llamador: no copia las coordenadas ni genera cadenas, solo escribe
+ * un entero por sismo con el índice del departamento que lo contiene.
+ */
+void MotorSjoin::unir(
+    const double *latitudes,
+    const double *longitudes,
+    size_t num_puntos,
+    int32_t *codigos_salida,
+    const OpcionesParalelismo &opciones,
+    EstadisticasUnion *estadisticas
+) const {
+    unir_interno(latitudes, longitudes, num_puntos, codigos_salida, nullptr, 0.0, opciones, estadisticas);
+}
+
+void MotorSjoin::unir_cercano(
+    const double *latitudes,
+    const double *longitudes,
+    size_t num_puntos,
+    int32_t *codigos_salida,
+    double *distancias_km,
+    double distancia_maxima_km,
+    const OpcionesParalelismo &opciones,
+    EstadisticasUnion *estadisticas
+) const {
+    if (!(distancia_maxima_km >= 0.0)) throw std::invalid_argument("distancia_maxima_km no puede ser negativa");
+    unir_interno(latitudes, longitudes, num_puntos, codigos_salida, distancias_km, distancia_maxima_km, opciones,
+                 estadisticas);
+}
+
+static constexpr double RADIO_TIERRA_KM = 6371.0;
+static constexpr double KM_POR_GRADO = 111.195;
+static constexpr double RADIANES = 3.14159265358979323846 / 180.0;
+
+static double haversine_km(double lat1, double lon1, double lat2, double lon2) {
+    const double dlat = (lat2 - lat1) * RADIANES;
+    const double dlon = (lon2 - lon1) * RADIANES;
+    const double a = std::sin(dlat / 2) * std::sin(dlat / 2)
+        + std::cos(lat1 * RADIANES) * std::cos(lat2 * RADIANES) * std::sin(dlon / 2) * std::sin(dlon / 2);
+    return 2.0 * RADIO_TIERRA_KM * std::asin(std::min(1.0, std::sqrt(a)));
+}
+
+void MotorSjoin::preparar_distancias() const {
+    // Igual que el localizador de puntos, GEOS construye de forma perezosa el índice
+    // de segmentos que usan las consultas de distancia: se fuerza aquí, una sola vez
+    // y en un solo hilo, antes de que lo lean los hilos de OpenMP.
+    std::call_once(distancias_preparadas_, [this]() {
+        GEOSGeometry* origen = GEOSGeom_createPointFromXY_r(contexto_, 0.0, 0.0);
+        if (!origen) return;
+        for (auto prep : preparados_) {
+            double distancia;
+            if (prep) GEOSPreparedDistance_r(contexto_, prep, origen, &distancia);
+        }
+        GEOSGeom_destroy_r(contexto_, origen);
+    });
+}
+
+void MotorSjoin::unir_interno(
+    const double *latitudes,
+    const double *longitudes,
+    size_t num_puntos,
+    int32_t *codigos_salida,
+    double *distancias_km,
+    double distancia_maxima_km,
+    const OpcionesParalelismo &opciones,
+    EstadisticasUnion *estadisticas
+) const {
+    const double inicio = omp_get_wtime();
+    std::shared_lock<std::shared_mutex> compartido(candado_);
+    if (cerrado()) throw std::runtime_error("El motor de spatial join ya fue cerrado");
+
+    const bool buscar_cercano = distancias_km != nullptr;
+    if (buscar_cercano) preparar_distancias();
+    const double sin_distancia = std::numeric_limits<double>::quiet_NaN();
+
+    const int num_hilos = configurar_openmp(opciones);
+
+    // Los contadores se llevan siempre (son sumas locales de cada hilo, sin coste
+    // apreciable) y se combinan al final solo si el llamador los pidió.
+    EstadisticasUnion totales;
+    totales.puntos = num_puntos;
+    totales.puntos_por_hilo.assign(std::max(num_hilos, 1), 0);
+    totales.segundos_por_hilo.assign(std::max(num_hilos, 1), 0.0);
+    int tamano_equipo = 1;
+
+    #pragma omp parallel num_threads(num_hilos)
+    {
+        // Un contexto GEOS por hilo: los contextos no son seguros entre hilos.
+        GEOSContextHandle_t contexto_hilo = crear_contexto_geos();
+        std::vector<int32_t> candidatos;
+        size_t puntos_hilo = 0, por_rejilla = 0, probados = 0, contencion = 0, distancia = 0, cercanos = 0, fuera = 0;
+        const double inicio_hilo = omp_get_wtime();
+
+        // Sin barrera al final del bucle, para medir solo el trabajo de cada hilo.
+        #pragma omp for schedule(runtime) nowait
+        for (size_t i = 0; i < num_puntos; ++i) {
+            const double x = longitudes[i], y = latitudes[i];
+            ++puntos_hilo;
+
+            // Con rejilla, la mayoría de los puntos se resuelven con una consulta O(1);
+            // solo los de celdas de frontera pasan a la prueba exacta con GEOS.
+            int32_t codigo = rejilla_.vacia() ? CELDA_FRONTERA : rejilla_.consultar(x, y);
+            GEOSGeometry* punto = nullptr;
+            if (codigo == CELDA_FRONTERA) {
+                ++probados;
+                codigo = indice_.buscar(x, y, [&](int32_t j) {
+                    if (!punto) punto = GEOSGeom_createPointFromXY_r(contexto_hilo, x, y);
+                    ++contencion;
+                    return punto && GEOSPreparedContains_r(contexto_hilo, preparados_[j], punto) == 1;
+                });
+            } else {
+                ++por_rejilla;
+            }
+            codigos_salida[i] = codigo;
+
+            if (buscar_cercano) {
+                distancias_km[i] = codigo != CODIGO_FUERA_DE_PERU ? 0.0 : sin_distancia;
+                if (codigo == CODIGO_FUERA_DE_PERU && !std::isnan(x) && !std::isnan(y)) {
+                    // Búsqueda acotada: solo los polígonos cuya envolvente toca la caja de
+                    // 'distancia_maxima_km' alrededor del punto, y de ellos se descartan
+                    // sin llamar a GEOS los que ni en su envolvente mejoran al mejor actual.
+                    const double dlat = distancia_maxima_km / KM_POR_GRADO;
+                    const double coseno = std::cos(std::min(90.0, std::fabs(y) + dlat) * RADIANES);
+                    const double dlon = coseno > 1e-6 ? distancia_maxima_km / (KM_POR_GRADO * coseno) : 360.0;
+                    indice_.buscar_en_rectangulo(Envolvente{x - dlon, y - dlat, x + dlon, y + dlat}, candidatos);
+
+                    double mejor = distancia_maxima_km;
+                    for (int32_t j : candidatos) {
+                        const Envolvente &e = indice_.envolvente(j);
+                        const double cota = haversine_km(
+                            y, x, std::clamp(y, e.min_y, e.max_y), std::clamp(x, e.min_x, e.max_x));
+                        if (cota > mejor) continue;
+                        if (!punto) punto = GEOSGeom_createPointFromXY_r(contexto_hilo, x, y);
+                        if (!punto) break;
+                        ++distancia;
+                        GEOSCoordSequence* mas_cercanos = GEOSPreparedNearestPoints_r(contexto_hilo, preparados_[j], punto);
+                        if (!mas_cercanos) continue;
+                        double cx, cy;
+                        if (GEOSCoordSeq_getXY_r(contexto_hilo, mas_cercanos, 0, &cx, &cy)) {
+                            const double km = haversine_km(y, x, cy, cx);
+                            // Un polígono justo a distancia_maxima_km también vale. Los
+                            // candidatos van en orden ascendente, así que a igual
+                            // distancia gana el de índice menor.
+                            if (km < mejor || (km == mejor && codigos_salida[i] == CODIGO_FUERA_DE_PERU)) {
+                                mejor = km;
+                                codigos_salida[i] = j;
+                                distancias_km[i] = km;
+                            }
+                        }
+                        GEOSCoordSeq_destroy_r(contexto_hilo, mas_cercanos);
+                    }
+                    if (codigos_salida[i] != CODIGO_FUERA_DE_PERU) ++cercanos;
+                }
+            }
+            if (codigos_salida[i] == CODIGO_FUERA_DE_PERU) ++fuera;
+            if (punto) GEOSGeom_destroy_r(contexto_hilo, punto);
+        }
+
+        const int hilo = omp_get_thread_num();
+        if (hilo == 0) tamano_equipo = omp_get_num_threads();
+        if (hilo < static_cast<int>(totales.puntos_por_hilo.size())) {
+            totales.puntos_por_hilo[hilo] = puntos_hilo;
+            totales.segundos_por_hilo[hilo] = omp_get_wtime() - inicio_hilo;
+        }
+        #pragma omp critical(estadisticas_union)
+        {
+            totales.resueltos_por_rejilla += por_rejilla;
+            totales.puntos_probados += probados;
+            totales.pruebas_contencion += contencion;
+            totales.pruebas_distancia += distancia;
+            totales.asignados_por_cercania += cercanos;
+            totales.fuera_de_peru += fuera;
+        }
+
+        GEOS_finish_r(contexto_hilo);
+    }
+
+    if (estadisticas) {
+        // OpenMP puede crear menos hilos de los pedidos
+        totales.puntos_por_hilo.resize(std::min<size_t>(tamano_equipo, totales.puntos_por_hilo.size()));
+        totales.segundos_por_hilo.resize(totales.puntos_por_hilo.size());
+        totales.segundos = omp_get_wtime() - inicio;
+        *estadisticas = std::move(totales);
+    }
+}
+
+// Límite de celdas de la rejilla raster (1 GiB de int32) para evitar reservas absurdas
+// cuando se pide una resolución demasiado fina.
+static constexpr size_t MAX_CELDAS_REJILLA = size_t(1) << 28;
+
+void MotorSjoin::construir_rejilla(double resolucion, const OpcionesParalelismo &opciones) {
+    if (!(resolucion > 0.0)) throw std::invalid_argument("La resolución de la rejilla debe ser positiva");
+    const double inicio = omp_get_wtime();
+
+    std::unique_lock<std::shared_mutex> exclusivo(candado_);
+    if (cerrado()) throw std::runtime_error("El motor de spatial join ya fue cerrado");
+    if (indice_.vacio()) {
+        rejilla_ = RejillaRaster();
+        return;
+    }
+
+    RejillaRaster nueva;
+    nueva.limites = indice_.envolvente_union();
+    nueva.resolucion = resolucion;
+    nueva.celdas_x = std::max(1, static_cast<int>(std::ceil((nueva.limites.max_x - nueva.limites.min_x) / resolucion)));
+    nueva.celdas_y = std::max(1, static_cast<int>(std::ceil((nueva.limites.max_y - nueva.limites.min_y) / resolucion)));
+    const size_t num_celdas = static_cast<size_t>(nueva.celdas_x) * nueva.celdas_y;
+    if (num_celdas > MAX_CELDAS_REJILLA) {
+        throw std::invalid_argument("La resolución pedida genera demasiadas celdas para la rejilla");
+    }
+    nueva.celdas.assign(num_celdas, CODIGO_FUERA_DE_PERU);
+
+    // Pequeño margen para que los errores de redondeo al ubicar un punto en su celda
+    // nunca lo dejen fuera del rectángulo con el que se clasificó la celda.
+    const double margen = resolucion * 1e-6;
+    const int num_hilos = configurar_openmp(opciones);
+
+    #pragma omp parallel num_threads(num_hilos)
+    {
+        GEOSContextHandle_t contexto_hilo = crear_contexto_geos();
+        // Cada hilo prepara sus propias copias: las pruebas polígono-rectángulo
+        // construyen estructuras perezosas que no deben compartirse entre hilos.
+        std::vector<const GEOSPreparedGeometry*> preparados_hilo(geometrias_.size(), nullptr);
+        std::vector<int32_t> candidatos;
+
+        #pragma omp for schedule(runtime)
+        for (int cy = 0; cy < nueva.celdas_y; ++cy) {
+            for (int cx = 0; cx < nueva.celdas_x; ++cx) {
+                const Envolvente celda{
+                    nueva.limites.min_x + cx * resolucion - margen,
+                    nueva.limites.min_y + cy * resolucion - margen,
+                    nueva.limites.min_x + (cx + 1) * resolucion + margen,
+                    nueva.limites.min_y + (cy + 1) * resolucion + margen
+                };
+                indice_.buscar_en_rectangulo(celda, candidatos);
+
+                // El primer polígono (en orden) que toca la celda decide: si la contiene
+                // por completo en su interior, todos sus puntos le pertenecen; si solo la
+                // toca, la celda es de frontera. Si ninguno la toca, queda fuera.
+                int32_t valor = CODIGO_FUERA_DE_PERU;
+                GEOSGeometry* rectangulo = nullptr;
+                for (int32_t j : candidatos) {
+                    if (!preparados_hilo[j]) preparados_hilo[j] = GEOSPrepare_r(contexto_hilo, geometrias_[j]);
+                    if (!rectangulo) {
+                        rectangulo = GEOSGeom_createRectangle_r(contexto_hilo, celda.min_x, celda.min_y, celda.max_x, celda.max_y);
+                    }
+                    if (!preparados_hilo[j] || !rectangulo) {
+                        valor = CELDA_FRONTERA;
+                        break;
+                    }
+                    if (GEOSPreparedIntersects_r(contexto_hilo, preparados_hilo[j], rectangulo) == 1) {
+                        valor = GEOSPreparedContainsProperly_r(contexto_hilo, preparados_hilo[j], rectangulo) == 1
+                            ? j : CELDA_FRONTERA;
+                        break;
+                    }
+                }
+                if (rectangulo) GEOSGeom_destroy_r(contexto_hilo, rectangulo);
+                nueva.celdas[static_cast<size_t>(cy) * nueva.celdas_x + cx] = valor;
+            }
+        }
+
+        for (auto prep : preparados_hilo) {
+            if (prep) GEOSPreparedGeom_destroy_r(contexto_hilo, prep);
+        }
+        GEOS_finish_r(contexto_hilo);
+    }
+
+    rejilla_ = std::move(nueva);
+    tiempos_.rejilla = omp_get_wtime() - inicio;
+}
+
+// Cabecera del archivo de rejilla. Se escribe en el orden de bytes de la máquina
+// (little-endian en x86/ARM), igual que los .npy que usa la app.
+struct CabeceraRejilla {
+    char magia[8];
+    uint32_t version;
+    int32_t celdas_x;
+    int32_t celdas_y;
+    int32_t reservado;
+    uint64_t huella;
+    double resolucion;
+    double min_x, min_y, max_x, max_y;
+};
+static_assert(sizeof(CabeceraRejilla) == 72, "La cabecera de la rejilla debe tener un tamaño fijo");
+
+static const char MAGIA_REJILLA[8] = {'S', 'J', 'R', 'E', 'J', 'I', 'L', 'L'};
+static constexpr uint32_t VERSION_REJILLA = 1;
+
+// Escribe la cabecera y las celdas de la rejilla (formato de guardar_rejilla()).
+static void escribir_rejilla(std::ostream &archivo, const RejillaRaster &rejilla, uint64_t huella) {
+    CabeceraRejilla cabecera{};
+    std::memcpy(cabecera.magia, MAGIA_REJILLA, sizeof(MAGIA_REJILLA));
+    cabecera.version = VERSION_REJILLA;
+    cabecera.celdas_x = rejilla.celdas_x;
+    cabecera.celdas_y = rejilla.celdas_y;
+    cabecera.huella = huella;
+    cabecera.resolucion = rejilla.resolucion;
+    cabecera.min_x = rejilla.limites.min_x;
+    cabecera.min_y = rejilla.limites.min_y;
+    cabecera.max_x = rejilla.limites.max_x;
+    cabecera.max_y = rejilla.limites.max_y;
+    archivo.write(reinterpret_cast<const char *>(&cabecera), sizeof(cabecera));
+    archivo.write(reinterpret_cast<const char *>(rejilla.celdas.data()),
+                  static_cast<std::streamsize>(rejilla.celdas.size() * sizeof(int32_t)));
+}
+
+// Lee una rejilla escrita con escribir_rejilla(). Devuelve false si está dañada o
+// si se construyó con otros polígonos (otra huella).
+static bool leer_rejilla(std::istream &archivo, uint64_t huella, RejillaRaster &rejilla) {
+    CabeceraRejilla cabecera{};
+    archivo.read(reinterpret_cast<char *>(&cabecera), sizeof(cabecera));
+    if (!archivo
+        || std::memcmp(cabecera.magia, MAGIA_REJILLA, sizeof(MAGIA_REJILLA)) != 0
+        || cabecera.version != VERSION_REJILLA
+        || cabecera.huella != huella
+        || !(cabecera.resolucion > 0.0)
+        || cabecera.celdas_x <= 0 || cabecera.celdas_y <= 0) {
+        return false;
+    }
+    const size_t num_celdas = static_cast<size_t>(cabecera.celdas_x) * cabecera.celdas_y;
+    if (num_celdas > MAX_CELDAS_REJILLA) return false;
+
+    rejilla.limites = Envolvente{cabecera.min_x, cabecera.min_y, cabecera.max_x, cabecera.max_y};
+    rejilla.resolucion = cabecera.resolucion;
+    rejilla.celdas_x = cabecera.celdas_x;
+    rejilla.celdas_y = cabecera.celdas_y;
+    rejilla.celdas.resize(num_celdas);
+    archivo.read(reinterpret_cast<char *>(rejilla.celdas.data()),
+                 static_cast<std::streamsize>(num_celdas * sizeof(int32_t)));
+    return static_cast<bool>(archivo);
+}
+
+// Escribe con 'escribir' en un temporal y lo renombra a 'ruta', para que otro proceso
+// del servidor nunca lea un archivo a medio escribir.
+template <typename Escritor>
+static void escribir_atomicamente(const std::string &ruta, Escritor &&escribir) {
+    const std::string temporal = ruta + ".tmp";
+    {
+        std::ofstream archivo(temporal, std::ios::binary | std::ios::trunc);
+        escribir(archivo);
+        if (!archivo) throw std::runtime_error("No se pudo escribir " + temporal);
+    }
+    if (std::rename(temporal.c_str(), ruta.c_str()) != 0) {
+        throw std::runtime_error("No se pudo mover " + temporal + " a " + ruta);
+    }
+}
+
+void MotorSjoin::guardar_rejilla(const std::string &ruta) const {
+    std::shared_lock<std::shared_mutex> compartido(candado_);
+    if (rejilla_.vacia()) throw std::runtime_error("El motor no tiene una rejilla construida");
+    escribir_atomicamente(ruta, [&](std::ofstream &archivo) { escribir_rejilla(archivo, rejilla_, huella_); });
+}
+
+bool MotorSjoin::cargar_rejilla(const std::string &ruta) {
+    const double inicio = omp_get_wtime();
+    std::ifstream archivo(ruta, std::ios::binary);
+    if (!archivo) return false;
+
+    RejillaRaster cargada;
+    if (!leer_rejilla(archivo, huella_, cargada)) return false;
+
+    std::unique_lock<std::shared_mutex> exclusivo(candado_);
+    if (cerrado()) throw std::runtime_error("El motor de spatial join ya fue cerrado");
+    rejilla_ = std::move(cargada);
+    tiempos_.rejilla = omp_get_wtime() - inicio;
+    return true;
+}
+
+// Cabecera del archivo de geometrías de guardar(). Le siguen, por polígono, su nombre
+// (si hay nombres) y su WKB, cada uno precedido de su longitud en un uint64 (WKB de
+// longitud 0 = geometría que no se pudo leer), y al final la rejilla si la hay.
+struct CabeceraGeometrias {
+    char magia[8];
+    uint32_t version;
+    uint32_t tiene_rejilla;
+    uint64_t huella;
+    uint64_t num_poligonos;
+    uint64_t num_nombres;
+};
+static_assert(sizeof(CabeceraGeometrias) == 40, "La cabecera de geometrías debe tener un tamaño fijo");
+
+static const char MAGIA_GEOMETRIAS[8] = {'S', 'J', 'G', 'E', 'O', 'M', 'E', 'T'};
+static constexpr uint32_t VERSION_GEOMETRIAS = 1;
+
+static void escribir_bloque(std::ostream &archivo, const void *datos, uint64_t tamano) {
+    archivo.write(reinterpret_cast<const char *>(&tamano), sizeof(tamano));
+    archivo.write(static_cast<const char *>(datos), static_cast<std::streamsize>(tamano));
+}
+
+// Lee un bloque escrito con escribir_bloque(); rechaza longitudes mayores que lo que
+// queda del archivo en lugar de intentar reservarlas.
+static bool leer_bloque(std::istream &archivo, uint64_t restante, std::string &bloque) {
+    uint64_t tamano = 0;
+    archivo.read(reinterpret_cast<char *>(&tamano), sizeof(tamano));
+    if (!archivo || tamano > restante) return false;
+    bloque.resize(tamano);
+    archivo.read(bloque.data(), static_cast<std::streamsize>(tamano));
+    return static_cast<bool>(archivo);
+}
+
+void MotorSjoin::guardar(const std::string &ruta) const {
+    std::shared_lock<std::shared_mutex> compartido(candado_);
+    if (cerrado()) throw std::runtime_error("El motor de spatial join ya fue cerrado");
+
+    CabeceraGeometrias cabecera{};
+    std::memcpy(cabecera.magia, MAGIA_GEOMETRIAS, sizeof(MAGIA_GEOMETRIAS));
+    cabecera.version = VERSION_GEOMETRIAS;
+    cabecera.tiene_rejilla = rejilla_.vacia() ? 0 : 1;
+    cabecera.huella = huella_;
+    cabecera.num_poligonos = geometrias_.size();
+    cabecera.num_nombres = nombres_.size();
+
+    // La escritura WKB usa el contexto del motor: bajo el candado compartido otros hilos
+    // pueden estar uniendo, pero esos usan sus propios contextos.
+    GEOSWKBWriter *writer = GEOSWKBWriter_create_r(contexto_);
+    try {
+        escribir_atomicamente(ruta, [&](std::ofstream &archivo) {
+            archivo.write(reinterpret_cast<const char *>(&cabecera), sizeof(cabecera));
+            for (size_t j = 0; j < geometrias_.size(); ++j) {
+                if (!nombres_.empty()) escribir_bloque(archivo, nombres_[j].data(), nombres_[j].size());
+                size_t tamano = 0;
+                unsigned char *wkb = geometrias_[j] ? GEOSWKBWriter_write_r(contexto_, writer, geometrias_[j], &tamano) : nullptr;
+                escribir_bloque(archivo, wkb, wkb ? tamano : 0);
+                if (wkb) GEOSFree_r(contexto_, wkb);
+            }
+            if (!rejilla_.vacia()) escribir_rejilla(archivo, rejilla_, huella_);
+        });
+    } catch (...) {
+        GEOSWKBWriter_destroy_r(contexto_, writer);
+        throw;
+    }
+    GEOSWKBWriter_destroy_r(contexto_, writer);
+}
+
+std::unique_ptr<MotorSjoin> MotorSjoin::cargar(const std::string &ruta) {
+    std::ifstream archivo(ruta, std::ios::binary | std::ios::ate);
+    if (!archivo) return nullptr;
+    const uint64_t tamano_archivo = static_cast<uint64_t>(archivo.tellg());
+    archivo.seekg(0);
+
+    CabeceraGeometrias cabecera{};
+    archivo.read(reinterpret_cast<char *>(&cabecera), sizeof(cabecera));
+    if (!archivo
+        || std::memcmp(cabecera.magia, MAGIA_GEOMETRIAS, sizeof(MAGIA_GEOMETRIAS)) != 0
+        || cabecera.version != VERSION_GEOMETRIAS
+        || cabecera.num_poligonos > tamano_archivo / sizeof(uint64_t)
+        || (cabecera.num_nombres != 0 && cabecera.num_nombres != cabecera.num_poligonos)) {
+        return nullptr;
+    }
+
+    std::vector<std::string> nombres(cabecera.num_nombres);
+    std::vector<std::string> wkbs(cabecera.num_poligonos);
+    for (size_t j = 0; j < wkbs.size(); ++j) {
+        if (!nombres.empty() && !leer_bloque(archivo, tamano_archivo, nombres[j])) return nullptr;
+        if (!leer_bloque(archivo, tamano_archivo, wkbs[j])) return nullptr;
+    }
+    std::vector<VistaWkb> vistas(wkbs.size());
+    for (size_t j = 0; j < wkbs.size(); ++j) {
+        const unsigned char *datos = reinterpret_cast<const unsigned char *>(wkbs[j].data());
+        vistas[j] = VistaWkb{wkbs[j].empty() ? nullptr : datos, wkbs[j].size()};
+    }
+
+    auto motor = std::make_unique<MotorSjoin>(vistas, nombres);
+    motor->huella_ = cabecera.huella;
+    const double inicio_rejilla = omp_get_wtime();
+    if (cabecera.tiene_rejilla && !leer_rejilla(archivo, cabecera.huella, motor->rejilla_)) return nullptr;
+    motor->tiempos_.rejilla = omp_get_wtime() - inicio_rejilla;
+    return motor;
+}
+
+
+// Nombre del archivo de salida con los códigos de departamento en procesar_csv.
+static const char *COLUMNA_CODIGOS = "DEPARTAMENTO";
+
+// Los nombres de columna del CSV pasan a ser nombres de archivo: solo se aceptan
+// identificadores simples (letras, dígitos, '_' y '-'; los bytes no ASCII de UTF-8,
+// como la Ñ, también), nunca '/', '\\', '.' ni nada que salga del directorio.
+static bool es_nombre_columna_valido(const std::string &nombre) {
+    if (nombre.empty() || nombre.size() > 128) return false;
+    for (unsigned char c : nombre) {
+        if (!(std::isalnum(c) || c == '_' || c == '-' || c >= 0x80)) return false;
+    }
+    return true;
+}
+
+// Comprueba los nombres de columna antes de crear ningún archivo. Las columnas sin
+// nombre se omiten; un nombre no válido o repetido (sin distinguir mayúsculas, por los
+// sistemas de archivos que no las distinguen) lanza std::invalid_argument.
+static void validar_nombres_columnas(const std::vector<std::string> &nombres) {
+    std::vector<std::string> vistos;
+    for (const std::string &nombre : nombres) {
+        if (nombre.empty()) continue;
+        if (!es_nombre_columna_valido(nombre)) {
+            throw std::invalid_argument("Nombre de columna no válido en el CSV: '" + nombre + "'");
+        }
+        std::string clave = nombre;
+        std::transform(clave.begin(), clave.end(), clave.begin(),
+                       [](unsigned char c) { return static_cast<char>(std::toupper(c)); });
+        if (std::find(vistos.begin(), vistos.end(), clave) != vistos.end()) {
+            throw std::invalid_argument("Columna repetida en el CSV: '" + nombre + "'");
+        }
+        vistos.push_back(std::move(clave));
+    }
+}
+
+ResumenCsv MotorSjoin::procesar_csv(
+    const std::string &ruta_csv,
+    const std::string &directorio_salida,
+    size_t filas_por_bloque,
+    const OpcionesParalelismo &opciones
+) const {
+    if (filas_por_bloque == 0) throw std::invalid_argument("filas_por_bloque debe ser mayor que cero");
+    if (cerrado()) throw std::runtime_error("El motor de spatial join ya fue cerrado");
+
+    LectorCsvBloques lector(ruta_csv);
+    const int col_lat = lector.indice_columna("LATITUD");
+    const int col_lon = lector.indice_columna("LONGITUD");
+    if (col_lat < 0 || col_lon < 0) {
+        throw std::invalid_argument("El CSV debe tener las columnas LATITUD y LONGITUD");
+    }
+
+    const std::vector<std::string> &nombres = lector.nombres_columnas();
+    validar_nombres_columnas(nombres);
+
+    ResumenCsv resumen;
+    std::filesystem::create_directories(directorio_salida);
+    std::vector<std::unique_ptr<EscritorNpy>> escritores(nombres.size());
+    for (size_t k = 0; k < nombres.size(); ++k) {
+        if (nombres[k].empty() || nombres[k] == COLUMNA_CODIGOS) continue;
+        const std::string ruta = (std::filesystem::path(directorio_salida) / (nombres[k] + ".npy")).string();
+        escritores[k] = std::make_unique<EscritorNpy>(ruta, "<f8", sizeof(double));
+        resumen.columnas.push_back(nombres[k]);
+    }
+    EscritorNpy escritor_codigos(
+        (std::filesystem::path(directorio_salida) / (std::string(COLUMNA_CODIGOS) + ".npy")).string(), "<i4", sizeof(int32_t));
+    resumen.columnas.push_back(COLUMNA_CODIGOS);
+
+    struct BloqueUnido {
+        BloqueCsv datos;
+        std::vector<int32_t> codigos;
+    };
+    auto leer = [&lector, filas_por_bloque]() {
+        auto bloque = std::make_unique<BloqueUnido>();
+        if (!lector.leer_bloque(filas_por_bloque, bloque->datos)) bloque.reset();
+        return bloque;
+    };
+    auto escribir = [&escritores, &escritor_codigos](std::unique_ptr<BloqueUnido> bloque) {
+        for (size_t k = 0; k < escritores.size(); ++k) {
+            if (escritores[k]) escritores[k]->escribir(bloque->datos.columnas[k].data(), bloque->datos.filas);
+        }
+        escritor_codigos.escribir(bloque->codigos.data(), bloque->codigos.size());
+    };
+
+    // Tubería de tres etapas: mientras este hilo une el bloque k, un hilo lee el k+1
+    // y otro escribe el k-1.
+    std::unique_ptr<BloqueUnido> actual = leer();
+    std::future<void> escritura;
+    while (actual) {
+        std::future<std::unique_ptr<BloqueUnido>> siguiente = std::async(std::launch::async, leer);
+
+        const size_t filas = actual->datos.filas;
+        actual->codigos.resize(filas);
+        unir(actual->datos.columnas[col_lat].data(), actual->datos.columnas[col_lon].data(),
+             filas, actual->codigos.data(), opciones);
+        resumen.filas += filas;
+        resumen.bloques += 1;
+        resumen.fuera_de_peru += static_cast<size_t>(
+            std::count(actual->codigos.begin(), actual->codigos.end(), CODIGO_FUERA_DE_PERU));
+
+        if (escritura.valid()) escritura.get();
+        escritura = std::async(std::launch::async, escribir, std::move(actual));
+        actual = siguiente.get();
+    }
+    if (escritura.valid()) escritura.get();
+
+    for (auto &escritor : escritores) {
+        if (escritor) escritor->cerrar();
+    }
+    escritor_codigos.cerrar();
+    return resumen;
+}
+
+// Localiza un punto en una capa: rejilla, después los 'candidatos' (si los hay) y,
+// si ninguno lo contiene, el índice completo. 'punto' se crea solo si hace falta GEOS
+// y queda a cargo del llamador.
+static int32_t localizar_en_capa(
+    const RejillaRaster &rejilla,
+    const IndiceEnvolventes &indice,
+    const std::vector<const GEOSPreparedGeometry *> &preparados,
+    double x, double y,
+    GEOSContextHandle_t contexto,
+    GEOSGeometry *&punto,
+    const int32_t *candidatos, size_t num_candidatos
+) {
+    const int32_t codigo_rejilla = rejilla.vacia() ? CELDA_FRONTERA : rejilla.consultar(x, y);
+    if (codigo_rejilla != CELDA_FRONTERA) return codigo_rejilla;
+
+    auto contiene = [&](int32_t j) {
+        if (!punto) punto = GEOSGeom_createPointFromXY_r(contexto, x, y);
+        return punto && GEOSPreparedContains_r(contexto, preparados[j], punto) == 1;
+    };
+    for (size_t k = 0; k < num_candidatos; ++k) {
+        const int32_t j = candidatos[k];
+        if (preparados[j] && indice.envolvente(j).contiene(x, y) && contiene(j)) return j;
+    }
+    return indice.buscar(x, y, contiene);
+}
+
+MotorSjoinJerarquico::MotorSjoinJerarquico(
+    const std::vector<std::vector<std::string>> &wkts_por_capa,
+    const std::vector<std::vector<std::string>> &nombres_por_capa
+) {
+    if (wkts_por_capa.empty()) throw std::invalid_argument("Se necesita al menos una capa");
+    if (!nombres_por_capa.empty() && nombres_por_capa.size() != wkts_por_capa.size()) {
+        throw std::invalid_argument("wkts_por_capa y nombres_por_capa deben tener el mismo número de capas");
+    }
+    for (size_t k = 0; k < wkts_por_capa.size(); ++k) {
+        static const std::vector<std::string> sin_nombres;
+        capas_.push_back(std::make_unique<MotorSjoin>(
+            wkts_por_capa[k], nombres_por_capa.empty() ? sin_nombres : nombres_por_capa[k]));
+    }
+    enlazar_capas();
+}
+
+MotorSjoinJerarquico::MotorSjoinJerarquico(
+    const std::vector<std::vector<VistaWkb>> &wkbs_por_capa,
+    const std::vector<std::vector<std::string>> &nombres_por_capa
+) {
+    if (wkbs_por_capa.empty()) throw std::invalid_argument("Se necesita al menos una capa");
+    if (!nombres_por_capa.empty() && nombres_por_capa.size() != wkbs_por_capa.size()) {
+        throw std::invalid_argument("wkbs_por_capa y nombres_por_capa deben tener el mismo número de capas");
+    }
+    for (size_t k = 0; k < wkbs_por_capa.size(); ++k) {
+        static const std::vector<std::string> sin_nombres;
+        capas_.push_back(std::make_unique<MotorSjoin>(
+            wkbs_por_capa[k], nombres_por_capa.empty() ? sin_nombres : nombres_por_capa[k]));
+    }
+    enlazar_capas();
+}
+
+void MotorSjoinJerarquico::enlazar_capas() {
+    padres_.resize(capas_.size());
+    inicio_hijos_.resize(capas_.size());
+    hijos_.resize(capas_.size());
+    for (size_t k = 1; k < capas_.size(); ++k) {
+        const MotorSjoin &padre = *capas_[k - 1];
+        const MotorSjoin &hija = *capas_[k];
+        std::vector<int32_t> &padres = padres_[k];
+        padres.assign(hija.num_poligonos(), CODIGO_FUERA_DE_PERU);
+
+        // Un punto interior de cada polígono hijo decide su padre (en un solo hilo,
+        // con el contexto GEOS de la capa padre).
+        for (size_t j = 0; j < hija.num_poligonos(); ++j) {
+            if (!hija.geometrias_[j]) continue;
+            GEOSGeometry *interior = GEOSPointOnSurface_r(padre.contexto_, hija.geometrias_[j]);
+            double x, y;
+            if (interior && GEOSGeomGetX_r(padre.contexto_, interior, &x) && GEOSGeomGetY_r(padre.contexto_, interior, &y)) {
+                GEOSGeometry *punto = nullptr;
+                padres[j] = localizar_en_capa(padre.rejilla_, padre.indice_, padre.preparados_, x, y,
+                                              padre.contexto_, punto, nullptr, 0);
+                if (punto) GEOSGeom_destroy_r(padre.contexto_, punto);
+            }
+            if (interior) GEOSGeom_destroy_r(padre.contexto_, interior);
+        }
+
+        // CSR padre -> hijos
+        std::vector<uint32_t> &inicio = inicio_hijos_[k];
+        inicio.assign(padre.num_poligonos() + 1, 0);
+        for (int32_t p : padres) {
+            if (p >= 0) ++inicio[p + 1];
+        }
+        for (size_t p = 0; p < padre.num_poligonos(); ++p) inicio[p + 1] += inicio[p];
+        std::vector<uint32_t> posicion(inicio.begin(), inicio.end() - 1);
+        hijos_[k].resize(inicio.back());
+        for (size_t j = 0; j < padres.size(); ++j) {
+            if (padres[j] >= 0) hijos_[k][posicion[padres[j]]++] = static_cast<int32_t>(j);
+        }
+    }
+}
+
+void MotorSjoinJerarquico::unir(
+    const double *latitudes,
+    const double *longitudes,
+    size_t num_puntos,
+    const std::vector<int32_t *> &codigos_por_capa,
+    const OpcionesParalelismo &opciones
+) const {
+    if (codigos_por_capa.size() != capas_.size()) {
+        throw std::invalid_argument("Se necesita un arreglo de salida por capa");
+    }
+    std::vector<std::shared_lock<std::shared_mutex>> compartidos;
+    for (const auto &capa : capas_) {
+        compartidos.emplace_back(capa->candado_);
+        if (capa->cerrado()) throw std::runtime_error("El motor de spatial join ya fue cerrado");
+    }
+
+    const int num_hilos = configurar_openmp(opciones);
+
+    #pragma omp parallel num_threads(num_hilos)
+    {
+        GEOSContextHandle_t contexto_hilo = crear_contexto_geos();
+
+        #pragma omp for schedule(runtime)
+        for (size_t i = 0; i < num_puntos; ++i) {
+            const double x = longitudes[i], y = latitudes[i];
+            GEOSGeometry *punto = nullptr;
+            int32_t codigo_padre = CODIGO_FUERA_DE_PERU;
+            for (size_t k = 0; k < capas_.size(); ++k) {
+                const MotorSjoin &capa = *capas_[k];
+                const int32_t *candidatos = nullptr;
+                size_t num_candidatos = 0;
+                if (k > 0 && codigo_padre >= 0) {
+                    candidatos = hijos_[k].data() + inicio_hijos_[k][codigo_padre];
+                    num_candidatos = inicio_hijos_[k][codigo_padre + 1] - inicio_hijos_[k][codigo_padre];
+                }
+                codigo_padre = localizar_en_capa(capa.rejilla_, capa.indice_, capa.preparados_, x, y,
+                                                 contexto_hilo, punto, candidatos, num_candidatos);
+                codigos_por_capa[k][i] = codigo_padre;
+            }
+            if (punto) GEOSGeom_destroy_r(contexto_hilo, punto);
+        }
+
+        GEOS_finish_r(contexto_hilo);
+    }
+}
+
+void MotorSjoinJerarquico::construir_rejilla(double resolucion, const OpcionesParalelismo &opciones) {
+    for (auto &capa : capas_) capa->construir_rejilla(resolucion, opciones);
+}
+
+void MotorSjoinJerarquico::cerrar() {
+    for (auto &capa : capas_) capa->cerrar();
+}
+
+bool MotorSjoinJerarquico::cerrado() const {
+    return capas_.front()->cerrado();
+}
+
+/**
+ * Join de un solo uso: prepara los polígonos, procesa los puntos y libera todo
+ * (incluido el contexto GEOS) al salir. Para joins repetidos conviene MotorSjoin.
+ */
+void realizar_sjoin_paralelo_indices(
+    const double *latitudes,
+    const double *longitudes,
+    size_t num_puntos,
+    const std::vector<std::string> &wkts_departamentos,
+    int32_t *codigos_salida,
+    const OpcionesParalelismo &opciones
+) {
+    MotorSjoin motor(wkts_departamentos, {});
+    motor.unir(latitudes, longitudes, num_puntos, codigos_salida, opciones);
+}
+
+/**
+ * Versión original basada en cadenas. Se mantiene por compatibilidad con
+ * main.cpp y el puente ctypes: traduce los índices a nombres de departamento.
  */
 std::vector<std::string> realizar_sjoin_paralelo(
     const std::vector<std::pair<double, double>> &coords_sismos,
     const std::vector<std::string> &wkts_departamentos,
     const std::vector<std::string> &nombres_departamentos
 ) {
-    GEOSContextHandle_t geos_context_global = GEOS_init_r();
-    GEOSContext_setNoticeMessageHandler_r(geos_context_global, geos_notice_handler, nullptr);
-    GEOSContext_setErrorMessageHandler_r(geos_context_global, geos_error_handler, nullptr);
-    
-    GEOSWKTReader* reader = GEOSWKTReader_create_r(geos_context_global);
-    std::vector<GEOSGeometry*> departamentos_geoms;
-    std::vector<const GEOSPreparedGeometry*> departamentos_preparados;
-
-    for (const auto& wkt : wkts_departamentos) {
-        GEOSGeometry* geom = GEOSWKTReader_read_r(geos_context_global, reader, wkt.c_str());
-        if (geom) {
-            departamentos_geoms.push_back(geom);
-            departamentos_preparados.push_back(GEOSPrepare_r(geos_context_global, geom));
-        }
-    }
-    
-    GEOSWKTReader_destroy_r(geos_context_global, reader);
-    std::vector<std::string> resultados(coords_sismos.size(), "Fuera de Perú");
-
-    #pragma omp parallel for
-    for (size_t i = 0; i < coords_sismos.size(); ++i) {
-        GEOSGeometry* punto = GEOSGeom_createPointFromXY_r(geos_context_global, coords_sismos[i].second, coords_sismos[i].first);
-        if (!punto) continue;
-        for (size_t j = 0; j < departamentos_preparados.size(); ++j) {
-            if (departamentos_preparados[j] && GEOSPreparedContains_r(geos_context_global, departamentos_preparados[j], punto)) {
-                resultados[i] = nombres_departamentos[j];
-                break;
-            }
-        }
-        GEOSGeom_destroy_r(geos_context_global, punto);
+    const size_t num_puntos = coords_sismos.size();
+    std::vector<double> latitudes(num_puntos), longitudes(num_puntos);
+    for (size_t i = 0; i < num_puntos; ++i) {
+        latitudes[i] = coords_sismos[i].first;
+        longitudes[i] = coords_sismos[i].second;
     }
 
-    for (auto geom : departamentos_preparados) GEOSPreparedGeom_destroy_r(geos_context_global, geom);
-    for (auto geom : departamentos_geoms) GEOSGeom_destroy_r(geos_context_global, geom);
-    //GEOS_finish_r(geos_context_global);
+    std::vector<int32_t> codigos(num_puntos);
+    realizar_sjoin_paralelo_indices(
+        latitudes.data(), longitudes.data(), num_puntos, wkts_departamentos, codigos.data()
+    );
+
+    std::vector<std::string> resultados(num_puntos, "Fuera de Perú");
+    for (size_t i = 0; i < num_puntos; ++i) {
+        if (codigos[i] != CODIGO_FUERA_DE_PERU) resultados[i] = nombres_departamentos[codigos[i]];
+    }
     return resultados;
 }
 
@@ -128,4 +1019,32 @@ extern "C" {
         delete[] ptr;
     }
 
+    /**
+     * @brief Variante sin cadenas para ctypes: recibe las coordenadas como dos arreglos
+     * float64, los polígonos en WKB (punteros y longitudes) y escribe en 'codigos_salida'
+     * el índice del departamento de cada sismo (-1 fuera). Todos los buffers son del
+     * llamador, así que no hay memoria que liberar después.
+     * @return 0 si todo fue bien, -1 si hubo un error.
+     */
+    int procesar_sismos_wkb_c(
+        const double* latitudes,
+        const double* longitudes,
+        int num_sismos,
+        const unsigned char** wkbs,
+        const size_t* tamanos_wkb,
+        int num_departamentos,
+        int32_t* codigos_salida
+    ) {
+        try {
+            std::vector<VistaWkb> vistas(num_departamentos);
+            for (int j = 0; j < num_departamentos; ++j) vistas[j] = VistaWkb{wkbs[j], tamanos_wkb[j]};
+            MotorSjoin motor(vistas, {});
+            motor.unir(latitudes, longitudes, static_cast<size_t>(num_sismos), codigos_salida);
+            return 0;
+        } catch (...) {
+            // Las excepciones no pueden cruzar la frontera de C.
+            return -1;
+        }
+    }
+
 } // Fin del bloque extern "C"
\ No newline at end of file
@@ -4,6 +4,44 @@
 #include <vector>
 #include <string>
 #include <utility>
+#include <cstddef>
+#include <cstdint>
+#include <shared_mutex>
+#include <mutex>
+#include <algorithm>
+#include <memory>
+#include <geos_c.h>
+
+#include "indice_envolventes.h"
+
+// Versión del motor. Se incrementa cuando cambia el resultado del join, porque forma
+// parte de la clave de la caché del catálogo enriquecido que guarda la app.
+constexpr const char *VERSION_MOTOR_SJOIN = "1.2.0";
+
+// Código que reciben los sismos que no caen dentro de ningún polígono.
+constexpr int32_t CODIGO_FUERA_DE_PERU = -1;
+// Valor de una celda de la rejilla raster que cruza algún borde: sus puntos se
+// resuelven con la prueba exacta de GEOS.
+constexpr int32_t CELDA_FRONTERA = -2;
+
+// Política de reparto de iteraciones del bucle OpenMP. Los puntos cerca de costas o
+// fronteras complejas cuestan mucho más que el resto, así que la planificación
+// estática puede dejar núcleos ociosos; por eso la dinámica es la predeterminada.
+enum class Planificacion { ESTATICA, DINAMICA, GUIADA };
+
+struct OpcionesParalelismo {
+    int num_hilos = 0;       // 0 = lo que decida OpenMP (OMP_NUM_THREADS o núcleos)
+    Planificacion planificacion = Planificacion::DINAMICA;
+    int tamano_bloque = 0;   // 0 = tamaño de bloque predeterminado de OpenMP
+};
+
+// Convierte "static" / "dynamic" / "guided" (los nombres de OpenMP) en Planificacion.
+// Lanza std::invalid_argument con cualquier otro texto.
+Planificacion planificacion_desde_texto(const std::string &texto);
+
+// Fija la planificación que usarán los bucles 'schedule(runtime)' lanzados desde
+// el hilo actual y devuelve el número de hilos a usar.
+int configurar_openmp(const OpcionesParalelismo &opciones);
 
 std::vector<std::string> realizar_sjoin_paralelo(
     const std::vector<std::pair<double, double>> &coords_sismos,
@@ -11,4 +49,289 @@ std::vector<std::string> realizar_sjoin_paralelo(
     const std::vector<std::string> &nombres_departamentos
 );
 
+// Variante sin cadenas: escribe en 'codigos_salida' el índice del polígono que
+// contiene cada punto (o CODIGO_FUERA_DE_PERU). Los arreglos de entrada y salida
+// tienen 'num_puntos' elementos y pertenecen al llamador (no se copian).
+void realizar_sjoin_paralelo_indices(
+    const double *latitudes,
+    const double *longitudes,
+    size_t num_puntos,
+    const std::vector<std::string> &wkts_departamentos,
+    int32_t *codigos_salida,
+    const OpcionesParalelismo &opciones = OpcionesParalelismo()
+);
+
+/**
+ * Rejilla raster precalculada sobre la envolvente de la unión de los polígonos.
+ * Cada celda guarda el índice del polígono que la contiene por completo,
+ * CODIGO_FUERA_DE_PERU si no toca ningún polígono o CELDA_FRONTERA si cruza un borde.
+ */
+struct RejillaRaster {
+    Envolvente limites{0.0, 0.0, 0.0, 0.0};
+    double resolucion = 0.0;  // lado de la celda en grados
+    int celdas_x = 0, celdas_y = 0;
+    std::vector<int32_t> celdas;
+
+    bool vacia() const { return celdas.empty(); }
+
+    // Respuesta O(1) para un punto; los que caen fuera de los límites (o NaN) están fuera.
+    int32_t consultar(double x, double y) const {
+        if (!limites.contiene(x, y)) return CODIGO_FUERA_DE_PERU;
+        const int cx = std::min(static_cast<int>((x - limites.min_x) / resolucion), celdas_x - 1);
+        const int cy = std::min(static_cast<int>((y - limites.min_y) / resolucion), celdas_y - 1);
+        return celdas[static_cast<size_t>(cy) * celdas_x + cx];
+    }
+};
+
+// Resultado de MotorSjoin::procesar_csv.
+struct ResumenCsv {
+    size_t filas = 0;
+    size_t bloques = 0;
+    size_t fuera_de_peru = 0;
+    std::vector<std::string> columnas;  // archivos .npy escritos (sin extensión)
+};
+
+// Contadores y tiempos de una llamada a MotorSjoin::unir() o unir_cercano().
+struct EstadisticasUnion {
+    size_t puntos = 0;
+    size_t resueltos_por_rejilla = 0;   // respondidos por la rejilla, sin llamar a GEOS
+    size_t puntos_probados = 0;         // pasaron a la prueba exacta (índice + GEOS)
+    size_t pruebas_contencion = 0;      // llamadas a GEOSPreparedContains_r
+    size_t pruebas_distancia = 0;       // llamadas a GEOSPreparedNearestPoints_r
+    size_t asignados_por_cercania = 0;
+    size_t fuera_de_peru = 0;           // código final CODIGO_FUERA_DE_PERU
+    double segundos = 0.0;              // tiempo de pared de toda la llamada
+    // Reparto del trabajo: puntos y segundos del bucle de cada hilo de OpenMP
+    std::vector<size_t> puntos_por_hilo;
+    std::vector<double> segundos_por_hilo;
+};
+
+// Tiempos (en segundos) de las fases de construcción del motor.
+struct TiemposConstruccion {
+    double lectura = 0.0;      // parseo de WKT/WKB
+    double preparacion = 0.0;  // GEOSPrepare_r y localizadores de puntos
+    double indice = 0.0;       // índice de envolventes
+    double rejilla = 0.0;      // construir_rejilla() o lectura de la rejilla guardada
+};
+
+// Vista de una geometría en WKB (sin copia: los bytes pertenecen al llamador).
+struct VistaWkb {
+    const unsigned char *datos;
+    size_t tamano;
+};
+
+/**
+ * Motor de spatial join persistente.
+ *
+ * Lee y prepara los polígonos una sola vez (contexto GEOS, geometrías preparadas e
+ * índice de envolventes) y los reutiliza en cada llamada a unir(). Así los joins
+ * repetidos o incrementales no vuelven a parsear WKT ni a ejecutar GEOSPrepare_r.
+ * Todos los recursos se liberan en cerrar() o, como muy tarde, en el destructor.
+ */
+class MotorSjoin {
+public:
+    MotorSjoin(
+        const std::vector<std::string> &wkts_departamentos,
+        const std::vector<std::string> &nombres_departamentos
+    );
+    // Igual, pero a partir de WKB (p. ej. shapely.to_wkb): evita formatear y volver a
+    // parsear texto, que es lo más lento y no conserva todos los decimales. La huella
+    // se calcula sobre los bytes WKB.
+    MotorSjoin(
+        const std::vector<VistaWkb> &wkbs_departamentos,
+        const std::vector<std::string> &nombres_departamentos
+    );
+    ~MotorSjoin();
+
+    // El motor es dueño de punteros de GEOS: no se puede copiar.
+    MotorSjoin(const MotorSjoin &) = delete;
+    MotorSjoin &operator=(const MotorSjoin &) = delete;
+
+    // Escribe en 'codigos_salida' el índice del polígono que contiene cada punto
+    // (o CODIGO_FUERA_DE_PERU). Lanza std::runtime_error si el motor está cerrado.
+    // Es seguro llamarlo desde varios hilos a la vez: cada hilo de OpenMP usa su
+    // propio contexto GEOS y las geometrías preparadas solo se leen. Si se pasa
+    // 'estadisticas', recibe los contadores y tiempos de la llamada.
+    void unir(
+        const double *latitudes,
+        const double *longitudes,
+        size_t num_puntos,
+        int32_t *codigos_salida,
+        const OpcionesParalelismo &opciones = OpcionesParalelismo(),
+        EstadisticasUnion *estadisticas = nullptr
+    ) const;
+
+    // Como unir(), pero los puntos que no caen en ningún polígono se asignan al polígono
+    // más cercano si está a 'distancia_maxima_km' o menos (por ejemplo, los sismos de la
+    // zona de subducción frente a la costa). En 'distancias_km' queda 0 para los puntos
+    // contenidos, la distancia en km (haversine hasta el punto más cercano del polígono)
+    // para los asignados por cercanía y NaN para los que siguen fuera. Se hace en la
+    // misma pasada paralela que la prueba de contención.
+    void unir_cercano(
+        const double *latitudes,
+        const double *longitudes,
+        size_t num_puntos,
+        int32_t *codigos_salida,
+        double *distancias_km,
+        double distancia_maxima_km,
+        const OpcionesParalelismo &opciones = OpcionesParalelismo(),
+        EstadisticasUnion *estadisticas = nullptr
+    ) const;
+
+    // Rasteriza los polígonos en una rejilla con celdas de 'resolucion' grados. A partir
+    // de entonces unir() responde con una consulta O(1) los puntos de celdas que están
+    // completamente dentro de un polígono o fuera de todos, y solo usa GEOS en las
+    // celdas de frontera. El resultado es idéntico al de la prueba exacta.
+    void construir_rejilla(double resolucion, const OpcionesParalelismo &opciones = OpcionesParalelismo());
+
+    // Guarda la rejilla en un archivo binario. Lanza std::runtime_error si no hay
+    // rejilla o no se puede escribir.
+    void guardar_rejilla(const std::string &ruta) const;
+
+    // Carga una rejilla guardada. Devuelve false (sin modificar el motor) si el archivo
+    // no existe, está dañado o se construyó con otros polígonos.
+    bool cargar_rejilla(const std::string &ruta);
+
+    // Guarda en un solo archivo binario el conjunto de geometrías (WKB), los nombres,
+    // la huella y la rejilla si la hay. Lanza std::runtime_error si no se puede escribir.
+    void guardar(const std::string &ruta) const;
+
+    // Crea un motor a partir de un archivo de guardar(): solo hay que leer WKB, preparar
+    // e indexar, sin pasar por el geojson. Devuelve nullptr si el archivo no existe o
+    // está dañado. El motor conserva la huella original, así que las cachés que
+    // dependen de ella siguen siendo válidas.
+    static std::unique_ptr<MotorSjoin> cargar(const std::string &ruta);
+
+    bool tiene_rejilla() const { return !rejilla_.vacia(); }
+    const RejillaRaster &rejilla() const { return rejilla_; }
+
+    // Procesa un CSV arbitrariamente grande por bloques de 'filas_por_bloque' filas:
+    // lee LATITUD/LONGITUD y el resto de columnas numéricas, une cada bloque en
+    // paralelo y escribe en 'directorio_salida' un <COLUMNA>.npy (float64) por cada
+    // columna del CSV más DEPARTAMENTO.npy (int32). La lectura del bloque siguiente
+    // y la escritura del anterior se solapan con el join del bloque actual, así que
+    // la memoria usada es de unos tres bloques sea cual sea el tamaño del archivo.
+    // Lanza std::invalid_argument si algún nombre de columna no es un identificador
+    // simple (p. ej. contiene '/' o '..') o está repetido.
+    ResumenCsv procesar_csv(
+        const std::string &ruta_csv,
+        const std::string &directorio_salida,
+        size_t filas_por_bloque,
+        const OpcionesParalelismo &opciones = OpcionesParalelismo()
+    ) const;
+
+    // Huella (FNV-1a de 64 bits) de los polígonos de entrada: identifica la versión
+    // del geojson para nombrar y validar los archivos de caché.
+    uint64_t huella() const { return huella_; }
+
+    // Cuánto tardó cada fase de la construcción (y de la rejilla, si la hay).
+    const TiemposConstruccion &tiempos_construccion() const { return tiempos_; }
+
+    // Libera las geometrías y el contexto GEOS. Es idempotente y espera a que
+    // terminen las llamadas a unir() en curso.
+    void cerrar();
+
+    bool cerrado() const { return contexto_ == nullptr; }
+    size_t num_poligonos() const { return preparados_.size(); }
+    const std::vector<std::string> &nombres() const { return nombres_; }
+
+private:
+    // El motor jerárquico consulta directamente la rejilla, el índice y las geometrías
+    // preparadas de cada capa para restringir los candidatos.
+    friend class MotorSjoinJerarquico;
+
+    // Implementación común de unir() y unir_cercano() (distancias_km nulo = sin cercanía).
+    void unir_interno(
+        const double *latitudes,
+        const double *longitudes,
+        size_t num_puntos,
+        int32_t *codigos_salida,
+        double *distancias_km,
+        double distancia_maxima_km,
+        const OpcionesParalelismo &opciones,
+        EstadisticasUnion *estadisticas
+    ) const;
+    void preparar_distancias() const;
+    // Prepara e indexa las geometrías; 'leer(j)' devuelve la geometría j (o nullptr).
+    template <typename Lector>
+    void inicializar(size_t num_poligonos, Lector &&leer);
+
+    GEOSContextHandle_t contexto_ = nullptr;
+    // Una entrada por polígono de entrada (nullptr si su WKT no se pudo leer), de
+    // modo que el índice j siempre coincide con la posición en la lista original.
+    std::vector<GEOSGeometry *> geometrias_;
+    std::vector<const GEOSPreparedGeometry *> preparados_;
+    std::vector<std::string> nombres_;
+    IndiceEnvolventes indice_;
+    RejillaRaster rejilla_;
+    uint64_t huella_ = 0;
+    TiemposConstruccion tiempos_;
+    // unir() toma el candado compartido y cerrar() el exclusivo.
+    mutable std::shared_mutex candado_;
+    mutable std::once_flag distancias_preparadas_;
+};
+
+/**
+ * Spatial join sobre varias capas administrativas anidadas (p. ej. departamentos ->
+ * provincias -> distritos) resuelto en una sola pasada paralela.
+ *
+ * Cada capa es un MotorSjoin. Al construir el motor se calcula el padre de cada
+ * polígono (la capa anterior que contiene un punto interior suyo, GEOSPointOnSurface),
+ * y al unir, el polígono encontrado en la capa padre limita los candidatos de la capa
+ * hija a sus hijos. Si ninguno de ellos contiene el punto (bordes que no coinciden
+ * exactamente entre capas) se recurre al índice completo de la capa, así que el
+ * resultado es el mismo que unir cada capa por separado. El punto GEOS se crea una
+ * sola vez y se reutiliza en todas las capas.
+ */
+class MotorSjoinJerarquico {
+public:
+    // Una lista de WKT (y de nombres, que pueden ir vacías) por capa, de la más general
+    // a la más detallada.
+    MotorSjoinJerarquico(
+        const std::vector<std::vector<std::string>> &wkts_por_capa,
+        const std::vector<std::vector<std::string>> &nombres_por_capa
+    );
+    // Igual, pero con las geometrías de cada capa en WKB (como MotorSjoin): las capas
+    // detalladas (provincias, distritos) son las que más tardan en parsearse como WKT.
+    MotorSjoinJerarquico(
+        const std::vector<std::vector<VistaWkb>> &wkbs_por_capa,
+        const std::vector<std::vector<std::string>> &nombres_por_capa
+    );
+
+    MotorSjoinJerarquico(const MotorSjoinJerarquico &) = delete;
+    MotorSjoinJerarquico &operator=(const MotorSjoinJerarquico &) = delete;
+
+    // 'codigos_por_capa[k]' recibe los códigos de la capa k (num_puntos elementos cada uno).
+    void unir(
+        const double *latitudes,
+        const double *longitudes,
+        size_t num_puntos,
+        const std::vector<int32_t *> &codigos_por_capa,
+        const OpcionesParalelismo &opciones = OpcionesParalelismo()
+    ) const;
+
+    // Construye la rejilla raster de todas las capas.
+    void construir_rejilla(double resolucion, const OpcionesParalelismo &opciones = OpcionesParalelismo());
+
+    size_t num_capas() const { return capas_.size(); }
+    const MotorSjoin &capa(size_t k) const { return *capas_.at(k); }
+
+    // Padre (índice en la capa k - 1) de cada polígono de la capa k; -1 si no tiene.
+    const std::vector<int32_t> &padres(size_t k) const { return padres_.at(k); }
+
+    void cerrar();
+    bool cerrado() const;
+
+private:
+    // Calcula el padre de cada polígono y los hijos de cada padre (tras crear las capas).
+    void enlazar_capas();
+
+    std::vector<std::unique_ptr<MotorSjoin>> capas_;
+    // Por capa k >= 1: padre de cada polígono e hijos de cada polígono de la capa k - 1
+    // en formato CSR (en orden ascendente, como el recorrido del índice).
+    std::vector<std::vector<int32_t>> padres_;
+    std::vector<std::vector<uint32_t>> inicio_hijos_;
+    std::vector<std::vector<int32_t>> hijos_;
+};
+
 #endif
\ No newline at end of file